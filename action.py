@@ -0,0 +1,8 @@
+from collections import namedtuple
+
+# A complete turn : the peon moved from origin to destination,
+# where to place the peon it displaced (if any) and the adjacent peon selected by a reporter (if any)
+# An action without origin passes the turn, when the team can't move any peon
+Action = namedtuple('Action', ('origin', 'destination', 'placement', 'target'), defaults=(None, None))
+
+PASS = Action(None, None)
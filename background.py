@@ -0,0 +1,207 @@
+"""
+Computer players thinking in their own process, so the Tk mainloop never waits for a search.
+
+The window sends the positions to search, and polls the answers from an after() callback : the worker process
+never touches Tk, and a running search is cancelled through shared memory, without waiting for it.
+
+While the other teams play, a searching bot ponders : it searches the position expected on its next turn,
+following the replies found by its last search. If the other teams do play those replies, the running search
+becomes the real one (its transposition table already holds the work done so far), otherwise it's cancelled.
+
+eg:
+bot = BackgroundBot('paranoid', time_limit=1.0)
+bot.think(state)
+action = bot.poll()  # None until the answer is there
+state.play(action)
+bot.ponder(state)
+bot.close()
+"""
+import multiprocessing
+import queue
+import time
+
+from record import decode_action, decode_position, encode_action, encode_position
+
+# Request sent to the worker process to stop
+QUIT = None
+
+
+def _bot_process(player_type, seed, colors, book, requests, results, cancelled, deadline):
+    """
+    Worker process loop : search the requested positions one after another
+    :param player_type: one of simulate.PLAYER_TYPES
+    :param seed:
+    :param colors: names of the teams of the game
+    :param book: optional opening book file path, looked up before searching
+    :param requests: queue of tuple(request id, position bytes, time limit) or QUIT
+    :param results: queue the tuple(request id, action bytes, list of predicted action bytes) are put in
+    :param cancelled: shared id of the last cancelled request, every request up to it is cancelled
+    :param deadline: shared time.time() when the running search must answer, infinite while pondering
+    """
+    from players import SearchPlayer
+    from simulate import player_factory
+    from team import Team
+
+    teams = [Team(color) for color in colors]
+    player = searcher = None
+    while True:
+        request = requests.get()
+        if request is QUIT:
+            return
+        request_id, position, time_limit = request
+        if cancelled.value >= request_id:
+            continue
+        if player is None:
+            # The transposition tables of a searching player are kept from one search to the next
+            player = player_factory(player_type, seed, time_limit, book)
+            # A book player only answers the positions of its book, the player it wraps searches the others
+            searcher = player.player if book else player
+        state = decode_position(position, teams)
+        team = state.current_team
+        predicted = []
+        if isinstance(searcher, SearchPlayer):
+            # The shared deadline can be moved by the window during the search, see BackgroundBot.think
+            searcher.time_limit = float('inf')
+            searcher.should_stop = lambda: cancelled.value >= request_id or time.time() >= deadline.value
+            book_hits = player.hits if book else 0
+            action = player.choose_action(state)
+            # A book turn leaves no search to predict the replies from
+            if cancelled.value < request_id and (not book or player.hits == book_hits):
+                state.make_move(action)
+                predicted = [encode_action(reply) for reply in searcher.predicted_continuation(state, team)]
+        else:
+            # Other players can't be interrupted, their answer is dropped if it was cancelled meanwhile
+            searcher.time_limit = time_limit
+            action = player.choose_action(state)
+        results.put((request_id, encode_action(action), predicted))
+
+
+class BackgroundBot:
+    """
+    Computer player of one team, searching in a worker process
+    """
+    def __init__(self, player_type, colors, time_limit=1.0, seed=0, ponder=True, book=None):
+        """
+        Start the worker process
+        :param player_type: one of simulate.PLAYER_TYPES
+        :param colors: names of the teams of the game
+        :param time_limit: seconds per move
+        :param seed:
+        :param ponder: search on the expected position while the other teams play
+        :param book: optional opening book file path, looked up before searching
+        """
+        self.player_type = player_type
+        self.time_limit = time_limit
+        self.ponder_enabled = ponder
+        # The window process already loaded Tk, start the worker from a fresh interpreter
+        context = multiprocessing.get_context('spawn')
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._cancelled = context.Value('q', 0, lock=False)
+        self._deadline = context.Value('d', 0.0, lock=False)
+        self.process = context.Process(
+            target=_bot_process,
+            args=(player_type, seed, colors, book, self._requests, self._results, self._cancelled, self._deadline),
+            daemon=True,
+        )
+        self.process.start()
+        self._last_request_id = 0
+        # Request whose answer is expected by think(), None when not thinking
+        self._thinking_id = None
+        # tuple(request id, position bytes, time.time() when it started) of the running ponder search
+        self._pondering = None
+        # request id -> tuple(Action, list of predicted Action) of the answers not read yet
+        self._answers = {}
+        # Replies of the other teams expected after the last action played
+        self._predicted = []
+        # Statistics of the pondering, shown by the window
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+
+    @property
+    def thinking(self):
+        return self._thinking_id is not None
+
+    def _request(self, state, time_limit):
+        self._last_request_id += 1
+        self._deadline.value = time.time() + time_limit
+        self._requests.put((self._last_request_id, encode_position(state), time_limit))
+        return self._last_request_id
+
+    def think(self, state):
+        """
+        Start searching the turn of the team to move, the answer is read with poll()
+        :param state: GameState, between two turns
+        """
+        position = encode_position(state)
+        if self._pondering is not None and self._pondering[1] == position:
+            # The other teams played as predicted : the ponder search becomes the real one,
+            # the time already spent pondering counts as thinking time
+            request_id, _, started_at = self._pondering
+            self._pondering = None
+            self.ponder_hits += 1
+            self._thinking_id = request_id
+            self._deadline.value = max(started_at + self.time_limit, time.time())
+            return
+        if self._pondering is not None:
+            self.ponder_misses += 1
+        self.cancel()
+        self._thinking_id = self._request(state, self.time_limit)
+
+    def poll(self):
+        """
+        Read the answers of the worker process without waiting
+        :return: Action found by the last think(), None while it's still searching
+        """
+        while True:
+            try:
+                request_id, action, predicted = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if request_id > self._cancelled.value:
+                self._answers[request_id] = (decode_action(action), [decode_action(reply) for reply in predicted])
+        if self._thinking_id is None or self._thinking_id not in self._answers:
+            return None
+        action, self._predicted = self._answers.pop(self._thinking_id)
+        self._thinking_id = None
+        return action
+
+    def ponder(self, state):
+        """
+        Start searching the position expected on the next turn of the bot, while the other teams play
+        :param state: GameState, right after the bot action was played
+        """
+        predicted, self._predicted = self._predicted, []
+        if not self.ponder_enabled or not predicted or self._thinking_id is not None:
+            return
+        # Play the predicted replies on a copy, the game state belongs to the window
+        expected_state = decode_position(encode_position(state), state.teams)
+        for action in predicted:
+            expected_state.play(action)
+        # Searched until a ponder hit sets the deadline, or cancelled
+        request_id = self._request(expected_state, float('inf'))
+        self._pondering = (request_id, encode_position(expected_state), time.time())
+
+    def cancel(self):
+        """
+        Cancel the running and the pending searches, eg: when the game is reset
+        """
+        self._cancelled.value = self._last_request_id
+        self._thinking_id = None
+        self._pondering = None
+        self._answers.clear()
+        self._predicted = []
+
+    def close(self):
+        """
+        Stop the worker process, eg: when the window is closed
+        """
+        self.cancel()
+        if self.process.is_alive():
+            self._requests.put(QUIT)
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                # A player which can't be interrupted is still busy
+                self.process.terminate()
+        self._requests.close()
+        self._results.close()
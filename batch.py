@@ -0,0 +1,194 @@
+"""
+Optional NumPy backend evaluating batches of boards with array operations.
+Each board is stored as a row of cell codes (see const.CELL_*), all boards of a batch share the same size.
+"""
+import functools
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is only needed by this module, the rest of the game runs without it
+    np = None
+
+import const
+from peons import PEONS
+from utils import DIRECTIONS
+
+# Highest team index + 1 that fits in a cell code
+MAX_TEAMS = 256 >> const.CELL_TEAM_SHIFT
+
+
+@functools.lru_cache(maxsize=None)
+def get_ray_table(rows, cols):
+    """
+    Target square of every square for each direction and step, -1 when out of the board
+    Computed once per board size.
+    :param rows:
+    :param cols:
+    :return: np.ndarray of shape [directions, steps, squares]
+    """
+    squares = rows * cols
+    steps = max(rows, cols) - 1
+    row, col = np.divmod(np.arange(squares), cols)
+    table = np.full((len(DIRECTIONS), steps, squares), -1, dtype=np.intp)
+    for direction, (row_step, col_step) in enumerate(DIRECTIONS):
+        for step in range(steps):
+            target_row = row + row_step * (step + 1)
+            target_col = col + col_step * (step + 1)
+            valid = (target_row >= 0) & (target_row < rows) & (target_col >= 0) & (target_col < cols)
+            table[direction, step, valid] = (target_row * cols + target_col)[valid]
+    return table
+
+
+@functools.lru_cache(maxsize=None)
+def get_rules_tables():
+    """
+    Movement rules and values of every peon type, indexed by type code
+    :return: tuple(can_use_enemy, can_use_body, maximum_steps, value, die_if_surrounded_by_bodies)
+    """
+    return (
+        np.array([bool(peon and peon.can_use_enemy) for peon in PEONS]),
+        np.array([bool(peon and peon.can_use_body) for peon in PEONS]),
+        np.array([peon.maximum_steps if peon else 0 for peon in PEONS]),
+        np.array([peon.value if peon else 0 for peon in PEONS]),
+        np.array([bool(peon and peon.die_if_surrounded_by_bodies) for peon in PEONS]),
+    )
+
+
+class BoardBatch:
+    """
+    A batch of boards stored as NumPy planes of shape [batch, rows * cols].
+    Type, team and alive planes are decoded once from the cell codes.
+    """
+    def __init__(self, cells, rows, cols, current_teams=None):
+        """
+        :param cells: array-like of cell codes, of shape [batch, rows * cols] or [batch, rows, cols]
+        :param rows:
+        :param cols:
+        :param current_teams: array-like of the team to move of each board
+        """
+        if np is None:
+            raise ImportError("BoardBatch requires numpy")
+        self.rows = rows
+        self.cols = cols
+        self.cells = np.asarray(cells, dtype=np.uint8).reshape(-1, rows * cols)
+        self.types = self.cells & const.CELL_TYPE_MASK
+        self.teams = self.cells >> const.CELL_TEAM_SHIFT
+        self.alive = (self.types != 0) & (self.cells & const.CELL_DEAD == 0)
+        self.current_teams = None if current_teams is None else np.asarray(current_teams)
+
+    @classmethod
+    def from_states(cls, states):
+        """
+        :param states: list[GameState] of the same size
+        :return: BoardBatch
+        """
+        rows, cols = states[0].rows, states[0].cols
+        cells = np.frombuffer(b''.join(bytes(state.cells) for state in states), dtype=np.uint8)
+        return cls(cells, rows, cols, [state.current_team for state in states])
+
+    def __len__(self):
+        return self.cells.shape[0]
+
+    @property
+    def planes(self):
+        """
+        :return: tuple(types, teams, alive) planes of shape [batch, rows, cols]
+        """
+        shape = (-1, self.rows, self.cols)
+        return self.types.reshape(shape), self.teams.reshape(shape), self.alive.reshape(shape)
+
+    @property
+    def neighbours(self):
+        """
+        :return: np.ndarray of shape [squares, 8], the adjacent squares of each square, -1 when out of the board
+        """
+        return get_ray_table(self.rows, self.cols)[:, 0, :].T
+
+    def move_masks(self):
+        """
+        Vectorized utils.get_available_moves for every alive peon of every board
+        :return: bool np.ndarray of shape [batch, squares, squares], mask[b, origin, destination]
+        """
+        cells, teams, alive = self.cells, self.teams, self.alive
+        batch, squares = cells.shape
+        can_use_enemy, can_use_body, maximum_steps, _, _ = get_rules_tables()
+        source_can_use_enemy = can_use_enemy[self.types]
+        source_can_use_body = can_use_body[self.types]
+        source_steps = maximum_steps[self.types]
+        ray_table = get_ray_table(self.rows, self.cols)
+        # Unlimited moves can go as far as the board allows
+        source_steps = np.where(source_steps == 0, ray_table.shape[1], source_steps)
+
+        empty = cells == const.CELL_EMPTY
+        body = ~empty & (cells & const.CELL_DEAD != 0)
+        masks = np.zeros((batch, squares, squares), dtype=bool)
+        for direction_table in ray_table:
+            # Peons whose ray in this direction isn't blocked yet
+            moving = alive
+            for step, targets in enumerate(direction_table):
+                valid = targets >= 0
+                if not valid.any():
+                    break
+                sources = np.flatnonzero(valid)
+                targets = targets[valid]
+                active = moving[:, sources] & (source_steps[:, sources] > step)
+                is_enemy = alive[:, targets] & (teams[:, targets] != teams[:, sources])
+                masks[:, sources, targets] = active & (
+                    empty[:, targets]
+                    | (body[:, targets] & source_can_use_body[:, sources])
+                    | (is_enemy & source_can_use_enemy[:, sources])
+                )
+                # Only an empty cell lets the peon go further
+                moving = np.zeros_like(alive)
+                moving[:, sources] = active & empty[:, targets]
+        return masks
+
+    def legal_move_masks(self):
+        """
+        Move masks restricted to the peons of the team to move of each board
+        :return: bool np.ndarray of shape [batch, squares, squares]
+        """
+        own = self.alive & (self.teams == self.current_teams[:, None])
+        return self.move_masks() & own[:, :, None]
+
+    def adjacent_alive_enemies(self):
+        """
+        Vectorized utils.get_adjacent_alive_enemies for every alive peon of every board
+        :return: bool np.ndarray of shape [batch, squares, 8], aligned with self.neighbours
+        """
+        neighbours = self.neighbours
+        valid = neighbours >= 0
+        safe = np.where(valid, neighbours, 0)
+        is_enemy = self.alive[:, safe] & (self.teams[:, safe] != self.teams[:, :, None])
+        return is_enemy & valid & self.alive[:, :, None]
+
+    def surrounded_by_bodies(self):
+        """
+        Vectorized utils.is_surrounded_by_bodies for every square of every board
+        :return: bool np.ndarray of shape [batch, squares]
+        """
+        neighbours = self.neighbours
+        valid = neighbours >= 0
+        safe = np.where(valid, neighbours, 0)
+        cells = self.cells[:, safe]
+        is_body = (cells != const.CELL_EMPTY) & (cells & const.CELL_DEAD != 0)
+        return np.all(is_body | ~valid, axis=2)
+
+    def suffocated_peons(self):
+        """
+        Alive peons that would die at the end of the turn, such as chiefs surrounded by bodies
+        :return: bool np.ndarray of shape [batch, squares]
+        """
+        die_if_surrounded_by_bodies = get_rules_tables()[4]
+        return self.alive & die_if_surrounded_by_bodies[self.types] & self.surrounded_by_bodies()
+
+    def material(self):
+        """
+        Vectorized players.evaluate material : value of the alive peons of each team
+        :return: np.ndarray of shape [batch, MAX_TEAMS]
+        """
+        values = get_rules_tables()[3][self.types] * self.alive
+        batch = len(self)
+        index = (np.arange(batch)[:, None] * MAX_TEAMS + self.teams).ravel()
+        return np.bincount(index, weights=values.ravel(), minlength=batch * MAX_TEAMS).reshape(batch, MAX_TEAMS)
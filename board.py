@@ -1,284 +1,395 @@
-from tkinter import Button, Label
-import sys
-
 import const
-from peons import peon_factory
-from team import Team
-from utils import ImageCache, get_adjacent_alive_enemies, is_surrounded_by_bodies
+from action import Action
+from game_state import GameState
+from history import GameHistory
+from sprites import get_sprites
+
+# Width of the outline drawn around the selected peon
+SELECTED_OUTLINE_WIDTH = 3
+# Size and color of the marks drawn on the squares the selected peon can reach, relative to the cell size
+HIGHLIGHT_RATIO = 0.25
+HIGHLIGHT_COLOR = '#202020'
+# Milliseconds between two reads of the answer of a thinking bot
+BOT_POLL_MS = 15
 
 
-class BoardCell:
+class Board:
     """
-    A cell of the board.
-    A cell can contains nothing or up to 2 peons
-    When a peon come on a cell to kill or replace a peon, we store both of them on the Cell while the player
-    choose where to move the old one).
-    Those are stored on the tuple(?Peon, ?Peon)
+    Tk view of a game.
+    The whole game state is held by a GameState, the board only renders it and forwards the clicks.
+    The cells are drawn on a single Canvas : each square is a rectangle (background color), an image (peon icon)
+    and a mark shown when the selected peon can go there.
+    Only the squares changed by the game are redrawn, in one batch per event loop iteration.
+    Bots think in their own process (see background.py), their answers are polled from the event loop.
+    Every complete turn is kept in a GameHistory, the previous plies can be browsed and played again.
     """
-    def __init__(self, image_cache, initial_peon=None):
-        self.peons = (initial_peon, None)
-        self.image_cache = image_cache
-        self.tk_button = None
+    def __init__(self, data_file, teams=None, bots=None):
+        """
+        Initialise board with a layout file representing the initial peon positions (see layout.py)
+        :param data_file: file path, parsed once and cached
+        :param teams: list[Team], defaults to the layout teams
+        :param bots: dict team index -> background.BackgroundBot of the teams played by the computer
+        :raise layout.LayoutError:
+        """
+        self.data_file = data_file
+        self.teams = teams
+        self.bots = bots or {}
+        self._bot_poll = None
+        self.game = GameState.from_file(data_file, teams)
+        self.history = GameHistory(self.game)
+        # Squares of the turn in progress, see Action
+        self._turn = None
+        # Shrink the cells of big boards so the whole board fits on screen
+        self.cell_size = min(
+            const.CELL_WIDTH_PIXEL, const.BOARD_MAX_SIZE_PIXEL // max(self.game.rows, self.game.cols)
+        )
+        self._state_text_label = None
+        self.canvas = None
+        self.selected_square = None
+        # Canvas items of each square
+        self._rectangles = []
+        self._images = []
+        self._highlights = []
+        # Tk image shown on each square, tkinter blanks an image once its last Python reference is gone
+        self._shown_images = []
+        # Squares marked as reachable by the selected peon
+        self.highlighted_squares = frozenset()
+        # Squares changed by the view itself, eg: the selection
+        self._dirty_squares = set()
+        self._redraw_scheduled = False
 
-    def render(self, master, board):
-        """
-        Return a tkinter representation of the cell
-        :param master: the Tk container
-        :param board: the board, necessary to create the on_click events callbacks
-        :return: tkinter.Button
-        """
-        # images must stay in memory to be displayed by tkinter so keep a reference in the class
-        image = self.image_cache[self.primary_peon.image_path if self.primary_peon else None]
+        # Sprites are loaded and scaled once for the whole process
+        self.sprites = get_sprites()
 
-        self.tk_button = Button(
-            master,
-            bg=const.COLORS_HEX[self.primary_peon.team.color] if not self.is_empty else '#D3D3D3',
-            image=image,
-            # use pixel size for images, font size for empty cells
-            width=const.CELL_WIDTH_PIXEL,
-            height=const.CELL_HEIGHT_PIXEL,
-            command=lambda: self.handle_click(board)
-        )
-        return self.tk_button
+        # The whole board is drawn by render(), only track the next changes
+        self.game.pop_dirty_squares()
 
     @property
-    def is_empty(self):
-        return self.primary_peon is None
+    def state(self):
+        return self.game.state
 
-    @property
-    def primary_peon(self):
+    def get_state_text(self) -> str:
         """
-        Return the main peon of the cell if there's one.
-        :return: Peon
+        Return the label to show in the tkinter representation given the current game state
+        :return:
         """
-        return self.peons[0]
+        game = self.game
+        # The turn which won the game may still need a body to be placed
+        if self.state == const.BOARD_STATE_MOVING_PEON:
+            return f"Place {game.describe(game.held_peon)} on an empty cell"
+        elif self.state == const.BOARD_STATE_SELECT_ADJACENT:
+            return "Select an adjacent peon"
+        if game.winner is not None:
+            return f"{game.teams[game.winner]} won !"
+        if self.selected_square is not None:
+            return f"{game.describe(game.cells[self.selected_square])} selected"
+        if self.history.can_redo():
+            return f"Turn {self.history.ply} of {self.history.last_ply}, {game.teams[game.current_team]} to play"
+        if game.current_team in self.bots:
+            return f"{game.teams[game.current_team]} is thinking..."
+        return f"It's {game.teams[game.current_team]}'s turn"
 
-    @property
-    def secondary_peon(self):
+    def render(self, master):
         """
-        Return the second peon on the cell if there's one.
-        :return: Peon
+        Create the tkinter representation of the board
+        :param master:
         """
-        return self.peons[1]
+        # tkinter is only imported once rendering is requested, the rules never need it
+        from tkinter import Canvas, Label
 
-    @property
-    def position(self):
-        """
-        Get coordinates in the grid
-        :return: tuple(int, int)
-        """
-        grid_info = self.tk_button.grid_info()
-        return grid_info["row"], grid_info["column"]
+        game = self.game
+        self.canvas = Canvas(
+            master,
+            width=game.cols * self.cell_size,
+            height=game.rows * self.cell_size,
+            highlightthickness=0,
+        )
+        self._rectangles = []
+        self._images = []
+        self._highlights = []
+        self._shown_images = [None] * (game.rows * game.cols)
+        margin = int(self.cell_size * (1 - HIGHLIGHT_RATIO) / 2)
+        for square in range(game.rows * game.cols):
+            row, col = game.position(square)
+            x, y = col * self.cell_size, row * self.cell_size
+            self._rectangles.append(self.canvas.create_rectangle(
+                x, y, x + self.cell_size - 1, y + self.cell_size - 1, outline='black'
+            ))
+            self._images.append(self.canvas.create_image(x + self.cell_size // 2, y + self.cell_size // 2))
+            self._highlights.append(self.canvas.create_oval(
+                x + margin, y + margin, x + self.cell_size - margin, y + self.cell_size - margin,
+                fill=HIGHLIGHT_COLOR, outline='', state='hidden'
+            ))
+            self.redraw_square(square)
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.canvas.grid(row=0, column=0)
+
+        self._state_text_label = Label(master, text=self.get_state_text())
+        self._state_text_label.grid(row=1, column=0)
+        self.start_bot_turn()
 
-    def redraw_image(self):
-        """
-        Replace the current image on the tk button according to the cell's state
-        """
-        color = "#D3D3D3"
-        if self.primary_peon and not self.primary_peon.alive:
-            color = "#808080"
-        elif self.primary_peon:
-            color = const.COLORS_HEX[self.primary_peon.team.color]
-        image = self.image_cache[self.primary_peon.image_path if self.primary_peon else None]
-        self.update_tk(
-            image=image,
-            bg=color,
+    def redraw_square(self, square):
+        """
+        Update the canvas items of a square according to its cell
+        :param square:
+        """
+        game = self.game
+        color = const.COLOR_EMPTY_HEX
+        peon = game.peon(square)
+        if peon and not game.is_alive(square):
+            color = const.COLOR_BODY_HEX
+        elif peon:
+            color = game.teams[game.team(square)].hex_color
+        self.canvas.itemconfigure(
+            self._rectangles[square],
+            fill=color,
+            width=SELECTED_OUTLINE_WIDTH if square == self.selected_square else 1,
+        )
+        # images must stay in memory to be displayed by tkinter, the sprite store may evict them so keep a reference
+        image = self.sprites.image(peon.image_path, (self.cell_size, self.cell_size)) if peon else None
+        self._shown_images[square] = image
+        self.canvas.itemconfigure(self._images[square], image=image or '')
+        self.canvas.itemconfigure(
+            self._highlights[square], state='normal' if square in self.highlighted_squares else 'hidden'
         )
+        if square == self.selected_square:
+            # Keep the thick outline above the neighbour squares
+            self.canvas.tag_raise(self._rectangles[square])
+            self.canvas.tag_raise(self._images[square])
 
-    def update_tk(self, **kwargs):
-        """
-        Update the tk representation
-        :param kwargs: param: value
-        """
-        self.tk_button.configure(**kwargs)
+    def refresh(self):
+        """
+        Schedule the redraw of the changed squares and of the state text.
+        Several refreshes during the same event loop iteration are drawn at once.
+        """
+        # Only the marks that appear or disappear are redrawn
+        highlighted_squares = self.get_highlighted_squares()
+        self._dirty_squares |= highlighted_squares ^ self.highlighted_squares
+        self.highlighted_squares = highlighted_squares
+        if not self._redraw_scheduled:
+            self._redraw_scheduled = True
+            self.canvas.after_idle(self._redraw)
+
+    def _redraw(self):
+        self._redraw_scheduled = False
+        dirty_squares = self.game.pop_dirty_squares() | self._dirty_squares
+        self._dirty_squares = set()
+        for square in dirty_squares:
+            self.redraw_square(square)
+        self.update_text()
+        # The position is on screen before the bot starts thinking on it
+        self.start_bot_turn()
+
+    def start_bot_turn(self):
+        """
+        Let the bot of the current team think, if any, and poll its answer from the event loop
+        """
+        game = self.game
+        bot = self.bots.get(game.current_team)
+        if bot is None or bot.thinking or game.winner is not None or self.state != const.BOARD_STATE_STANDARD:
+            return
+        # Bots wait while an earlier ply is shown
+        if self.history.can_redo():
+            return
+        bot.think(game)
+        if self._bot_poll is None:
+            self._bot_poll = self.canvas.after(BOT_POLL_MS, self._poll_bot)
 
-    def handle_click(self, board):
+    def _poll_bot(self):
+        self._bot_poll = None
+        bot = self.bots.get(self.game.current_team)
+        if bot is None or not bot.thinking:
+            return
+        action = bot.poll()
+        if action is None:
+            self._bot_poll = self.canvas.after(BOT_POLL_MS, self._poll_bot)
+            return
+        self.select_peon(None)
+        self.game.play(action)
+        self.history.commit(action)
+        # Search the expected next turn while the other teams play
+        bot.ponder(self.game)
+        self.refresh()
+
+    def cancel_bots(self):
         """
-        Callback on button press according to current board state
-        :param board:
+        Cancel the searches of every bot, their late answers are dropped
         """
-        if board.state == const.BOARD_STATE_STANDARD:
-            self.handle_click_standard(board)
-        elif board.state == const.BOARD_STATE_MOVING_PEON:
-            self.handle_click_moving_peon(board)
-        elif board.state == const.BOARD_STATE_SELECT_ADJACENT:
-            self.handle_click_selecting_adjacent(board)
+        if self._bot_poll is not None:
+            self.canvas.after_cancel(self._bot_poll)
+            self._bot_poll = None
+        for bot in self.bots.values():
+            bot.cancel()
+
+    def reset(self):
+        """
+        Start a new game from the layout file
+        """
+        self.cancel_bots()
+        self.game = GameState.from_file(self.data_file, self.teams)
+        self.history = GameHistory(self.game)
+        self._turn = None
+        self.selected_square = None
+        self.highlighted_squares = frozenset()
+        # Every square is dirty in a new game state
+        self.refresh()
 
-    def handle_click_standard(self, board):
+    def goto(self, ply):
+        """
+        Show the position of a ply, the next turn played from there replaces the plies after it
+        :param ply: index in the history, negative values count from the last ply
+        """
+        # A turn in progress can't be left
+        if self.state != const.BOARD_STATE_STANDARD or not -len(self.history) <= ply < len(self.history):
+            return
+        self.cancel_bots()
+        self.select_peon(None)
+        self._dirty_squares |= self.history.goto(ply)
+        self.refresh()
+
+    def undo(self):
         """
-        Player can select a peon and move it on the board
-        :param board:
+        Go back to the previous turn played from the window, skipping the bots turns
         """
-        # Select a peon first
-        if not board.selected_cell:
-            # Empty cell
-            if self.is_empty:
-                return
-            # Don't let move other player peons
-            if self.primary_peon.team is not board.current_team:
-                return
-            # Can't move dead peons
-            if self.primary_peon.alive:
-                board.select_peon(self)
-        # Peon is selected, select where to move it
-        else:
-            if (
-                self.primary_peon
-                and self.primary_peon.team is board.current_team
-                and self.primary_peon.alive
-            ):
-                # Replace selected peon if user changed his mind
-                board.select_peon(self)
-            else:
-                # Peon have different movesets depending on it's type
-                if self.position in board.selected_cell.primary_peon.available_moves():
-                    selected_peon = board.selected_cell.primary_peon
-                    # Remove the peon from its original position
-                    board.selected_cell.peons = (None, None)
-                    board.selected_cell.redraw_image()
-                    # Move it and activate its effect
-                    board.move(selected_peon, self, activate_peon_after_move=True)
+        ply = self.history.ply - 1
+        while ply > 0 and self.history[ply].current_team in self.bots:
+            ply -= 1
+        if ply >= 0:
+            self.goto(ply)
 
-    def handle_click_moving_peon(self, board):
+    def redo(self):
         """
-        Move the current select peon to an empty cell
-        :param board:
+        Go forward to the next turn played from the window, skipping the bots turns
         """
-        if self.is_empty:
-            board.move(board.selected_cell.secondary_peon, self)
-            board.next_turn()
+        ply = self.history.ply + 1
+        while ply < self.history.last_ply and self.history[ply].current_team in self.bots:
+            ply += 1
+        if ply <= self.history.last_ply:
+            self.goto(ply)
 
-    def handle_click_selecting_adjacent(self, board):
+    def close(self):
         """
-        Reporter can select adjacent peons on move
-        :param board:
+        Stop the bots processes, called when the window is closed
         """
-        if self.position in get_adjacent_alive_enemies(board.selected_cell.primary_peon):
-            board.selected_cell.primary_peon.select_adjacent(self.primary_peon)
+        self.cancel_bots()
+        for bot in self.bots.values():
+            bot.close()
+        self.bots = {}
 
+    def get_highlighted_squares(self):
+        """
+        Squares where the next click can play : destinations of the selected peon, or the peons a reporter can kill
+        :return: frozenset(int)
+        """
+        if self.selected_square is None or self.game.winner is not None:
+            return frozenset()
+        if self.state == const.BOARD_STATE_STANDARD:
+            return self.game.legal_destinations(self.selected_square)
+        if self.state == const.BOARD_STATE_SELECT_ADJACENT:
+            return frozenset(self.game.adjacent_alive_enemies(self.selected_square))
+        return frozenset()
 
-class Board:
-    """
-    Contains the state of the whole game.
-    """
-    def __init__(self, data_file, teams):
+    def update_text(self):
         """
-        Initialise board with a text file representing initial peon positions
-        :param data_file: file path
-        :param teams: list[Team]
+        Update the TK text according to board state
         """
-        self.cells = []
-        self.teams_alive = teams
-        self.current_team = teams[0]
-        self._state_text_label = None
-        self.selected_cell = None
-        self.state = const.BOARD_STATE_STANDARD
-
-        # Initialize a cache to only load image once
-        self.image_cache = ImageCache()
+        self._state_text_label.configure(text=self.get_state_text())
 
-        with open(data_file) as initial_board:
-            # Read initial_board and iterate on each line
-            for row_idx, row_data in enumerate([row.rstrip('\n') for row in initial_board]):
-                self.cells.append(list())
-                for col_idx, col_data in enumerate(row_data.split()):
-                    try:
-                        peon, color = col_data.split("_")
-                    except ValueError:
-                        print("Error parsing initial_board.txt, please verify format", file=sys.stderr)
-                    if peon and color:
-                        # Add peon according to their type
-                        self.cells[row_idx].append(BoardCell(
-                            image_cache=self.image_cache,
-                            initial_peon=peon_factory(
-                                board=self,
-                                peon_type=peon,
-                                team=Team.get_by_color(teams, color),
-                                position=(row_idx, col_idx)
-                            )
-                        ))
-                    else:
-                        # Add an empty cell
-                        self.cells[row_idx].append(BoardCell(
-                            image_cache=self.image_cache
-                        ))
+    def square_at(self, x, y):
+        """
+        :param x: canvas coordinate in pixels
+        :param y: canvas coordinate in pixels
+        :return: square under the coordinates, None outside of the board
+        """
+        row, col = y // self.cell_size, x // self.cell_size
+        if 0 <= row < self.game.rows and 0 <= col < self.game.cols:
+            return self.game.square(row, col)
+        return None
 
-    def get_state_text(self) -> str:
+    def on_click(self, event):
         """
-        Return the label to show in the tkinter representation given the current game state
-        :return:
+        Canvas click callback
+        :param event: tkinter.Event
         """
-        if len(self.teams_alive) == 1:
-            return f"{self.teams_alive[0]} won !"
-        if self.state == const.BOARD_STATE_MOVING_PEON:
-            return f"Place {self.selected_cell.secondary_peon} on an empty cell"
+        square = self.square_at(event.x, event.y)
+        if square is not None:
+            self.handle_click(square)
+
+    def handle_click(self, square):
+        """
+        Click on a square according to current board state
+        :param square:
+        """
+        game = self.game
+        if game.current_team in self.bots:
+            return
+        # A game can be won in the middle of a turn, the turn must still be completed
+        if game.winner is not None and self.state == const.BOARD_STATE_STANDARD:
+            return
+        if self.state == const.BOARD_STATE_STANDARD:
+            self.handle_click_standard(square)
+        elif self.state == const.BOARD_STATE_MOVING_PEON:
+            self.handle_click_moving_peon(square)
         elif self.state == const.BOARD_STATE_SELECT_ADJACENT:
-            return "Select an adjacent peon"
-        if self.selected_cell:
-            return f"{self.selected_cell.primary_peon} selected"
-        return f"It's {self.current_team}'s turn"
+            self.handle_click_selecting_adjacent(square)
+        if self._turn is not None and self.state == const.BOARD_STATE_STANDARD:
+            # The turn is complete, including the one which won the game
+            self.history.commit(Action(*self._turn))
+            self._turn = None
+        self.refresh()
 
-    def render(self, master):
+    def handle_click_standard(self, square):
         """
-        Return a tkinter representation of the♥2board
-        :param master:
+        Player can select a peon and move it on the board
+        :param square:
         """
-        for row_idx, row in enumerate(self.cells):
-            for col_idx, cell in enumerate(row):
-                cell.render(master, self).grid(row=row_idx, column=col_idx)
-        self._state_text_label = Label(master, text=self.get_state_text())
-        self._state_text_label.grid(
-            row=len(self.cells),
-            column=0, columnspan=len(self.cells[0])
-        )
+        game = self.game
+        # Empty cells, dead peons and other player peons can't be selected
+        selectable = game.is_alive(square) and game.team(square) == game.current_team
+        # Select a peon first
+        if self.selected_square is None:
+            if selectable:
+                self.select_peon(square)
+        # Peon is selected, select where to move it
+        elif selectable:
+            # Replace selected peon if user changed his mind
+            self.select_peon(square)
+        # Peon have different movesets depending on it's type
+        # Destinations are cached until a cell on the way of the peon changes
+        elif square in game.legal_destinations(self.selected_square):
+            # Move it and activate its effect
+            self._turn = [self.selected_square, square, None, None]
+            game.move(self.selected_square, square)
+            self.select_peon(square if game.state != const.BOARD_STATE_STANDARD else None)
 
-    def update_text(self):
+    def handle_click_moving_peon(self, square):
         """
-        Update the TK text according to board state
+        Move the held peon to an empty cell
+        :param square:
         """
-        self._state_text_label.configure(text=self.get_state_text())
-
-    def select_peon(self, cell):
-        """
-        Select a peon, making its cell's button 'sunken'
-        :param cell:
-        """
-        if self.selected_cell:
-            self.selected_cell.update_tk(
-                relief='raised'
-            )
-        self.selected_cell = cell
-        cell.update_tk(
-            relief='sunken'
-        )
-        self.update_text()
+        if self.game.cells[square] == const.CELL_EMPTY:
+            self._turn[2] = square
+            self.game.place_held_peon(square)
+            self.game.next_turn()
+            self.select_peon(None)
 
-    def next_turn(self):
+    def handle_click_selecting_adjacent(self, square):
         """
-        End the current turn, changing current player
+        Reporter can select adjacent peons on move
+        :param square:
         """
-        current_team_index = self.teams_alive.index(self.current_team)
-        self.selected_cell = None
-        for row in self.cells:
-            for cell in row:
-                if cell.primary_peon and cell.primary_peon.die_if_surrounded_by_bodies:
-                    if is_surrounded_by_bodies(cell.primary_peon):
-                        cell.primary_peon.die(self.current_team)
-
-        self.current_team = self.teams_alive[(current_team_index + 1) % len(self.teams_alive)]
-        self.state = const.BOARD_STATE_STANDARD
-        self.update_text()
+        if square in self.game.adjacent_alive_enemies(self.selected_square):
+            self._turn[3] = square
+            self.game.select_adjacent(square)
+            self.select_peon(None)
 
-    def move(self, peon, arrival_cell, activate_peon_after_move=False):
+    def select_peon(self, square):
         """
-        Move a peon from one cell to another
-        :param peon:
-        :param arrival_cell:
-        :param activate_peon_after_move:
-        :return:
+        Select a peon, drawing a thick outline around its square
+        :param square: square, or None to clear the selection
         """
-        peon.position = arrival_cell.position
-        arrival_cell.peons = (peon, arrival_cell.primary_peon)
-        arrival_cell.redraw_image()
-        if activate_peon_after_move:
-            peon.after_move()
+        for changed in (self.selected_square, square):
+            if changed is not None:
+                self._dirty_squares.add(changed)
+        self.selected_square = square
+        self.refresh()
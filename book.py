@@ -0,0 +1,245 @@
+"""
+Opening book : the complete turns played from the first positions of many games, with their visit counts and scores.
+
+The book is built from self-play games, or from existing game record files (see record.py).
+It is written as a sorted file of fixed size entries, memory-mapped and looked up by binary search,
+so every bot process shares the same copy through the page cache without loading anything.
+
+File : header (magic, version, entries count), then the entries sorted by position hash, most visited first
+Entry : position hash (unsigned long long), visits (uint), score (float, mean reward of the team to move),
+        then the action as in record.TURN
+
+eg: python book.py --games 2000 --players paranoid --time-limit 0.05 --plies 12 --output opening_book.djb
+    python simulate.py --players paranoid --book opening_book.djb
+    python server.py --book opening_book.djb
+"""
+import functools
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from action import Action
+from players import Player
+from record import GameRecord, GameRecordReader, NO_SQUARE
+
+MAGIC = b'DJBK'
+VERSION = 1
+
+BOOK_HEADER = struct.Struct('<4sBI')
+BOOK_ENTRY = struct.Struct('<QIf4H')
+ENTRY_KEY = struct.Struct('<Q')
+
+# Mask of the position hashes, the GameState hash is a Python int
+KEY_MASK = (1 << 64) - 1
+
+BookEntry = namedtuple('BookEntry', ('action', 'visits', 'score'))
+
+
+class OpeningBook:
+    """
+    Read-only access to a book file through a memory map
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.entries = BOOK_HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book of version {VERSION}")
+        if BOOK_HEADER.size + self.entries * BOOK_ENTRY.size > len(self.data):
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.entries
+
+    def _key(self, index):
+        return ENTRY_KEY.unpack_from(self.data, BOOK_HEADER.size + index * BOOK_ENTRY.size)[0]
+
+    def candidates(self, key):
+        """
+        :param key: position hash, see GameState.hash
+        :return: list[BookEntry] of the position, most visited first
+        """
+        key &= KEY_MASK
+        # Lower bound of the key
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        candidates = []
+        offset = BOOK_HEADER.size + low * BOOK_ENTRY.size
+        while low < self.entries:
+            entry_key, visits, score, *squares = BOOK_ENTRY.unpack_from(self.data, offset)
+            if entry_key != key:
+                break
+            action = Action(*(None if square == NO_SQUARE else square for square in squares))
+            candidates.append(BookEntry(action, visits, score))
+            low += 1
+            offset += BOOK_ENTRY.size
+        return candidates
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+@functools.lru_cache(maxsize=None)
+def open_book(path):
+    """
+    :param path: book file path
+    :return: OpeningBook, opened once per process
+    """
+    return OpeningBook(path)
+
+
+class BookPlayer(Player):
+    """
+    Play the most visited book turn while the position is in the book, then let another player search
+    """
+    def __init__(self, player, book, min_visits=2):
+        """
+        :param player: Player used out of the book
+        :param book: OpeningBook or book file path
+        :param min_visits: book turns visited less often are ignored
+        """
+        self.player = player
+        self.book = open_book(book) if isinstance(book, str) else book
+        self.min_visits = min_visits
+        self.hits = 0
+
+    def choose_action(self, state):
+        candidates = [entry for entry in self.book.candidates(state.hash) if entry.visits >= self.min_visits]
+        if candidates:
+            # Guard against hash collisions with positions of other games
+            legal_actions = set(state.legal_actions())
+            for entry in candidates:
+                if entry.action in legal_actions:
+                    self.hits += 1
+                    return entry.action
+        return self.player.choose_action(state)
+
+
+class BookBuilder:
+    """
+    Accumulate the turns of many games, then write them as a book file
+    """
+    def __init__(self, plies=12):
+        """
+        :param plies: number of turns of each game added to the book
+        """
+        self.plies = plies
+        # (position hash, Action) -> [visits, sum of the rewards of the team to move]
+        self.stats = {}
+
+    def add_game(self, game):
+        """
+        :param game: record.GameRecord
+        """
+        state = game.initial_state()
+        teams = len(state.teams)
+        for ply in range(min(self.plies, game.plies)):
+            action = game.action(ply)
+            if game.winner is None:
+                reward = 1 / teams
+            else:
+                reward = float(game.winner == state.current_team)
+            stats = self.stats.setdefault((state.hash & KEY_MASK, action), [0, 0.0])
+            stats[0] += 1
+            stats[1] += reward
+            state.play(action)
+
+    def write(self, path, min_visits=1):
+        """
+        Write the book, replacing the file atomically so running bots keep their current map
+        :param path: book file path
+        :param min_visits: turns visited less often are left out
+        :return: number of entries written
+        """
+        entries = sorted(
+            (
+                (key, -visits, action, total / visits)
+                for (key, action), (visits, total) in self.stats.items() if visits >= min_visits
+            ),
+            key=lambda entry: (entry[0], entry[1], -entry[3])
+        )
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as book_file:
+            book_file.write(BOOK_HEADER.pack(MAGIC, VERSION, len(entries)))
+            for key, visits, action, score in entries:
+                squares = (NO_SQUARE if square is None else square for square in action)
+                book_file.write(BOOK_ENTRY.pack(key, -visits, score, *squares))
+        os.replace(temporary_path, path)
+        return len(entries)
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+    from multiprocessing import Pool
+
+    from layout import load_layout
+    from simulate import PLAYER_TYPES, run_game
+
+    parser = argparse.ArgumentParser(description="Build an opening book from self-play games or game records")
+    parser.add_argument('--output', default='opening_book.djb', help="book file")
+    parser.add_argument('--plies', type=int, default=12, help="turns of each game added to the book")
+    parser.add_argument('--min-visits', type=int, default=2, help="turns played less often are left out")
+    parser.add_argument('--records', nargs='*', default=[], help="game record files to add to the book")
+    parser.add_argument('--games', type=int, default=0, help="self-play games to add to the book")
+    parser.add_argument('--layout', default='initial_board.txt', help="layout file of the self-play games")
+    parser.add_argument(
+        '--players', nargs='+', default=['paranoid'], choices=PLAYER_TYPES,
+        help="player type of each seat, a single type is used for every seat"
+    )
+    parser.add_argument('--time-limit', type=float, default=0.05, help="seconds per move of searching players")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the CPU count")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if not args.records and not args.games:
+        parser.error("nothing to build the book from, use --records and/or --games")
+
+    builder = BookBuilder(args.plies)
+    games = 0
+    for path in args.records:
+        with GameRecordReader(path) as reader:
+            for game in reader:
+                builder.add_game(game)
+                games += 1
+
+    if args.games:
+        teams = load_layout(args.layout).get_teams()
+        player_types = args.players * len(teams) if len(args.players) == 1 else args.players
+        if len(player_types) != len(teams):
+            parser.error(f"--players expects 1 or {len(teams)} player types")
+        # Only the book plies matter, the games are played a bit longer to know who's winning
+        tasks = [
+            (
+                index, args.seed + index, args.layout, player_types, args.time_limit, args.plies * 8,
+                True, None, False, None,
+            )
+            for index in range(args.games)
+        ]
+        started_at = time.perf_counter()
+        with Pool(args.workers) as pool:
+            for _, encoded_game in pool.imap_unordered(run_game, tasks):
+                builder.add_game(GameRecord(encoded_game, 0, teams))
+                games += 1
+        print(f"{args.games} self-play games in {time.perf_counter() - started_at:.2f}s", file=sys.stderr)
+
+    entries = builder.write(args.output, args.min_visits)
+    print(f"{entries} book entries from {games} games written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,10 @@ COLOR_RED = 'red'
 COLOR_BLUE = 'blue'
 COLOR_YELLOW = 'yellow'
 COLOR_GREEN = 'green'
+COLOR_PURPLE = 'purple'
+COLOR_ORANGE = 'orange'
+COLOR_CYAN = 'cyan'
+COLOR_PINK = 'pink'
 
 COLORS = (COLOR_RED, COLOR_BLUE, COLOR_YELLOW, COLOR_GREEN)
 
@@ -10,6 +14,11 @@ COLORS_HEX = {
     COLOR_BLUE: "#0000ff",
     COLOR_YELLOW: "#ffff00",
     COLOR_GREEN: "#00ff00",
+    # Extra colors for the variants with more teams
+    COLOR_PURPLE: "#8000ff",
+    COLOR_ORANGE: "#ff8000",
+    COLOR_CYAN: "#00ffff",
+    COLOR_PINK: "#ff80c0",
 }
 
 # Tkinter use both text units or pixel units depending if it's displaying an image or text
@@ -19,6 +28,8 @@ CELL_HEIGHT_TEXT = 4
 
 # Pixel units
 CELL_WIDTH_PIXEL = CELL_HEIGHT_PIXEL = 62
+# Cells are shrunk on big boards so the whole board fits in this size
+BOARD_MAX_SIZE_PIXEL = 800
 
 # Board states
 # Standard : Composed of 2 states : select a peon, then move it on an availale cell
@@ -31,3 +42,16 @@ BOARD_STATE_MOVING_PEON = 2
 # Select adjacent : some peons (only reporter currently) can select a peon around him to interact with him from distance
 # board has a specific state to select the adjacent cell
 BOARD_STATE_SELECT_ADJACENT = 3
+
+# Cell encoding used by the GameState : every cell is stored as one small int
+# bits 0-2 : peon type code (0 means the cell is empty)
+# bit 3 : dead flag
+# bits 4-7 : team index
+CELL_EMPTY = 0
+CELL_TYPE_MASK = 0b0111
+CELL_DEAD = 0b1000
+CELL_TEAM_SHIFT = 4
+
+# Background colors of the cells
+COLOR_EMPTY_HEX = "#D3D3D3"
+COLOR_BODY_HEX = "#808080"
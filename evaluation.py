@@ -0,0 +1,255 @@
+"""
+Position evaluation for the bots, updated incrementally on every cell change of the GameState.
+
+Features, per team :
+- material : value of the alive peons
+- chiefs : number of alive chiefs
+- mobility : number of moves of the alive peons
+- centre : proximity of the alive chiefs to the centre square
+- chief_bodies : number of bodies around the alive chiefs
+
+Every feature is kept up to date from the cell changes of make_move() / unmake_move(), mobility is the only one
+which is computed lazily : a cell change only marks the peons that can see it, they are recounted on the next read.
+Features with a weight of 0 don't change the scores, they aren't followed : feature_values() computes them from scratch.
+
+eg:
+evaluator = Evaluator(state)
+state.make_move(action)
+evaluator.scores()
+evaluator.contributions(team)
+evaluator.detach()
+"""
+import const
+from peons import Chief, PEONS
+from utils import get_neighbours, get_rays
+
+FEATURES = ('material', 'chiefs', 'mobility', 'centre', 'chief_bodies')
+
+# Material and chiefs only : checked against random players, any weight tried on the other features made the bots
+# weaker, eg: a greedy bot won 34 of 40 games with these weights and 10 of 40 with centre=0.5, mobility=0.05 and
+# chief_bodies=-1. The other features are kept for tuning with tournament.py
+DEFAULT_WEIGHTS = {
+    'material': 1.0,
+    'chiefs': 5.0,
+    'mobility': 0.0,
+    'centre': 0.0,
+    'chief_bodies': 0.0,
+}
+
+
+class Evaluator:
+    """
+    Incremental evaluation of a GameState, attached to it until detach() is called
+    """
+    def __init__(self, state, weights=None):
+        """
+        :param state: GameState, must not already have an evaluator
+        :param weights: dict feature -> weight, missing features use DEFAULT_WEIGHTS
+        """
+        if state.evaluator is not None:
+            raise ValueError("The state already has an evaluator")
+        unknown_features = set(weights or ()) - set(FEATURES)
+        if unknown_features:
+            raise ValueError(f"Unknown features {sorted(unknown_features)}")
+        self.state = state
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        # Features followed on each cell change
+        self.tracked = frozenset(feature for feature in FEATURES if self.weights[feature])
+        self._track_material = 'material' in self.tracked
+        self._track_chiefs = 'chiefs' in self.tracked
+        self._track_centre = 'centre' in self.tracked
+        self._track_chief_bodies = 'chief_bodies' in self.tracked
+        self._track_mobility = 'mobility' in self.tracked
+        self._rays = get_rays(state.rows, state.cols)
+        self._neighbours = get_neighbours(state.rows, state.cols)
+        # Proximity of each square to the centre : 0 on the farthest ring, up to the half size of the board
+        centre_row, centre_col = state.rows // 2, state.cols // 2
+        radius = max(centre_row, centre_col, state.rows - 1 - centre_row, state.cols - 1 - centre_col)
+        self._centre = [
+            radius - max(abs(row - centre_row), abs(col - centre_col))
+            for row in range(state.rows) for col in range(state.cols)
+        ]
+        state.evaluator = self
+        self.rebuild()
+
+    def detach(self):
+        """
+        Stop following the state changes
+        """
+        self.state.evaluator = None
+
+    def rebuild(self):
+        """
+        Compute every feature from scratch, called when the whole position is replaced
+        """
+        teams = len(self.state.teams)
+        self.features = {feature: [0] * teams for feature in FEATURES}
+        # square -> tuple(team, moves count) of the peons whose mobility is counted
+        self._moves = {}
+        # squares whose mobility must be recounted
+        self._stale = set()
+        for square, cell in enumerate(self.state.cells):
+            self._add(square, cell)
+            if self._track_mobility:
+                self._stale.add(square)
+
+    def _bodies_around(self, square):
+        cells = self.state.cells
+        return sum(1 for other_square in self._neighbours[square] if cells[other_square] & const.CELL_DEAD)
+
+    def _add(self, square, cell, sign=1):
+        """
+        Add (or remove with sign=-1) the contributions of an alive peon, except its mobility
+        """
+        if not cell or cell & const.CELL_DEAD:
+            return
+        features = self.features
+        team = cell >> const.CELL_TEAM_SHIFT
+        type_code = cell & const.CELL_TYPE_MASK
+        if self._track_material:
+            features['material'][team] += sign * PEONS[type_code].value
+        if type_code == Chief.code:
+            if self._track_chiefs:
+                features['chiefs'][team] += sign
+            if self._track_centre:
+                features['centre'][team] += sign * self._centre[square]
+            if self._track_chief_bodies:
+                features['chief_bodies'][team] += sign * self._bodies_around(square)
+
+    def cell_changed(self, square, previous, cell):
+        """
+        Called by the GameState after a cell change, the cell is already updated
+        :param square:
+        :param previous: previous cell code
+        :param cell: new cell code
+        """
+        self._add(square, previous, -1)
+        self._add(square, cell)
+
+        # A body appearing or disappearing changes the count of the chiefs around
+        if self._track_chief_bodies and (previous ^ cell) & const.CELL_DEAD:
+            cells = self.state.cells
+            delta = 1 if cell & const.CELL_DEAD else -1
+            chief_bodies = self.features['chief_bodies']
+            for other_square in self._neighbours[square]:
+                other = cells[other_square]
+                if other & const.CELL_TYPE_MASK == Chief.code and not other & const.CELL_DEAD:
+                    chief_bodies[other >> const.CELL_TEAM_SHIFT] += delta
+
+        if not self._track_mobility:
+            return
+        # The peon on the square and the first peon met in each direction may have different moves now,
+        # only forget their count here, they are recounted when the mobility is read
+        cells = self.state.cells
+        moves = self._moves
+        stale = self._stale
+        mobility = self.features['mobility']
+        stale_squares = [square]
+        for ray in self._rays[square]:
+            for other_square in ray:
+                if cells[other_square]:
+                    stale_squares.append(other_square)
+                    break
+        for stale_square in stale_squares:
+            if stale_square in moves:
+                team, count = moves.pop(stale_square)
+                mobility[team] -= count
+            stale.add(stale_square)
+
+    def _update_mobility(self):
+        """
+        Recount the moves of the stale peons, same rules as utils.get_available_moves without building the lists
+        """
+        cells = self.state.cells
+        moves = self._moves
+        mobility = self.features['mobility']
+        for square in self._stale:
+            cell = cells[square]
+            if not cell or cell & const.CELL_DEAD:
+                continue
+            team = cell >> const.CELL_TEAM_SHIFT
+            count = self._count_moves(square, cell)
+            moves[square] = (team, count)
+            mobility[team] += count
+        self._stale.clear()
+
+    def _count_moves(self, square, cell):
+        """
+        :return: number of moves of the alive peon on the square
+        """
+        cells = self.state.cells
+        peon = PEONS[cell & const.CELL_TYPE_MASK]
+        team = cell >> const.CELL_TEAM_SHIFT
+        can_use_enemy, can_use_body, maximum_steps = peon.can_use_enemy, peon.can_use_body, peon.maximum_steps
+        count = 0
+        for ray in self._rays[square]:
+            if maximum_steps:
+                ray = ray[:maximum_steps]
+            for other_square in ray:
+                other = cells[other_square]
+                if not other:
+                    count += 1
+                    continue
+                if other & const.CELL_DEAD:
+                    count += can_use_body
+                elif can_use_enemy and other >> const.CELL_TEAM_SHIFT != team:
+                    count += 1
+                break
+        return count
+
+    def _untracked_value(self, feature, team):
+        """
+        Compute from scratch a feature which isn't followed
+        :return: raw value of the team
+        """
+        value = 0
+        for square in self.state.peon_squares(team=team):
+            cell = self.state.cells[square]
+            if cell & const.CELL_DEAD:
+                continue
+            type_code = cell & const.CELL_TYPE_MASK
+            if feature == 'material':
+                value += PEONS[type_code].value
+            elif feature == 'mobility':
+                value += self._count_moves(square, cell)
+            elif type_code == Chief.code:
+                if feature == 'chiefs':
+                    value += 1
+                elif feature == 'centre':
+                    value += self._centre[square]
+                else:
+                    value += self._bodies_around(square)
+        return value
+
+    def feature_values(self, team):
+        """
+        :param team: team index
+        :return: dict feature -> raw value of the team
+        """
+        self._update_mobility()
+        return {
+            feature: values[team] if feature in self.tracked else self._untracked_value(feature, team)
+            for feature, values in self.features.items()
+        }
+
+    def contributions(self, team):
+        """
+        :param team: team index
+        :return: dict feature -> weighted value of the team, their sum is the team score
+        """
+        return {feature: self.weights[feature] * value for feature, value in self.feature_values(team).items()}
+
+    def scores(self):
+        """
+        :return: list of scores, indexed by team
+        """
+        weights = self.weights
+        if self._track_mobility:
+            self._update_mobility()
+        scores = [0.0] * len(self.state.teams)
+        for feature, values in self.features.items():
+            weight = weights[feature]
+            if weight:
+                for team, value in enumerate(values):
+                    scores[team] += weight * value
+        return scores
@@ -0,0 +1,500 @@
+from action import PASS
+import const
+from layout import load_layout, parse_layout
+from peons import PEONS
+from utils import get_adjacent_alive_enemies, get_neighbours, get_rays
+from zobrist import CELL_CODES, get_keys, hash_state
+
+
+def _is_suffocable(cell):
+    """
+    :param cell: cell code
+    :return: bool, whether the cell holds an alive peon that dies when surrounded by bodies
+    """
+    type_code = cell & const.CELL_TYPE_MASK
+    if not type_code or type_code >= len(PEONS) or cell & const.CELL_DEAD:
+        return False
+    return PEONS[type_code].die_if_surrounded_by_bodies
+
+
+# Whether each cell code holds a peon that dies when surrounded by bodies, indexed by cell code
+SUFFOCABLE_CELLS = bytes(_is_suffocable(cell) for cell in range(CELL_CODES))
+
+
+class GameState:
+    """
+    Contains the rules state of a game, without any rendering.
+    Cells are stored in a flat bytearray indexed by square (row * cols + col).
+    Each cell is a small int holding the peon type, its team index and a dead flag (see const.CELL_*).
+    Teams are referenced by their index in self.teams.
+
+    A turn is played in several steps, matching the board states :
+    - move() a peon of the current team
+    - then place_held_peon() or select_adjacent() if the moved peon requires it
+    The turn ends by itself once no more step is required.
+
+    Complete turns can also be played at once with play(), or with make_move() and reverted with unmake_move(),
+    so a search can explore a line of play without copying the state.
+    """
+    def __init__(self, rows, cols, teams, cells=None):
+        """
+        :param rows:
+        :param cols:
+        :param teams: list[Team], in playing order
+        :param cells: optional initial cells codes
+        """
+        self.rows = rows
+        self.cols = cols
+        self.teams = teams
+        self.cells = bytearray(cells) if cells is not None else bytearray(rows * cols)
+        self.teams_alive = list(range(len(teams)))
+        self.current_team = 0
+        self.state = const.BOARD_STATE_STANDARD
+        # While a turn is in progress : the peon removed from the destination cell,
+        # the square the moving peon came from and the square it moved on
+        self.held_peon = const.CELL_EMPTY
+        self.origin_square = None
+        self.moving_square = None
+        # Undo records of the turns played with make_move()
+        # and the journal of the changes of the turn in progress (None when not recording)
+        self._undo_stack = []
+        self._journal = None
+        # Squares changed since the last call to pop_dirty_squares(), only tracked once it's called
+        self._dirty_squares = None
+        # Destinations of the peons by square, only cached once legal_destinations() is called
+        self._destinations = None
+        # Optional evaluation.Evaluator following the cell changes
+        self.evaluator = None
+        self._load_tables()
+        self._build_indexes()
+
+    def _load_tables(self):
+        """
+        Get the tables shared by every game of the same size
+        """
+        self._cells_keys, self._current_team_keys, self._teams_alive_keys = get_keys(len(self.cells))
+        self._neighbours = get_neighbours(self.rows, self.cols)
+        self._rays = get_rays(self.rows, self.cols)
+
+    def _build_indexes(self):
+        """
+        Compute from scratch what's then updated on each cell change :
+        - the 64 bits Zobrist hash of the position
+        - for each square, the number of adjacent cells that are empty or alive,
+          a peon is surrounded by bodies when it drops to 0
+        - the squares of the alive peons that die when surrounded by bodies
+        """
+        self.hash = hash_state(self)
+        cells = self.cells
+        self._open_neighbours = bytearray(
+            sum(1 for other_square in neighbours if not cells[other_square] & const.CELL_DEAD)
+            for neighbours in self._neighbours
+        )
+        self._suffocable = {square for square, cell in enumerate(cells) if SUFFOCABLE_CELLS[cell]}
+        # Squares of the peons, alive or not, of each team and of each type
+        self._team_squares = [set() for _ in self.teams]
+        self._type_squares = [set() for _ in PEONS]
+        for square, cell in enumerate(cells):
+            if cell:
+                self._team_squares[cell >> const.CELL_TEAM_SHIFT].add(square)
+                self._type_squares[cell & const.CELL_TYPE_MASK].add(square)
+        if self._destinations is not None:
+            self._destinations = {}
+        if self.evaluator is not None:
+            self.evaluator.rebuild()
+
+    def __getstate__(self):
+        """
+        Don't pickle the shared tables, they are rebuilt once per process,
+        nor what only matters to the process : the undo records, the tracked changes and the caches
+        """
+        state = self.__dict__.copy()
+        for table in ('_cells_keys', '_current_team_keys', '_teams_alive_keys', '_neighbours', '_rays'):
+            del state[table]
+        for local in ('_undo_stack', '_journal', '_dirty_squares', '_destinations'):
+            del state[local]
+        # The evaluator belongs to the search of this process
+        state['evaluator'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._undo_stack = []
+        self._journal = None
+        self._dirty_squares = None
+        self._destinations = None
+        self._load_tables()
+
+    def load(self, cells, current_team, teams_alive):
+        """
+        Replace the whole position, the turn must not be in progress.
+        The turns played before can't be reverted with unmake_move() anymore.
+        :param cells: cells codes
+        :param current_team: team index
+        :param teams_alive: list of team indexes
+        """
+        self.cells[:] = cells
+        self.current_team = current_team
+        self.teams_alive = list(teams_alive)
+        self._undo_stack = []
+        self._build_indexes()
+
+    @classmethod
+    def from_layout(cls, layout, teams=None):
+        """
+        Initialise a game in the initial position of a layout
+        :param layout: layout.Layout
+        :param teams: list[Team] matching the layout teams, new teams are created when omitted
+        :return: GameState
+        """
+        if teams is None:
+            teams = layout.get_teams()
+        elif [team.color for team in teams] != [name for name, _ in layout.team_colors]:
+            raise ValueError(f"Teams {teams} don't match the layout teams {layout.team_colors}")
+        return cls(layout.rows, layout.cols, teams, layout.cells)
+
+    @classmethod
+    def from_file(cls, data_file, teams=None):
+        """
+        Initialise a game with a layout file (see layout.py), parsed once and cached
+        :param data_file: file path
+        :param teams: list[Team], the default teams of a layout without team directives
+        :return: GameState
+        :raise layout.LayoutError:
+        """
+        return cls.from_layout(load_layout(data_file, teams), teams)
+
+    @classmethod
+    def from_lines(cls, lines, teams=None):
+        """
+        Initialise a game with the lines of a layout (see layout.py)
+        :param lines: iterable of str
+        :param teams: list[Team], the default teams of a layout without team directives
+        :return: GameState
+        :raise layout.LayoutError:
+        """
+        return cls.from_layout(parse_layout(lines, default_teams=teams), teams)
+
+    def square(self, row, col):
+        """
+        :return: the square index of the given coordinates
+        """
+        return row * self.cols + col
+
+    def position(self, square):
+        """
+        :return: tuple(int, int) coordinates of the given square
+        """
+        return divmod(square, self.cols)
+
+    def peon(self, square):
+        """
+        :return: the Peon type on the square, None if it's empty
+        """
+        return PEONS[self.cells[square] & const.CELL_TYPE_MASK]
+
+    def team(self, square):
+        """
+        :return: the team index of the peon on the square
+        """
+        return self.cells[square] >> const.CELL_TEAM_SHIFT
+
+    def is_alive(self, square):
+        cell = self.cells[square]
+        return bool(cell) and not cell & const.CELL_DEAD
+
+    @property
+    def winner(self):
+        """
+        :return: the index of the winning team, None while the game is running
+        """
+        if len(self.teams_alive) == 1:
+            return self.teams_alive[0]
+        return None
+
+    def describe(self, cell):
+        """
+        Human readable representation of a cell code, eg: 'Militant red dead'
+        :param cell: cell code
+        :return: str
+        """
+        return (
+            f"{PEONS[cell & const.CELL_TYPE_MASK]} {self.teams[cell >> const.CELL_TEAM_SHIFT]}"
+            f"{' dead' if cell & const.CELL_DEAD else ''}"
+        )
+
+    def available_moves(self, square):
+        """
+        :return: list of the squares where the peon on the given square can move
+        """
+        return self.peon(square).available_moves(self, square)
+
+    def legal_destinations(self, square):
+        """
+        Same as available_moves(), cached until a cell on the way of the peon changes,
+        so the UI can check each click and highlight the destinations without recomputing them
+        :return: frozenset of the squares where the peon on the given square can move
+        """
+        if self._destinations is None:
+            self._destinations = {}
+        destinations = self._destinations.get(square)
+        if destinations is None:
+            destinations = frozenset(self.available_moves(square)) if self.is_alive(square) else frozenset()
+            self._destinations[square] = destinations
+        return destinations
+
+    def adjacent_alive_enemies(self, square):
+        return get_adjacent_alive_enemies(self, square)
+
+    def is_surrounded_by_bodies(self, square):
+        """
+        Constant time equivalent of utils.is_surrounded_by_bodies
+        """
+        return not self._open_neighbours[square]
+
+    def _set_cell(self, square, cell):
+        """
+        Change a cell, recording its previous value if a journal is in progress
+        :param square:
+        :param cell: new cell code
+        """
+        journal = self._journal
+        if journal is not None:
+            journal.append(square)
+            journal.append(self.cells[square])
+        previous = self.cells[square]
+        offset = square * CELL_CODES
+        self.hash ^= self._cells_keys[offset + previous] ^ self._cells_keys[offset + cell]
+        self.cells[square] = cell
+        self._cell_changed(square, previous, cell)
+
+    def _cell_changed(self, square, previous, cell):
+        """
+        Update the neighbours counts, the suffocable peons, the cached destinations and the evaluator
+        after a cell change
+        :param square:
+        :param previous: previous cell code
+        :param cell: new cell code
+        """
+        # Only bodies appearing or disappearing change the neighbours counts
+        if (previous ^ cell) & const.CELL_DEAD:
+            open_neighbours = self._open_neighbours
+            delta = 1 if previous & const.CELL_DEAD else -1
+            for other_square in self._neighbours[square]:
+                open_neighbours[other_square] += delta
+        if SUFFOCABLE_CELLS[previous]:
+            self._suffocable.discard(square)
+        if SUFFOCABLE_CELLS[cell]:
+            self._suffocable.add(square)
+        if previous:
+            self._team_squares[previous >> const.CELL_TEAM_SHIFT].discard(square)
+            self._type_squares[previous & const.CELL_TYPE_MASK].discard(square)
+        if cell:
+            self._team_squares[cell >> const.CELL_TEAM_SHIFT].add(square)
+            self._type_squares[cell & const.CELL_TYPE_MASK].add(square)
+        if self._dirty_squares is not None:
+            self._dirty_squares.add(square)
+        if self._destinations is not None:
+            # The peon on the square and the first peon met in each direction may have different destinations now
+            destinations = self._destinations
+            destinations.pop(square, None)
+            cells = self.cells
+            for ray in self._rays[square]:
+                for other_square in ray:
+                    if cells[other_square]:
+                        destinations.pop(other_square, None)
+                        break
+        if self.evaluator is not None:
+            self.evaluator.cell_changed(square, previous, cell)
+
+    def pop_dirty_squares(self):
+        """
+        Return the squares changed since the previous call and start tracking the next changes
+        :return: set(int)
+        """
+        dirty_squares = self._dirty_squares
+        self._dirty_squares = set()
+        if dirty_squares is None:
+            # Nothing was tracked yet, consider everything changed
+            return set(range(len(self.cells)))
+        return dirty_squares
+
+    def peon_squares(self, team=None, peon_type=None):
+        """
+        Squares of the peons, alive or not, of a team and/or of a type
+        :param team: team index
+        :param peon_type: Peon type code
+        :return: sorted list(int)
+        """
+        if team is None and peon_type is None:
+            return [square for square, cell in enumerate(self.cells) if cell]
+        if team is None:
+            return sorted(self._type_squares[peon_type])
+        if peon_type is None:
+            return sorted(self._team_squares[team])
+        return sorted(self._team_squares[team] & self._type_squares[peon_type])
+
+    def play(self, action):
+        """
+        Play a complete turn of the game for good, without keeping anything to revert it.
+        The turns played before with make_move() can't be reverted anymore.
+        :param action: Action
+        """
+        self._undo_stack = []
+        self._play_turn(action)
+
+    def _play_turn(self, action):
+        if action.origin is None:
+            self.next_turn()
+        else:
+            self.move(action.origin, action.destination)
+        if self.state == const.BOARD_STATE_MOVING_PEON:
+            self.place_held_peon(action.placement)
+            self.next_turn()
+        elif self.state == const.BOARD_STATE_SELECT_ADJACENT:
+            self.select_adjacent(action.target)
+
+    def make_move(self, action):
+        """
+        Play a complete turn, keeping what's needed to revert it with unmake_move()
+        :param action: Action
+        """
+        journal = self._journal = []
+        current_team = self.current_team
+        hash_ = self.hash
+        self._play_turn(action)
+        self._journal = None
+        # The journal is a flat list of (square, previous cell) pairs,
+        # teams removed from teams_alive are stored as (-1 - index in teams_alive, team)
+        self._undo_stack.append((journal, current_team, hash_))
+
+    def unmake_move(self):
+        """
+        Revert the last turn played with make_move()
+        """
+        journal, current_team, hash_ = self._undo_stack.pop()
+        cells = self.cells
+        teams_alive = self.teams_alive
+        for i in range(len(journal) - 2, -1, -2):
+            square = journal[i]
+            if square >= 0:
+                previous = cells[square]
+                cells[square] = journal[i + 1]
+                self._cell_changed(square, previous, journal[i + 1])
+            else:
+                teams_alive.insert(-1 - square, journal[i + 1])
+        self.current_team = current_team
+        self.hash = hash_
+
+    def legal_actions(self):
+        """
+        Generate every complete turn the current team can play, lazily so a search can stop early.
+        Yields a single PASS action when the team can't move any peon.
+        :return: generator of Action
+        """
+        if self.state != const.BOARD_STATE_STANDARD or self.winner is not None:
+            return
+        cells = self.cells
+        current_team = self.current_team
+        empty_squares = [square for square, cell in enumerate(cells) if not cell]
+        has_action = False
+        for square in sorted(self._team_squares[current_team]):
+            cell = cells[square]
+            if not cell & const.CELL_DEAD:
+                for action in PEONS[cell & const.CELL_TYPE_MASK].actions(self, square, empty_squares):
+                    has_action = True
+                    yield action
+        if not has_action:
+            yield PASS
+
+    def move(self, origin, destination):
+        """
+        Move a peon from one square to another and activate its effect.
+        The peon previously on the destination is held until the turn resolves it.
+        :param origin:
+        :param destination:
+        """
+        cells = self.cells
+        cell = cells[origin]
+        self.held_peon = cells[destination]
+        self._set_cell(destination, cell)
+        self._set_cell(origin, const.CELL_EMPTY)
+        self.origin_square = origin
+        self.moving_square = destination
+        PEONS[cell & const.CELL_TYPE_MASK].after_move(self, destination)
+
+    def place_held_peon(self, square):
+        """
+        Put the held peon on an empty square
+        :param square:
+        """
+        self._set_cell(square, self.held_peon)
+        self.held_peon = const.CELL_EMPTY
+
+    def select_adjacent(self, square):
+        """
+        Let the moving peon interact with an adjacent peon
+        :param square:
+        """
+        self.peon(self.moving_square).select_adjacent(self, square)
+
+    def kill(self, square, killed_by):
+        """
+        Kill the peon on the given square
+        :param square:
+        :param killed_by: team index of the killer
+        """
+        cell = self.cells[square] | const.CELL_DEAD
+        self._set_cell(square, cell)
+        PEONS[cell & const.CELL_TYPE_MASK].die(self, cell >> const.CELL_TEAM_SHIFT, killed_by)
+
+    def kill_held_peon(self, killed_by):
+        """
+        Kill the held peon
+        :param killed_by: team index of the killer
+        """
+        cell = self.held_peon | const.CELL_DEAD
+        self.held_peon = cell
+        PEONS[cell & const.CELL_TYPE_MASK].die(self, cell >> const.CELL_TEAM_SHIFT, killed_by)
+
+    def capture_team(self, team, killed_by):
+        """
+        The team looses and the killer steal all its peons
+        :param team: team index
+        :param killed_by: team index
+        """
+        cells = self.cells
+        # Only the team's peons are visited, the index changes while they are captured so iterate on a copy
+        for square in sorted(self._team_squares[team]):
+            cell = cells[square]
+            captured = cell & (const.CELL_TYPE_MASK | const.CELL_DEAD) | killed_by << const.CELL_TEAM_SHIFT
+            self._set_cell(square, captured)
+        if team in self.teams_alive:
+            index = self.teams_alive.index(team)
+            del self.teams_alive[index]
+            self.hash ^= self._teams_alive_keys[team]
+            if self._journal is not None:
+                self._journal.append(-1 - index)
+                self._journal.append(team)
+
+    def next_turn(self):
+        """
+        End the current turn, changing current player
+        """
+        # Checked in squares order, a chief dying there can suffocate the next ones
+        for square in sorted(self._suffocable):
+            if not self._open_neighbours[square] and square in self._suffocable:
+                self.kill(square, self.current_team)
+
+        # Next team in playing order still alive
+        teams_count = len(self.teams)
+        for offset in range(1, teams_count + 1):
+            team = (self.current_team + offset) % teams_count
+            if team in self.teams_alive:
+                self.hash ^= self._current_team_keys[self.current_team] ^ self._current_team_keys[team]
+                self.current_team = team
+                break
+        self.state = const.BOARD_STATE_STANDARD
+        self.held_peon = const.CELL_EMPTY
+        self.origin_square = None
+        self.moving_square = None
@@ -0,0 +1,154 @@
+"""
+History of a game : an immutable snapshot of the position after every complete turn.
+
+A snapshot holds the board as a tuple of rows (bytes), the rows a turn didn't change are the same objects as in the
+previous snapshot. A long game costs a few changed rows per turn, instead of a copy of the whole board.
+Any ply is reached in constant time from the list of snapshots, restoring it on the GameState only reloads the board.
+
+eg:
+history = GameHistory(state)
+state.play(action)
+history.commit(action)
+history.goto(0)  # back to the initial position
+history.redo()
+"""
+from collections import namedtuple
+
+from record import POSITION_HEADER
+
+# rows : tuple of bytes, the cells of each row of the board
+# teams_alive : tuple of team indexes
+# action : Action which led to this position, None for the initial position or when it's unknown
+Snapshot = namedtuple('Snapshot', ('rows', 'current_team', 'teams_alive', 'hash', 'action'))
+
+
+def take_snapshot(state, previous=None, action=None):
+    """
+    :param state: GameState, between two turns
+    :param previous: Snapshot the unchanged rows are shared with
+    :param action: Action which led to the position
+    :return: Snapshot
+    """
+    cols = state.cols
+    cells = memoryview(state.cells)
+    rows = []
+    for row in range(state.rows):
+        cells_row = cells[row * cols:(row + 1) * cols]
+        if previous is not None and cells_row == previous.rows[row]:
+            rows.append(previous.rows[row])
+        else:
+            rows.append(cells_row.tobytes())
+    return Snapshot(tuple(rows), state.current_team, tuple(state.teams_alive), state.hash, action)
+
+
+def snapshot_cells(snapshot):
+    """
+    :param snapshot: Snapshot
+    :return: bytes of every cell, as in GameState.cells
+    """
+    return b''.join(snapshot.rows)
+
+
+def encode_snapshot(snapshot):
+    """
+    :param snapshot: Snapshot
+    :return: bytes, same as record.encode_position of the position
+    """
+    teams_alive_mask = 0
+    for team in snapshot.teams_alive:
+        teams_alive_mask |= 1 << team
+    rows, cols = len(snapshot.rows), len(snapshot.rows[0])
+    return POSITION_HEADER.pack(rows, cols, snapshot.current_team, teams_alive_mask) + snapshot_cells(snapshot)
+
+
+def changed_squares(snapshot, other):
+    """
+    :param snapshot: Snapshot
+    :param other: Snapshot of the same game
+    :return: set of the squares whose cell differs between both snapshots
+    """
+    squares = set()
+    cols = len(snapshot.rows[0])
+    for row, (cells_row, other_row) in enumerate(zip(snapshot.rows, other.rows)):
+        # Shared rows are skipped without comparing them
+        if cells_row is not other_row and cells_row != other_row:
+            squares.update(
+                row * cols + col for col, (cell, other_cell) in enumerate(zip(cells_row, other_row))
+                if cell != other_cell
+            )
+    return squares
+
+
+class GameHistory:
+    """
+    Snapshots of every ply of a game, and the ply currently shown by its GameState.
+    Committing a turn from an earlier ply forgets the plies after it, like the redo of an editor.
+    """
+    def __init__(self, state):
+        """
+        :param state: GameState, its current position is the ply 0
+        """
+        self.state = state
+        self.snapshots = [take_snapshot(state)]
+        self.ply = 0
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def __getitem__(self, ply):
+        return self.snapshots[ply]
+
+    @property
+    def last_ply(self):
+        return len(self.snapshots) - 1
+
+    @property
+    def actions(self):
+        """
+        :return: list of the actions played up to the current ply
+        """
+        return [snapshot.action for snapshot in self.snapshots[1:self.ply + 1]]
+
+    def commit(self, action=None):
+        """
+        Record the position of the state after a complete turn
+        :param action: Action played, if known
+        :return: Snapshot
+        """
+        del self.snapshots[self.ply + 1:]
+        snapshot = take_snapshot(self.state, self.snapshots[self.ply], action)
+        self.snapshots.append(snapshot)
+        self.ply += 1
+        return snapshot
+
+    def goto(self, ply):
+        """
+        Put the state in the position of a ply, the snapshots after it are kept
+        :param ply: index of the snapshot, negative values count from the last ply
+        :return: set of the squares changed on the board
+        :raise IndexError: if the ply isn't in the history
+        """
+        snapshot = self.snapshots[ply]
+        ply %= len(self.snapshots)
+        squares = changed_squares(self.snapshots[self.ply], snapshot)
+        self.state.load(snapshot_cells(snapshot), snapshot.current_team, snapshot.teams_alive)
+        self.ply = ply
+        return squares
+
+    def can_undo(self):
+        return self.ply > 0
+
+    def can_redo(self):
+        return self.ply < self.last_ply
+
+    def undo(self):
+        """
+        :return: set of the squares changed on the board
+        """
+        return self.goto(self.ply - 1) if self.can_undo() else set()
+
+    def redo(self):
+        """
+        :return: set of the squares changed on the board
+        """
+        return self.goto(self.ply + 1) if self.can_redo() else set()
@@ -0,0 +1,246 @@
+"""
+Runtime switchable counters and timers on the hot paths of the rules, the turn processing and the rendering.
+
+Nothing is measured until enable() is called : it wraps the instrumented methods, disable() puts the originals back,
+so there's no overhead at all while it's off.
+Measures are exported as a JSON summary, and optionally as a sampled trace file (one JSON object per line).
+
+Instrumented :
+- Peon.available_moves : calls and duration per peon type
+- GameState.next_turn : duration
+- Chief.die : calls and number of peons transferred to the killer team
+The rules measures are split between the turns played in the game and the turns a search explores with
+GameState.make_move(), the latter are prefixed with 'search.', eg: 'search.chief.die'.
+- SpriteStore.image : hits and misses, SpriteStore._load_strip and _scale : duration
+- Board.redraw_square : calls, Board._redraw : duration and squares redrawn per event loop iteration
+
+eg:
+instrumentation.enable(trace_path='trace.jsonl', sample_every=100)
+play_game(...)
+instrumentation.write_summary('game.json')
+instrumentation.disable()
+"""
+import collections
+import functools
+import json
+import time
+
+# Measure one call out of this many in the trace file
+DEFAULT_SAMPLE_EVERY = 100
+
+counters = collections.Counter()
+# name -> [count, total, max] of the recorded values, durations are in seconds
+samples = {}
+
+# (owner, attribute name) -> original attribute, while enabled
+_originals = {}
+_trace_file = None
+_sample_every = DEFAULT_SAMPLE_EVERY
+_calls_before_sample = DEFAULT_SAMPLE_EVERY
+_started_at = None
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def record(name, value):
+    """
+    Record a value, eg: a duration in seconds
+    :param name:
+    :param value:
+    """
+    global _calls_before_sample
+    sample = samples.get(name)
+    if sample is None:
+        sample = samples[name] = [0, 0, value]
+    sample[0] += 1
+    sample[1] += value
+    if value > sample[2]:
+        sample[2] = value
+    if _trace_file is not None:
+        _calls_before_sample -= 1
+        if not _calls_before_sample:
+            _calls_before_sample = _sample_every
+            _trace_file.write(json.dumps({
+                'name': name,
+                'time': round(time.perf_counter() - _started_at, 6),
+                'value': value,
+            }) + '\n')
+
+
+def _timed(name):
+    """
+    :return: decorator recording the duration of each call under the given name
+    """
+    def decorator(original):
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            result = original(*args, **kwargs)
+            record(name, time.perf_counter() - started_at)
+            return result
+        return wrapper
+    return decorator
+
+
+def _scope(state):
+    """
+    :param state: GameState
+    :return: prefix of the measure names, 'search.' while a search explores a turn with make_move()
+    """
+    return 'search.' if state._journal is not None else ''
+
+
+def _available_moves(original):
+    names = {}
+
+    @functools.wraps(original)
+    def wrapper(self, state, square):
+        started_at = time.perf_counter()
+        moves = original(self, state, square)
+        elapsed = time.perf_counter() - started_at
+        key = (type(self), _scope(state))
+        name = names.get(key)
+        if name is None:
+            name = names[key] = f'{key[1]}available_moves.{key[0].__name__}'
+        record(name, elapsed)
+        return moves
+    return wrapper
+
+
+def _next_turn(original):
+    @functools.wraps(original)
+    def wrapper(self):
+        name = _scope(self) + 'next_turn'
+        started_at = time.perf_counter()
+        original(self)
+        record(name, time.perf_counter() - started_at)
+    return wrapper
+
+
+def _chief_die(original):
+    @functools.wraps(original)
+    def wrapper(self, state, team, killed_by):
+        name = _scope(state) + 'chief.die'
+        counters[name] += 1
+        counters[name + '.transferred_peons'] += len(state.peon_squares(team=team))
+        started_at = time.perf_counter()
+        original(self, state, team, killed_by)
+        record(name, time.perf_counter() - started_at)
+    return wrapper
+
+
+def _sprite_image(original):
+    @functools.wraps(original)
+    def wrapper(self, *args, **kwargs):
+        photos = len(self._photos)
+        image = original(self, *args, **kwargs)
+        counters['sprites.miss' if len(self._photos) > photos else 'sprites.hit'] += 1
+        return image
+    return wrapper
+
+
+def _counted(name):
+    def decorator(original):
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            counters[name] += 1
+            return original(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _board_redraw(original):
+    @functools.wraps(original)
+    def wrapper(self):
+        squares = counters['board.redraw_square']
+        started_at = time.perf_counter()
+        original(self)
+        record('board.redraw', time.perf_counter() - started_at)
+        record('board.squares_per_redraw', counters['board.redraw_square'] - squares)
+    return wrapper
+
+
+def _hooks():
+    """
+    :return: list of tuple(owner, attribute name, wrapper factory)
+    """
+    # Neither module imports tkinter nor PIL until rendering, instrumenting them stays headless
+    from board import Board
+    from game_state import GameState
+    from peons import Chief, Peon
+    from sprites import SpriteStore
+
+    return [
+        (Peon, 'available_moves', _available_moves),
+        (GameState, 'next_turn', _next_turn),
+        (Chief, 'die', _chief_die),
+        (SpriteStore, 'image', _sprite_image),
+        (SpriteStore, '_load_strip', _timed('sprites.load_strip')),
+        (SpriteStore, '_scale', _timed('sprites.scale')),
+        (Board, 'redraw_square', _counted('board.redraw_square')),
+        (Board, '_redraw', _board_redraw),
+    ]
+
+
+def enable(trace_path=None, sample_every=DEFAULT_SAMPLE_EVERY):
+    """
+    Start measuring, the measures recorded so far are kept
+    :param trace_path: optional file the sampled measures are appended to
+    :param sample_every: one measure out of sample_every is written to the trace file
+    """
+    global _trace_file, _sample_every, _calls_before_sample, _started_at
+    if is_enabled():
+        disable()
+    for owner, attribute, wrapper_factory in _hooks():
+        original = owner.__dict__[attribute]
+        _originals[owner, attribute] = original
+        setattr(owner, attribute, wrapper_factory(original))
+    _sample_every = _calls_before_sample = sample_every
+    _started_at = time.perf_counter()
+    if trace_path:
+        _trace_file = open(trace_path, 'a')
+
+
+def disable():
+    """
+    Stop measuring and close the trace file, the measures are kept until reset()
+    """
+    global _trace_file
+    for (owner, attribute), original in _originals.items():
+        setattr(owner, attribute, original)
+    _originals.clear()
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+def reset():
+    """
+    Forget the measures, eg: between two games
+    """
+    counters.clear()
+    samples.clear()
+
+
+def summary():
+    """
+    :return: dict of the counters and of the recorded values statistics, JSON serializable
+    """
+    return {
+        'counters': dict(counters),
+        'samples': {
+            name: {'count': count, 'total': total, 'mean': total / count, 'max': maximum}
+            for name, (count, total, maximum) in sorted(samples.items())
+        },
+    }
+
+
+def write_summary(path, **extra):
+    """
+    :param path: JSON file path
+    :param extra: other fields of the summary, eg: the game seed
+    """
+    with open(path, 'w') as summary_file:
+        json.dump(dict(summary(), **extra), summary_file, indent=2)
@@ -0,0 +1,218 @@
+"""
+Board layout files : the board size, the teams and the initial position of a game variant.
+
+A layout file starts with optional directives, then one line per board row :
+    # comment
+    size 9 9
+    team red #ff0000
+    team blue #0000ff
+    chief_red _ _ militant_blue_dead ...
+- size <rows> <cols> : checked against the board lines, the size is deduced from them when omitted
+- team <name> [<hex color>] : one per team, in playing order. The color can be omitted for the const.COLORS_HEX ones.
+  Without any team directive the teams are red, blue, yellow and green
+- each cell is either '_' for an empty cell, or 'type_team', with an optional '_dead' suffix for bodies
+Blank lines and comment lines are ignored everywhere.
+
+Layouts are validated once when parsed, errors give the line and column of the faulty token.
+"""
+import functools
+import os
+
+import const
+from peons import Chief, peon_factory
+from team import Team
+from zobrist import MAX_TEAMS
+
+# Rows and columns are stored on one byte in the binary records
+MAX_BOARD_SIDE = 255
+
+HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+
+class LayoutError(ValueError):
+    """
+    Invalid layout, with the position of the error
+    """
+    def __init__(self, message, source, line, column):
+        """
+        :param message:
+        :param source: file path or name of the layout
+        :param line: 1-based line number
+        :param column: 1-based column number
+        """
+        super().__init__(f"{source}:{line}:{column}: {message}")
+        self.source = source
+        self.line = line
+        self.column = column
+
+
+class Layout:
+    """
+    A validated layout
+    """
+    def __init__(self, rows, cols, team_colors, cells):
+        """
+        :param rows:
+        :param cols:
+        :param team_colors: list of tuple(team name, hex color), in playing order
+        :param cells: bytes, cell codes of the initial position
+        """
+        self.rows = rows
+        self.cols = cols
+        self.team_colors = team_colors
+        self.cells = cells
+
+    def get_teams(self):
+        """
+        :return: list[Team], new instances for each call
+        """
+        return [Team(name, hex_color) for name, hex_color in self.team_colors]
+
+
+def _tokens(line):
+    """
+    :return: list of tuple(1-based column, token) of a line
+    """
+    tokens = []
+    start = None
+    for index, char in enumerate(line + ' '):
+        if char.isspace():
+            if start is not None:
+                tokens.append((start + 1, line[start:index]))
+                start = None
+        elif start is None:
+            start = index
+    return tokens
+
+
+def _is_team_name(name):
+    return name.isascii() and name.isalnum() and name == name.lower()
+
+
+def _is_hex_color(color):
+    return len(color) == 7 and color[0] == '#' and HEX_DIGITS.issuperset(color[1:])
+
+
+def parse_layout(lines, source='<layout>', default_teams=None):
+    """
+    :param lines: iterable of str
+    :param source: name of the layout used in the error messages
+    :param default_teams: list[Team] used when the layout has no team directive, defaults to const.COLORS
+    :return: Layout
+    :raise LayoutError:
+    """
+    size = None
+    team_colors = []
+    # team name -> tuple(line, column) of its declaration
+    declarations = {}
+    board_lines = []
+    for line_number, line in enumerate(lines, 1):
+        tokens = _tokens(line)
+        if not tokens or tokens[0][1].startswith('#'):
+            continue
+        column, keyword = tokens[0]
+        if board_lines or keyword not in ('size', 'team'):
+            board_lines.append((line_number, tokens))
+        elif keyword == 'size':
+            if size is not None:
+                raise LayoutError("size is already declared", source, line_number, column)
+            if len(tokens) != 3 or not all(token.isdigit() for _, token in tokens[1:]):
+                raise LayoutError("expected 'size <rows> <cols>'", source, line_number, column)
+            size = (int(tokens[1][1]), int(tokens[2][1]))
+            if not all(1 <= side <= MAX_BOARD_SIDE for side in size):
+                raise LayoutError(
+                    f"rows and cols must be between 1 and {MAX_BOARD_SIDE}", source, line_number, tokens[1][0]
+                )
+        else:
+            if len(tokens) not in (2, 3):
+                raise LayoutError("expected 'team <name> [<hex color>]'", source, line_number, column)
+            name_column, name = tokens[1]
+            if not _is_team_name(name):
+                raise LayoutError(
+                    f"invalid team name '{name}', only lowercase letters and digits are allowed",
+                    source, line_number, name_column
+                )
+            if name in declarations:
+                raise LayoutError(f"team '{name}' is already declared", source, line_number, name_column)
+            if len(tokens) == 3:
+                color_column, hex_color = tokens[2]
+                if not _is_hex_color(hex_color):
+                    raise LayoutError(
+                        f"invalid color '{hex_color}', expected #rrggbb", source, line_number, color_column
+                    )
+            elif name in const.COLORS_HEX:
+                hex_color = const.COLORS_HEX[name]
+            else:
+                raise LayoutError(f"team '{name}' needs a color", source, line_number, name_column)
+            if len(team_colors) == MAX_TEAMS:
+                raise LayoutError(f"at most {MAX_TEAMS} teams are supported", source, line_number, column)
+            declarations[name] = (line_number, column)
+            team_colors.append((name, hex_color))
+
+    if not board_lines:
+        raise LayoutError("no board lines", source, 1, 1)
+    if not team_colors:
+        for team in default_teams or [Team(color) for color in const.COLORS]:
+            team_colors.append((team.color, team.hex_color))
+    team_indexes = {name: index for index, (name, _) in enumerate(team_colors)}
+
+    rows, cols = size or (len(board_lines), len(board_lines[0][1]))
+    if len(board_lines) != rows:
+        line_number = board_lines[min(rows, len(board_lines) - 1)][0]
+        raise LayoutError(f"expected {rows} rows, got {len(board_lines)}", source, line_number, 1)
+    if not 1 <= cols <= MAX_BOARD_SIDE or rows > MAX_BOARD_SIDE:
+        raise LayoutError(f"rows and cols must be between 1 and {MAX_BOARD_SIDE}", source, board_lines[0][0], 1)
+
+    cells = bytearray()
+    # team index -> whether it has an alive chief
+    chiefs = [False] * len(team_colors)
+    for line_number, tokens in board_lines:
+        if len(tokens) != cols:
+            column = tokens[min(cols, len(tokens) - 1)][0]
+            raise LayoutError(f"expected {cols} cells, got {len(tokens)}", source, line_number, column)
+        for column, token in tokens:
+            if token == '_':
+                cells.append(const.CELL_EMPTY)
+                continue
+            dead = token.endswith('_dead')
+            peon_type, _, name = (token[:-len('_dead')] if dead else token).partition('_')
+            if not peon_type or not name:
+                raise LayoutError(
+                    f"invalid cell '{token}', expected '_' or 'type_team[_dead]'", source, line_number, column
+                )
+            try:
+                type_code = peon_factory(peon_type)
+            except KeyError:
+                raise LayoutError(f"unknown peon type '{peon_type}'", source, line_number, column) from None
+            if name not in team_indexes:
+                raise LayoutError(f"unknown team '{name}'", source, line_number, column)
+            team = team_indexes[name]
+            chiefs[team] |= type_code == Chief.code and not dead
+            cells.append(type_code | team << const.CELL_TEAM_SHIFT | (const.CELL_DEAD if dead else 0))
+
+    if len(team_colors) < 2:
+        raise LayoutError("at least 2 teams are needed", source, board_lines[0][0], 1)
+    for team, (name, _) in enumerate(team_colors):
+        if not chiefs[team]:
+            line_number, column = declarations.get(name, (board_lines[0][0], 1))
+            raise LayoutError(f"team '{name}' has no alive chief", source, line_number, column)
+    return Layout(rows, cols, team_colors, bytes(cells))
+
+
+@functools.lru_cache(maxsize=64)
+def _load_layout(path, modified_at, default_colors):
+    default_teams = [Team(color) for color in default_colors] if default_colors else None
+    with open(path) as layout_file:
+        return parse_layout(layout_file, path, default_teams)
+
+
+def load_layout(path, default_teams=None):
+    """
+    Parse a layout file, parsed layouts are cached until the file is modified
+    :param path: file path
+    :param default_teams: list[Team] used when the layout has no team directive, defaults to const.COLORS
+    :return: Layout
+    :raise LayoutError:
+    """
+    default_colors = tuple(team.color for team in default_teams) if default_teams else None
+    return _load_layout(os.path.abspath(path), os.stat(path).st_mtime_ns, default_colors)
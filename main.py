@@ -1,16 +1,121 @@
-from tkinter import Tk
+"""
+Play Djambi in a Tk window, or a quick headless game between computer players.
 
-from board import *
-from team import *
-import const
+eg: python main.py
+    python main.py --players human paranoid human paranoid
+    python main.py --headless --players random paranoid random mcts
+"""
+import argparse
 
+from layout import load_layout
 
-board = Board(
-    data_file='initial_board.txt',
-    teams=[Team(color) for color in const.COLORS],
-)
+# Player type of the seats played from the window
+HUMAN = 'human'
 
-window = Tk()
-board.render(window)
 
-window.mainloop()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play Djambi")
+    parser.add_argument('--layout', default='initial_board.txt', help="layout file, see layout.py")
+    parser.add_argument(
+        '--headless', action='store_true',
+        help="play a single game between computer players without loading tkinter nor the images"
+    )
+    parser.add_argument(
+        '--players', nargs='+', default=None,
+        help=f"player type of each seat, {HUMAN} seats are played from the window (every seat by default), "
+             f"every seat is a computer player in headless mode (random by default)"
+    )
+    parser.add_argument('--time-limit', type=float, default=0.1, help="seconds per move of searching players")
+    parser.add_argument('--max-plies', type=int, default=500)
+    parser.add_argument(
+        '--no-ponder', action='store_true', help="bots don't search while the other teams play in the window"
+    )
+    parser.add_argument('--book', default=None, help="opening book file the computer players look up, see book.py")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', default=None, help="JSON file the instrumentation summary is written to on exit")
+    parser.add_argument('--trace', default=None, help="file the sampled instrumentation measures are appended to")
+    args = parser.parse_args(argv)
+
+    if args.profile or args.trace:
+        import instrumentation
+
+        instrumentation.enable(args.trace)
+    try:
+        play(parser, args)
+    finally:
+        if args.profile or args.trace:
+            instrumentation.disable()
+            if args.profile:
+                instrumentation.write_summary(args.profile, layout=args.layout)
+
+
+def play(parser, args):
+    """
+    Open the Tk window, or play the headless game
+    :param parser: argparse.ArgumentParser, to report invalid arguments
+    :param args: parsed arguments
+    """
+    from simulate import PLAYER_TYPES
+
+    teams = load_layout(args.layout).get_teams()
+    player_types = args.players or ['random' if args.headless else HUMAN]
+    player_types = player_types * len(teams) if len(player_types) == 1 else player_types
+    if len(player_types) != len(teams):
+        parser.error(f"--players expects 1 or {len(teams)} player types")
+    allowed_types = PLAYER_TYPES if args.headless else PLAYER_TYPES + (HUMAN,)
+    for player_type in player_types:
+        if player_type not in allowed_types:
+            parser.error(f"invalid player type {player_type}, choose from {', '.join(allowed_types)}")
+
+    if args.headless:
+        from simulate import play_game, player_factory
+
+        players = [
+            player_factory(player_type, args.seed * len(player_types) + seat, args.time_limit, args.book)
+            for seat, player_type in enumerate(player_types)
+        ]
+        winner, plies = play_game(args.layout, players, args.max_plies)
+        print(f"{teams[winner] if winner is not None else 'Nobody'} won after {plies} turns")
+        return
+
+    from tkinter import Tk
+
+    from background import BackgroundBot
+    from board import Board
+
+    # Bots processes are started before the window, they search while it opens
+    colors = [team.color for team in teams]
+    bots = {
+        seat: BackgroundBot(
+            player_type, colors, args.time_limit, args.seed * len(player_types) + seat,
+            ponder=not args.no_ponder, book=args.book
+        )
+        for seat, player_type in enumerate(player_types) if player_type != HUMAN
+    }
+    board = Board(data_file=args.layout, bots=bots)
+
+    window = Tk()
+    board.render(window)
+
+    def close():
+        board.close()
+        window.destroy()
+
+    window.protocol('WM_DELETE_WINDOW', close)
+    # New game, cancelling the bots searches
+    window.bind('<Control-n>', lambda event: board.reset())
+    # Browse the history, playing from an earlier turn replaces the turns after it
+    window.bind('<Control-z>', lambda event: board.undo())
+    window.bind('<Control-y>', lambda event: board.redo())
+    window.bind('<Left>', lambda event: board.goto(board.history.ply - 1) if board.history.can_undo() else None)
+    window.bind('<Right>', lambda event: board.goto(board.history.ply + 1))
+    window.bind('<Home>', lambda event: board.goto(0))
+    window.bind('<End>', lambda event: board.goto(-1))
+    try:
+        window.mainloop()
+    finally:
+        board.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import math
+import random
+import time
+
+from players import Player, evaluate
+from record import decode_position, encode_position
+
+# How the playouts are spread over the worker processes
+# root : each worker grows its own tree from the current position, the trees are merged at the end
+PARALLELISM_ROOT = 'root'
+# leaf : a single tree, each selected leaf is evaluated by one playout per worker
+PARALLELISM_LEAF = 'leaf'
+
+
+def playout_rewards(state):
+    """
+    Reward of each team at the end of a playout : 1 for the winner,
+    else the share of the material still alive when the playout was stopped
+    :param state: GameState
+    :return: list(float) indexed by team
+    """
+    scores = evaluate(state)
+    total = sum(scores)
+    if not total:
+        return [0.0] * len(scores)
+    return [score / total for score in scores]
+
+
+def playout(state, rng, max_plies):
+    """
+    Play random complete turns until the game ends or max_plies are played, then revert them
+    :param state: GameState
+    :param rng: random.Random
+    :param max_plies:
+    :return: list(float) rewards indexed by team
+    """
+    plies = 0
+    while state.winner is None and plies < max_plies:
+        state.make_move(rng.choice(list(state.legal_actions())))
+        plies += 1
+    rewards = playout_rewards(state)
+    for _ in range(plies):
+        state.unmake_move()
+    return rewards
+
+
+class Node:
+    """
+    A node of the search tree, reached by playing action from its parent
+    """
+    __slots__ = ('action', 'parent', 'team', 'children', 'untried', 'visits', 'rewards')
+
+    def __init__(self, state, action=None, parent=None, team=None):
+        """
+        :param state: GameState in the position of the node
+        :param action: Action leading to this node
+        :param parent: Node
+        :param team: team index that played the action
+        """
+        self.action = action
+        self.parent = parent
+        self.team = team
+        self.children = []
+        self.untried = list(state.legal_actions())
+        self.visits = 0
+        self.rewards = [0.0] * len(state.teams)
+
+    def select_child(self, exploration):
+        """
+        UCT selection, each child is scored from the point of view of the team that played it
+        :param exploration: exploration constant
+        :return: Node
+        """
+        log_visits = math.log(self.visits)
+        return max(
+            self.children,
+            key=lambda child: (
+                child.rewards[child.team] / child.visits
+                + exploration * math.sqrt(log_visits / child.visits)
+            )
+        )
+
+
+def grow_tree(root, state, rng, deadline, exploration, max_playout_plies, evaluate_leaf):
+    """
+    Run MCTS iterations on the tree until the deadline
+    :param root: Node in the position of state
+    :param state: GameState, left unchanged
+    :param rng: random.Random
+    :param deadline: time.perf_counter() value
+    :param exploration: UCT exploration constant
+    :param max_playout_plies:
+    :param evaluate_leaf: callable(state) returning (rewards, playouts count)
+    :return: number of playouts
+    """
+    playouts = 0
+    while time.perf_counter() < deadline:
+        node = root
+        depth = 0
+        # Selection
+        while not node.untried and node.children:
+            node = node.select_child(exploration)
+            state.make_move(node.action)
+            depth += 1
+        # Expansion
+        if node.untried and state.winner is None:
+            action = node.untried.pop(rng.randrange(len(node.untried)))
+            team = state.current_team
+            state.make_move(action)
+            depth += 1
+            child = Node(state, action, node, team)
+            node.children.append(child)
+            node = child
+        # Simulation
+        rewards, count = evaluate_leaf(state)
+        playouts += count
+        for _ in range(depth):
+            state.unmake_move()
+        # Backpropagation
+        while node is not None:
+            node.visits += count
+            node_rewards = node.rewards
+            for team, reward in enumerate(rewards):
+                node_rewards[team] += reward * count
+            node = node.parent
+    return playouts
+
+
+def _root_worker(position, teams, seed, time_limit, exploration, max_playout_plies):
+    """
+    Root parallelism worker : grow an independent tree and return the statistics of the root children
+    :param position: bytes from record.encode_position, much smaller to send than the GameState
+    :param teams: list[Team]
+    :return: tuple(list((Action, visits)), playouts)
+    """
+    state = decode_position(position, teams)
+    rng = random.Random(seed)
+    root = Node(state)
+    playouts = grow_tree(
+        root, state, rng, time.perf_counter() + time_limit, exploration, max_playout_plies,
+        lambda leaf_state: (playout(leaf_state, rng, max_playout_plies), 1)
+    )
+    return [(child.action, child.visits) for child in root.children], playouts
+
+
+def _leaf_worker(position, teams, seed, max_playout_plies):
+    """
+    Leaf parallelism worker : a single playout from the given position
+    :param position: bytes from record.encode_position
+    :param teams: list[Team]
+    :return: list(float) rewards
+    """
+    return playout(decode_position(position, teams), random.Random(seed), max_playout_plies)
+
+
+class MCTSPlayer(Player):
+    """
+    Monte Carlo tree search, with the playouts run in a process pool.
+    With a single worker everything runs in the current process.
+    """
+    def __init__(
+        self, time_limit=1.0, workers=1, parallelism=PARALLELISM_ROOT,
+        exploration=math.sqrt(2), max_playout_plies=200, seed=None
+    ):
+        """
+        :param time_limit: seconds allowed per move
+        :param workers: number of worker processes
+        :param parallelism: PARALLELISM_ROOT or PARALLELISM_LEAF
+        :param exploration: UCT exploration constant
+        :param max_playout_plies: playouts are stopped and scored by material after this many plies
+        :param seed: seed of the random generator, for reproducible games
+        """
+        if parallelism not in (PARALLELISM_ROOT, PARALLELISM_LEAF):
+            raise ValueError(f"Unknown parallelism {parallelism}")
+        self.time_limit = time_limit
+        self.workers = workers
+        self.parallelism = parallelism
+        self.exploration = exploration
+        self.max_playout_plies = max_playout_plies
+        self.rng = random.Random(seed)
+        self._executor = None
+        # Statistics of the last move
+        self.playouts = 0
+        self.playouts_per_second = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            # Imported here so the workers and single process players don't pay for it
+            from concurrent.futures import ProcessPoolExecutor
+
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def close(self):
+        """
+        Shut the worker processes down
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def choose_action(self, state):
+        started_at = time.perf_counter()
+        if self.workers > 1 and self.parallelism == PARALLELISM_ROOT:
+            action = self._choose_root_parallel(state)
+        else:
+            action = self._choose_single_tree(state, started_at + self.time_limit)
+        self.playouts_per_second = self.playouts / max(time.perf_counter() - started_at, 1e-9)
+        return action
+
+    def _choose_single_tree(self, state, deadline):
+        root = Node(state)
+        if self.workers > 1:
+            evaluate_leaf = self._evaluate_leaf_parallel
+        else:
+            def evaluate_leaf(leaf_state):
+                return playout(leaf_state, self.rng, self.max_playout_plies), 1
+        self.playouts = grow_tree(
+            root, state, self.rng, deadline, self.exploration, self.max_playout_plies, evaluate_leaf
+        )
+        if not root.children:
+            return root.untried[0]
+        return max(root.children, key=lambda child: child.visits).action
+
+    def _evaluate_leaf_parallel(self, state):
+        """
+        Run one playout per worker from the leaf and average their rewards
+        """
+        seeds = [self.rng.getrandbits(64) for _ in range(self.workers)]
+        # Only the cells, the team to move and the teams alive are sent, encoded once for every worker
+        position = encode_position(state)
+        results = list(self.executor.map(
+            _leaf_worker, [position] * self.workers, [state.teams] * self.workers, seeds,
+            [self.max_playout_plies] * self.workers
+        ))
+        return [sum(rewards) / len(results) for rewards in zip(*results)], len(results)
+
+    def _choose_root_parallel(self, state):
+        position = encode_position(state)
+        futures = [
+            self.executor.submit(
+                _root_worker, position, state.teams, self.rng.getrandbits(64), self.time_limit,
+                self.exploration, self.max_playout_plies
+            )
+            for _ in range(self.workers)
+        ]
+        visits = {}
+        self.playouts = 0
+        for future in futures:
+            children, playouts = future.result()
+            self.playouts += playouts
+            for action, child_visits in children:
+                visits[action] = visits.get(action, 0) + child_visits
+        if not visits:
+            return next(state.legal_actions())
+        return max(visits, key=visits.get)
@@ -1,5 +1,6 @@
 import abc
 
+from action import Action
 from utils import get_available_moves, get_adjacent_alive_enemies
 import const
 
@@ -7,45 +8,70 @@ import const
 class Peon(abc.ABC):
     """
     Basic abstract class for peons
+    A peon doesn't hold any state : its type, team and alive flag are stored as a small int on the GameState cells.
+    The Peon subclasses only describe the rules of each type, one instance per type is shared by every game.
     """
-    def __init__(self, board, position: tuple, team):
-        """
-        Peon is caracterized by a team and a type
-        Position is tuple (int, int) with the current coordinates of the peon on the board
-        Also include board to be able to calculate possibilites of move and interact with other peon.
-        With the combination of position and board we can also determine on which cell is the peon.
-        :param board:
-        :param position:
-        :param team:
-        """
-        self.board = board
-        self.alive = True
-        self.position = position
-        self.team = team
-        self.die_if_surrounded_by_bodies = False
+    # Type code stored in the cells of the GameState, see const.CELL_TYPE_MASK
+    code = None
+    # Material value used by the computer players evaluation
+    value = 0
+    die_if_surrounded_by_bodies = False
+    # Movement rules, see utils.get_available_moves
+    can_use_enemy = False
+    can_use_body = False
+    maximum_steps = 0
+
+    def available_moves(self, state, square):
+        """
+        Return the list of all valid squares to move
+        :param state: GameState
+        :param square: the square of the peon
+        """
+        return get_available_moves(state, square, self.can_use_enemy, self.can_use_body, self.maximum_steps)
 
-    @abc.abstractmethod
-    def available_moves(self):
+    def actions(self, state, square, empty_squares):
         """
-        Return the list of all valid positions to move
+        Generate the complete turns the peon on the given square can play
+        :param state: GameState
+        :param square: the square of the peon
+        :param empty_squares: squares empty before the move
+        :return: generator of Action
         """
-        pass
+        for destination in self.available_moves(state, square):
+            yield from self.destination_actions(state, square, destination, empty_squares)
+
+    def destination_actions(self, state, square, destination, empty_squares):
+        """
+        Generate the complete turns starting with a move of the peon to one of its available destinations
+        Default implementation asks where to place the displaced peon, if any
+        :param state: GameState
+        :param square: the square of the peon
+        :param destination: one of the available moves of the peon
+        :param empty_squares: squares empty before the move
+        :return: generator of Action
+        """
+        if state.cells[destination]:
+            # The square left by the peon is also available
+            yield Action(square, destination, square)
+            for placement in empty_squares:
+                yield Action(square, destination, placement)
+        else:
+            yield Action(square, destination)
 
     @abc.abstractmethod
-    def after_move(self):
+    def after_move(self, state, square):
         """
         Actions to perform once the peon moved
-        Default implementation kills the potential present peon and replace it on an available cell
+        Default implementation kills the potential present peon and let the player choose where to place it
+        :param state: GameState
+        :param square: the square the peon moved on
         :return:
         """
-        concurrent_peon = self.cell.peons[1]
-        if concurrent_peon:
-            concurrent_peon.die(self.team)
-            self.board.selected_cell = self.cell
-            self.board.state = const.BOARD_STATE_MOVING_PEON
-            self.board.update_text()
+        if state.held_peon:
+            state.kill_held_peon(state.current_team)
+            state.state = const.BOARD_STATE_MOVING_PEON
         else:
-            self.board.next_turn()
+            state.next_turn()
 
     @property
     @abc.abstractmethod
@@ -55,143 +81,143 @@ class Peon(abc.ABC):
         """
         pass
 
-    @property
-    def cell(self):
-        """
-        Shortcut to get the cell containing this peon
-        :return:
+    def die(self, state, team, killed_by):
         """
-        return self.board.cells[self.position[0]][self.position[1]]
-
-    def die(self, killed_by):
-        """
-        Kill the current peon
+        Called once a peon of this type has been killed
         Overload to add specific action to perform
-        :param killed_by: Team killer
+        :param state: GameState
+        :param team: team index of the dead peon
+        :param killed_by: team index of the killer
         """
-        self.alive = False
+        pass
 
-    def select_adjacent(self, peon):
+    def select_adjacent(self, state, square):
         """
         Action to perform when a peon select an adjacent peon.
         Currently only implemented by Reporter type
-        :param peon: the selected Peon
+        :param state: GameState
+        :param square: the square of the selected peon
         """
         pass
 
     def __repr__(self):
-        return f"{type(self).__name__} {self.team}{' dead' if not self.alive else ''}"
+        return type(self).__name__
 
 
-class Militant(Peon):
-    def available_moves(self):
-        return get_available_moves(self.board, self.position, can_use_enemy=True, maximum_steps=2)
+class Chief(Peon):
+    code = 1
+    value = 10
+    die_if_surrounded_by_bodies = True
+    can_use_enemy = True
 
-    def after_move(self):
+    def after_move(self, state, square):
         """
         Inherit default comportment
         """
-        super().after_move()
+        super().after_move(state, square)
+
+    def die(self, state, team, killed_by):
+        """
+        Chief die => owner looses and the killer steal all his peons
+        """
+        state.capture_team(team, killed_by)
 
     @property
     def image_path(self):
-        return "assets/icons/militant.png"
+        return "assets/icons/chief.png"
 
 
 class Assassin(Peon):
-    def available_moves(self):
-        return get_available_moves(self.board, self.position, can_use_enemy=True)
+    code = 2
+    value = 4
+    can_use_enemy = True
+
+    def destination_actions(self, state, square, destination, empty_squares):
+        """
+        The killed peon always goes back on the square the assassin left
+        """
+        yield Action(square, destination)
 
-    def after_move(self):
+    def after_move(self, state, square):
         # Kill peon if there's one, and move it on the initial position
-        concurrent_peon = self.cell.peons[1]
-        if concurrent_peon:
-            concurrent_peon.die(self.team)
-            self.board.move(concurrent_peon, self.board.selected_cell)
-        self.board.next_turn()
+        if state.held_peon:
+            state.kill_held_peon(state.current_team)
+            state.place_held_peon(state.origin_square)
+        state.next_turn()
 
     @property
     def image_path(self):
         return "assets/icons/assassin.png"
 
 
-class Chief(Peon):
-    def __init__(self, board, position: tuple, team):
-        super().__init__(board, position, team)
-        self.die_if_surrounded_by_bodies = True
-
-    def available_moves(self):
-        return get_available_moves(self.board, self.position, can_use_enemy=True)
-
-    def after_move(self):
-        """
-        Inherit default comportment
-        """
-        super().after_move()
+class Reporter(Peon):
+    code = 3
+    value = 3
 
-    def die(self, killed_by):
+    def destination_actions(self, state, square, destination, empty_squares):
         """
-        Chief die => owner looses and the killer steal all his peons
+        A reporter only moves on empty squares, then selects one of the enemies around its destination
         """
-        super().die(killed_by)
-        for row in self.board.cells:
-            for cell in row:
-                peon = cell.primary_peon
-                if peon and peon.team == self.team:
-                    peon.team = killed_by
-                    cell.redraw_image()
-        self.board.teams_alive.remove(self.team)
-
-    @property
-    def image_path(self):
-        return "assets/icons/chief.png"
-
-
-class Reporter(Peon):
-    def available_moves(self):
-        return get_available_moves(self.board, self.position)
+        targets = get_adjacent_alive_enemies(state, destination, state.team(square))
+        if targets:
+            for target in targets:
+                yield Action(square, destination, target=target)
+        else:
+            yield Action(square, destination)
 
-    def after_move(self):
+    def after_move(self, state, square):
         """
         If the reporter have an adjacent enemy living peon, he can select him
         Else, the turn is over
         """
-        if get_adjacent_alive_enemies(self):
-            self.board.selected_cell = self.cell
-            self.board.state = const.BOARD_STATE_SELECT_ADJACENT
-            self.board.update_text()
+        if state.adjacent_alive_enemies(square):
+            state.state = const.BOARD_STATE_SELECT_ADJACENT
         else:
-            self.board.next_turn()
+            state.next_turn()
 
-    def select_adjacent(self, peon):
+    def select_adjacent(self, state, square):
         """
         Kill the adjacent peon, but let it at it's current position
         :return:
         """
-        peon.die(self.team)
-        peon.cell.redraw_image()
-        self.board.next_turn()
+        state.kill(square, state.current_team)
+        state.next_turn()
 
     @property
     def image_path(self):
         return "assets/icons/reporter.png"
 
 
+class Militant(Peon):
+    code = 4
+    value = 1
+    can_use_enemy = True
+    maximum_steps = 2
+
+    def after_move(self, state, square):
+        """
+        Inherit default comportment
+        """
+        super().after_move(state, square)
+
+    @property
+    def image_path(self):
+        return "assets/icons/militant.png"
+
+
 class Diplomate(Peon):
-    def available_moves(self):
-        return get_available_moves(self.board, self.position, can_use_enemy=True)
+    code = 5
+    value = 3
+    can_use_enemy = True
 
-    def after_move(self):
+    def after_move(self, state, square):
         """
         When a diplomat move on an occupied cell, move the peon to the place of your choice
         """
-        concurrent_peon = self.cell.peons[1]
-        if concurrent_peon:
-            self.board.selected_cell = self.cell
-            self.board.state = const.BOARD_STATE_MOVING_PEON
-            self.board.update_text()
+        if state.held_peon:
+            state.state = const.BOARD_STATE_MOVING_PEON
         else:
-            self.board.next_turn()
+            state.next_turn()
 
     @property
     def image_path(self):
@@ -199,34 +225,33 @@ class Diplomate(Peon):
 
 
 class Necromobile(Peon):
-    def available_moves(self):
-        return get_available_moves(self.board, self.position, can_use_body=True)
+    code = 6
+    value = 3
+    can_use_body = True
 
-    def after_move(self):
+    def after_move(self, state, square):
         """
         Necromobile can move a body situated on the same cell as him.
         """
-        concurrent_peon = self.cell.peons[1]
-        if concurrent_peon:
-            self.board.selected_cell = self.cell
-            self.board.state = const.BOARD_STATE_MOVING_PEON
-            self.board.update_text()
+        if state.held_peon:
+            state.state = const.BOARD_STATE_MOVING_PEON
         else:
-            self.board.next_turn()
+            state.next_turn()
 
     @property
     def image_path(self):
         return "assets/icons/necromobile.png"
 
 
-def peon_factory(board, peon_type: str, team, position: tuple) -> Peon:
+# One shared instance per type, indexed by type code
+PEONS = (None, Chief(), Assassin(), Reporter(), Militant(), Diplomate(), Necromobile())
+
+
+def peon_factory(peon_type: str) -> int:
     """
-    Initialize a peon with a string representing of its type and its constructor arguments
-    :param board:
+    Return the type code of a peon given the string representing its type
     :param peon_type:
-    :param team:
-    :param position:
-    :return:
+    :return: int
     """
     return {
         'chief': Chief,
@@ -235,4 +260,4 @@ def peon_factory(board, peon_type: str, team, position: tuple) -> Peon:
         'militant': Militant,
         'diplomat': Diplomate,
         'necromobile': Necromobile
-    }[peon_type](board, position, team)
+    }[peon_type].code
@@ -0,0 +1,230 @@
+"""
+Move generation benchmark and correctness suite.
+Counts the complete turns reachable to a given depth from reference positions and compares them with known counts,
+then measures move generation speed per peon type and end of turn processing speed.
+
+eg: python perft.py --depth 3
+"""
+import argparse
+import sys
+import time
+
+import const
+from action import PASS
+from game_state import GameState
+from peons import PEONS
+
+# Reference positions, red to move, with the 4 default teams unless declared. Bodies are suffixed with '_dead'
+POSITIONS = {
+    'standard': None,
+    'surrounded_chief': (
+        "chief_green _ _ _ _ _ _ _ chief_yellow",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ necromobile_red _ _ _ _ _ _",
+        "_ _ _ militant_blue_dead _ reporter_yellow_dead _ _ _",
+        "_ _ _ militant_green_dead chief_blue militant_red_dead _ _ _",
+        "_ _ _ militant_blue_dead assassin_yellow_dead militant_green_dead _ _ _",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ _ _ _ _ _ militant_blue _",
+        "chief_red _ _ _ _ _ _ _ _",
+    ),
+    'necromobile_on_bodies': (
+        "chief_green _ _ _ _ _ _ _ chief_yellow",
+        "_ _ _ _ militant_yellow _ _ _ _",
+        "_ _ militant_green_dead _ _ _ diplomat_blue_dead _ _",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ militant_red_dead _ necromobile_red _ assassin_green_dead _ _",
+        "_ _ _ _ _ militant_red _ _ _",
+        "_ _ chief_blue_dead _ _ _ reporter_yellow_dead _ _",
+        "_ _ _ _ _ _ _ _ _",
+        "chief_red _ _ _ militant_blue_dead _ _ _ chief_blue",
+    ),
+    'reporter_kills': (
+        "chief_green _ _ _ _ _ _ _ chief_yellow",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ militant_blue _ _ _ militant_yellow _ _",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ _ _ reporter_red _ _ _ _",
+        "_ militant_green _ _ _ _ _ assassin_blue _",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ _ diplomat_yellow _ militant_green _ _ _",
+        "chief_red _ _ _ _ _ _ _ chief_blue",
+    ),
+    'diplomat_pushes': (
+        "chief_green _ _ _ _ _ _ _ chief_yellow",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ _ _ militant_yellow _ _ _ _",
+        "_ _ _ _ _ _ _ _ _",
+        "_ chief_blue _ _ diplomat_red _ _ necromobile_green _",
+        "_ _ _ _ _ _ _ _ _",
+        "_ _ assassin_green _ militant_red_dead _ _ _ _",
+        "_ _ _ _ _ _ _ _ _",
+        "chief_red _ _ _ reporter_yellow _ _ _ _",
+    ),
+    # Small enough to be counted by hand, see REFERENCE_COUNTS
+    'suffocation': (
+        "team red",
+        "team blue",
+        "chief_blue militant_blue_dead chief_red",
+        "militant_blue_dead _ militant_blue",
+        "_ _ militant_red",
+    ),
+}
+
+# Known-good number of complete turns reachable at depth 1, 2, 3...
+REFERENCE_COUNTS = {
+    'standard': (31, 1272, 53276),
+    'surrounded_chief': (176, 7595),
+    'necromobile_on_bodies': (507, 40896),
+    'reporter_kills': (188, 65050),
+    'diplomat_pushes': (676, 76489),
+    # Counted by hand from the rules, squares numbered 0-8 row by row :
+    # depth 1, red chief on 2 : 4 and 6, or kills the militant on 5 and places it on 2, 4, 6 or 7 = 6
+    #   red militant on 8 : 4, 6, 7, or kills on 5 or on 0 and places the body on 8, 4, 6 or 7 = 11
+    #   the blue chief dies when a body is placed on 4 (suffocated) or when it's killed on 0 : 6 finished games
+    # depth 2, the replies of blue to the 11 other turns : chief to 4 : 14, chief to 6 : 12,
+    #   chief kills on 5 then body on 2, 6, 7 : 5 + 5 + 5, militant to 7 : 12, militant to 6 : 9, militant to 4 : 14,
+    #   militant kills on 5 then body on 8, 6, 7 : 1 + 2 + 2, so 81 + 6 = 87
+    'suffocation': (17, 87),
+}
+
+
+def get_position(name):
+    """
+    :param name: key of POSITIONS
+    :return: GameState
+    """
+    lines = POSITIONS[name]
+    if lines is None:
+        return GameState.from_file('initial_board.txt')
+    return GameState.from_lines(lines)
+
+
+def perft(state, depth):
+    """
+    Count the complete turns reachable to the given depth, a finished game counts as a single node
+    :param state: GameState
+    :param depth:
+    :return: int
+    """
+    if depth == 0 or state.winner is not None:
+        return 1
+    nodes = 0
+    for action in state.legal_actions():
+        state.make_move(action)
+        nodes += perft(state, depth - 1)
+        state.unmake_move()
+    return nodes
+
+
+def collect_states(state, depth, states):
+    """
+    Append a copy of every position reachable to the given depth
+    :param state: GameState
+    :param depth:
+    :param states: list of tuple(cells bytes, team to move, teams alive)
+    """
+    states.append((bytes(state.cells), state.current_team, tuple(state.teams_alive)))
+    if depth == 0 or state.winner is not None:
+        return
+    for action in state.legal_actions():
+        state.make_move(action)
+        collect_states(state, depth - 1, states)
+        state.unmake_move()
+
+
+def load_position(state, position):
+    """
+    Replace the content of a scratch state with a position collected by collect_states
+    :param state: GameState
+    :param position: tuple(cells bytes, team to move, teams alive)
+    """
+    state.load(*position)
+
+
+def benchmark_peon_types(state, positions):
+    """
+    Generate the turns of every peon in every position, timed per peon type
+    :param state: GameState used as a scratch board
+    :param positions: positions collected by collect_states
+    :return: dict peon type name -> tuple(actions generated, seconds)
+    """
+    results = {}
+    for peon in PEONS[1:]:
+        count = 0
+        elapsed = 0.0
+        for position in positions:
+            load_position(state, position)
+            cells, team = state.cells, state.current_team
+            squares = [
+                square for square, cell in enumerate(cells)
+                if cell & const.CELL_TYPE_MASK == peon.code and not cell & const.CELL_DEAD
+                and cell >> const.CELL_TEAM_SHIFT == team
+            ]
+            empty_squares = [square for square, cell in enumerate(cells) if not cell]
+            started_at = time.perf_counter()
+            for square in squares:
+                for _ in peon.actions(state, square, empty_squares):
+                    count += 1
+            elapsed += time.perf_counter() - started_at
+        results[repr(peon)] = (count, elapsed)
+    return results
+
+
+def benchmark_next_turn(state, positions):
+    """
+    Time the end of turn processing (suffocation checks and team rotation) on every position
+    :param state: GameState used as a scratch board
+    :param positions: positions collected by collect_states
+    :return: tuple(end of turns processed, seconds)
+    """
+    elapsed = 0.0
+    for position in positions:
+        load_position(state, position)
+        started_at = time.perf_counter()
+        state.make_move(PASS)
+        state.unmake_move()
+        elapsed += time.perf_counter() - started_at
+    return len(positions), elapsed
+
+
+def rate(count, seconds):
+    return f"{count / seconds:,.0f}/s" if seconds else "-"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count and time Djambi move generation")
+    parser.add_argument('--depth', type=int, default=2, help="perft depth")
+    parser.add_argument('--positions', nargs='+', default=list(POSITIONS), choices=list(POSITIONS))
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for name in args.positions:
+        state = get_position(name)
+        for depth in range(1, args.depth + 1):
+            started_at = time.perf_counter()
+            nodes = perft(state, depth)
+            elapsed = time.perf_counter() - started_at
+            reference = REFERENCE_COUNTS.get(name, ())
+            if depth <= len(reference):
+                status = "ok" if reference[depth - 1] == nodes else f"MISMATCH, expected {reference[depth - 1]}"
+                failures += status != "ok"
+            else:
+                status = "no reference"
+            print(f"{name} depth {depth}: {nodes} nodes, {rate(nodes, elapsed)} ({status})")
+
+        positions = []
+        collect_states(state, min(args.depth - 1, 1), positions)
+        state = get_position(name)
+        for peon_type, (count, elapsed) in benchmark_peon_types(state, positions).items():
+            print(f"  {peon_type}: {count} turns generated, {rate(count, elapsed)}")
+        count, elapsed = benchmark_next_turn(state, positions)
+        print(f"  next_turn: {count} processed, {rate(count, elapsed)}")
+
+    if failures:
+        print(f"{failures} perft count(s) differ from the reference", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
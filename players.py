@@ -0,0 +1,352 @@
+import abc
+import random
+import time
+
+import const
+from evaluation import Evaluator
+from action import PASS
+from peons import PEONS, Reporter
+from utils import get_adjacent_alive_enemies
+from zobrist import TranspositionTable, TT_EXACT, TT_LOWER_BOUND, TT_UPPER_BOUND
+
+# Multi-player search algorithms
+# max^n : every team maximizes its own score
+SEARCH_MAXN = 'maxn'
+# paranoid : all other teams are assumed to play against the searching team, which allows alpha-beta pruning
+SEARCH_PARANOID = 'paranoid'
+
+# Score of the team that won the game
+WIN_SCORE = 1_000_000
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget is exhausted
+    """
+    pass
+
+
+class Player(abc.ABC):
+    """
+    A computer player, able to play any team
+    """
+    @abc.abstractmethod
+    def choose_action(self, state):
+        """
+        Return the complete turn to play for the current team of the state.
+        The state must be left as it was given.
+        :param state: GameState
+        :return: Action
+        """
+        pass
+
+
+class RandomPlayer(Player):
+    """
+    Play a uniformly random legal turn
+    """
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_action(self, state):
+        return self.rng.choice(list(state.legal_actions()))
+
+
+def evaluate(state):
+    """
+    Static evaluation of a position : the scores of the state evaluator if it has one (see evaluation.py),
+    otherwise the material of the alive peons of each team
+    :param state: GameState
+    :return: list of scores, indexed by team
+    """
+    winner = state.winner
+    if winner is not None:
+        scores = [0] * len(state.teams)
+        scores[winner] = WIN_SCORE
+        return scores
+    if state.evaluator is not None:
+        return state.evaluator.scores()
+    scores = [0] * len(state.teams)
+    for cell in state.cells:
+        if cell and not cell & const.CELL_DEAD:
+            scores[cell >> const.CELL_TEAM_SHIFT] += PEONS[cell & const.CELL_TYPE_MASK].value
+    return scores
+
+
+class SearchPlayer(Player):
+    """
+    Iterative deepening search with a wall-clock budget per move.
+    Each iteration searches one ply deeper, the best action of the last completed iteration is played.
+    Actions are ordered with the transposition table best action first, then kills of the most valuable peons.
+    """
+    def __init__(self, algorithm=SEARCH_PARANOID, time_limit=1.0, max_depth=32, tt_size=1 << 18, weights=None):
+        """
+        :param algorithm: SEARCH_MAXN or SEARCH_PARANOID
+        :param time_limit: seconds allowed per move
+        :param max_depth: maximum depth in plies (one ply is a complete turn of one team)
+        :param tt_size: number of entries of the transposition table
+        :param weights: evaluation weights, see evaluation.DEFAULT_WEIGHTS
+        """
+        if algorithm not in (SEARCH_MAXN, SEARCH_PARANOID):
+            raise ValueError(f"Unknown search algorithm {algorithm}")
+        self.algorithm = algorithm
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.tt_size = tt_size
+        self.weights = weights
+        # Optional callable checked with the clock, the search stops as if out of time when it returns True
+        self.should_stop = None
+        # Paranoid values depend on the searching team, keep a table per team
+        self._tables = {}
+        self._deadline = None
+        self.nodes = 0
+        self.depth_reached = 0
+
+    def _table(self, team):
+        key = team if self.algorithm == SEARCH_PARANOID else None
+        if key not in self._tables:
+            self._tables[key] = TranspositionTable(self.tt_size)
+        return self._tables[key]
+
+    def _check_clock(self):
+        """
+        Checked on every node : reading the clock is cheap next to generating the moves of a node,
+        and a few nodes of a big board are enough to overrun the budget
+        """
+        self.nodes += 1
+        if time.perf_counter() >= self._deadline or (self.should_stop is not None and self.should_stop()):
+            raise SearchTimeout()
+
+    def ordered_actions(self, state, first_action=None):
+        """
+        Generate the legal actions, most promising first : the given action, then the moves ordered by the value
+        of the peon they kill. The actions of a move (eg: every placement of the killed peon) are only generated
+        when the move is reached, so a node running out of time doesn't pay for the actions it never tries.
+        :param state: GameState
+        :param first_action: action to try first, usually the best one from the transposition table
+        :return: generator of Action
+        """
+        if state.state != const.BOARD_STATE_STANDARD or state.winner is not None:
+            return
+        cells = state.cells
+        team = state.current_team
+        empty_squares = [square for square, cell in enumerate(cells) if not cell]
+
+        def victim_value(square):
+            cell = cells[square]
+            if not cell or cell & const.CELL_DEAD:
+                return 0
+            return PEONS[cell & const.CELL_TYPE_MASK].value
+
+        # tuple(victim value, origin, destination) of every move of the team
+        moves = []
+        for origin in state.peon_squares(team=team):
+            if cells[origin] & const.CELL_DEAD:
+                continue
+            peon = PEONS[cells[origin] & const.CELL_TYPE_MASK]
+            for destination in peon.available_moves(state, origin):
+                if peon.code == Reporter.code:
+                    # A reporter kills one of the enemies around its destination
+                    value = max(map(victim_value, get_adjacent_alive_enemies(state, destination, team)), default=0)
+                else:
+                    value = victim_value(destination)
+                moves.append((value, origin, destination))
+        if not moves:
+            yield PASS
+            return
+        moves.sort(key=lambda move: move[0], reverse=True)
+
+        def destination_actions(origin, destination):
+            actions = PEONS[cells[origin] & const.CELL_TYPE_MASK].destination_actions(
+                state, origin, destination, empty_squares
+            )
+            if cells[origin] & const.CELL_TYPE_MASK == Reporter.code:
+                # The most valuable target first
+                return sorted(
+                    actions, key=lambda action: victim_value(action.target) if action.target is not None else 0,
+                    reverse=True
+                )
+            return actions
+
+        # Guard against hash collisions too, the first action must be legal
+        if first_action is not None and any(
+            (origin, destination) == (first_action.origin, first_action.destination) for _, origin, destination in moves
+        ) and first_action in destination_actions(first_action.origin, first_action.destination):
+            yield first_action
+        else:
+            first_action = None
+        for _, origin, destination in moves:
+            for action in destination_actions(origin, destination):
+                if action != first_action:
+                    yield action
+
+    def choose_action(self, state):
+        # The leaves are evaluated incrementally during the search, unless the caller already did attach an evaluator
+        evaluator = Evaluator(state, self.weights) if state.evaluator is None else None
+        try:
+            return self._search(state)
+        finally:
+            if evaluator is not None:
+                evaluator.detach()
+
+    def _search(self, state):
+        self._deadline = time.perf_counter() + self.time_limit
+        self.nodes = 0
+        self.depth_reached = 0
+        root_team = state.current_team
+        table = self._table(root_team)
+        table.new_search()
+
+        best_action = None
+        for depth in range(1, self.max_depth + 1):
+            try:
+                if self.algorithm == SEARCH_MAXN:
+                    action = self._maxn_root(state, depth, table, best_action)
+                else:
+                    action = self._paranoid_root(state, depth, table, root_team, best_action)
+            except SearchTimeout as timeout:
+                # Keep the partial result if at least one action was fully searched at this depth,
+                # the previous best action is always searched first so the partial result is never worse
+                if timeout.args and timeout.args[0] is not None:
+                    best_action = timeout.args[0]
+                break
+            best_action = action
+            self.depth_reached = depth
+            if state.winner is not None or time.perf_counter() >= self._deadline:
+                break
+        if best_action is None:
+            best_action = next(state.legal_actions())
+        return best_action
+
+    def predicted_continuation(self, state, team, max_plies=None):
+        """
+        Turns expected from the other teams until the given team plays again,
+        following the best actions stored in the transposition table by the previous searches,
+        or the first ordered action past the searched depth
+        :param state: GameState, left as it was given
+        :param team: team index of the searching team
+        :param max_plies: defaults to the number of teams
+        :return: list(Action), empty if the team doesn't play again within max_plies
+        """
+        table = self._table(team)
+        actions = []
+        for _ in range(max_plies or len(state.teams)):
+            if state.current_team == team or state.winner is not None:
+                break
+            entry = table.probe(state.hash)
+            legal_actions = list(self.ordered_actions(state))
+            action = entry.action if entry is not None else None
+            # Guard against hash collisions too
+            if action not in legal_actions:
+                action = legal_actions[0]
+            state.make_move(action)
+            actions.append(action)
+        complete = state.current_team == team and state.winner is None
+        for _ in actions:
+            state.unmake_move()
+        return actions if complete and actions else []
+
+    def _maxn_root(self, state, depth, table, previous_best):
+        team = state.current_team
+        best_action, best_value = None, None
+        for action in self.ordered_actions(state, previous_best):
+            state.make_move(action)
+            try:
+                value = self._maxn(state, depth - 1, table)
+            except SearchTimeout:
+                raise SearchTimeout(best_action)
+            finally:
+                state.unmake_move()
+            if best_value is None or value[team] > best_value[team]:
+                best_action, best_value = action, value
+        table.store(state.hash, depth, best_value, TT_EXACT, best_action)
+        return best_action
+
+    def _maxn(self, state, depth, table):
+        """
+        :return: tuple of the values of each team
+        """
+        self._check_clock()
+        if depth == 0 or state.winner is not None:
+            return tuple(evaluate(state))
+        entry = table.probe(state.hash)
+        if entry is not None and entry.depth >= depth:
+            return entry.value
+        team = state.current_team
+        best_action, best_value = None, None
+        for action in self.ordered_actions(state, entry.action if entry else None):
+            state.make_move(action)
+            try:
+                value = self._maxn(state, depth - 1, table)
+            finally:
+                state.unmake_move()
+            if best_value is None or value[team] > best_value[team]:
+                best_action, best_value = action, value
+        table.store(state.hash, depth, best_value, TT_EXACT, best_action)
+        return best_value
+
+    def _paranoid_root(self, state, depth, table, root_team, previous_best):
+        alpha, beta = -float('inf'), float('inf')
+        best_action = None
+        for action in self.ordered_actions(state, previous_best):
+            state.make_move(action)
+            try:
+                value = self._paranoid(state, depth - 1, alpha, beta, table, root_team)
+            except SearchTimeout:
+                raise SearchTimeout(best_action)
+            finally:
+                state.unmake_move()
+            if value > alpha or best_action is None:
+                best_action, alpha = action, value
+        table.store(state.hash, depth, alpha, TT_EXACT, best_action)
+        return best_action
+
+    def _paranoid(self, state, depth, alpha, beta, table, root_team):
+        """
+        Alpha-beta search where the root team maximizes its score and every other team minimizes it
+        :return: value for the root team
+        """
+        self._check_clock()
+        if depth == 0 or state.winner is not None:
+            scores = evaluate(state)
+            others = [score for team, score in enumerate(scores) if team != root_team]
+            return scores[root_team] - sum(others) / len(others)
+
+        entry = table.probe(state.hash)
+        if entry is not None and entry.depth >= depth:
+            if entry.flag == TT_EXACT:
+                return entry.value
+            if entry.flag == TT_LOWER_BOUND and entry.value >= beta:
+                return entry.value
+            if entry.flag == TT_UPPER_BOUND and entry.value <= alpha:
+                return entry.value
+
+        original_alpha, original_beta = alpha, beta
+        maximizing = state.current_team == root_team
+        best_action = None
+        best_value = -float('inf') if maximizing else float('inf')
+        for action in self.ordered_actions(state, entry.action if entry else None):
+            state.make_move(action)
+            try:
+                value = self._paranoid(state, depth - 1, alpha, beta, table, root_team)
+            finally:
+                state.unmake_move()
+            if maximizing:
+                if value > best_value:
+                    best_action, best_value = action, value
+                alpha = max(alpha, value)
+            else:
+                if value < best_value:
+                    best_action, best_value = action, value
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = TT_UPPER_BOUND
+        elif best_value >= original_beta:
+            flag = TT_LOWER_BOUND
+        else:
+            flag = TT_EXACT
+        table.store(state.hash, depth, best_value, flag, best_action)
+        return best_value
@@ -0,0 +1,357 @@
+"""
+Compact binary encoding of positions and append-only game record files.
+
+Position : rows, cols, team to move, surviving teams bit mask, then one byte per square (the cell code).
+Turn : origin, destination, placement and target squares as 4 unsigned shorts, NO_SQUARE when unused.
+
+Record file : a header with the names and hex colors of the teams, each one as a length-prefixed utf-8 string,
+then one block per game
+- game header : number of turns, winner team index (-1 if none), size of the initial position
+- the initial position
+- the turns, fixed size so any ply can be reached without decoding the previous ones
+Games are streamed : the header is written with IN_PROGRESS turns when the game begins, then each turn is appended
+as it's played and the header is patched when the game ends. The turns of a game interrupted by a crash are counted
+from the file size, and the game is closed with no winner by the next writer.
+"""
+import mmap
+import os
+import struct
+
+from action import Action
+from game_state import GameState
+from team import Team
+
+MAGIC = b'DJMB'
+VERSION = 2
+NO_SQUARE = 0xFFFF
+
+FILE_HEADER = struct.Struct('<4sBB')
+POSITION_HEADER = struct.Struct('<BBBH')
+GAME_HEADER = struct.Struct('<IbH')
+TURN = struct.Struct('<4H')
+
+# Number of turns in the header of a game still being written
+IN_PROGRESS = 0xFFFFFFFF
+
+
+def encode_position(state):
+    """
+    :param state: GameState, between two turns
+    :return: bytes
+    """
+    teams_alive_mask = 0
+    for team in state.teams_alive:
+        teams_alive_mask |= 1 << team
+    return POSITION_HEADER.pack(state.rows, state.cols, state.current_team, teams_alive_mask) + bytes(state.cells)
+
+
+def decode_position(data, teams, offset=0):
+    """
+    :param data: bytes-like containing an encoded position
+    :param teams: list[Team]
+    :param offset: start of the position in data
+    :return: GameState
+    """
+    rows, cols, current_team, teams_alive_mask = POSITION_HEADER.unpack_from(data, offset)
+    start = offset + POSITION_HEADER.size
+    state = GameState(rows, cols, teams)
+    state.load(
+        data[start:start + rows * cols], current_team,
+        [team for team in range(len(teams)) if teams_alive_mask & 1 << team]
+    )
+    return state
+
+
+def encode_action(action):
+    """
+    :param action: Action
+    :return: bytes
+    """
+    return TURN.pack(*(NO_SQUARE if square is None else square for square in action))
+
+
+def decode_action(data, offset=0):
+    """
+    :param data: bytes-like containing an encoded action
+    :param offset: start of the action in data
+    :return: Action
+    """
+    return Action(*(None if square == NO_SQUARE else square for square in TURN.unpack_from(data, offset)))
+
+
+def encode_file_header(teams):
+    """
+    :param teams: list[Team]
+    :return: bytes
+    """
+    strings = b''.join(
+        struct.pack('<B', len(string)) + string
+        for team in teams for string in (team.color.encode(), team.hex_color.encode())
+    )
+    return FILE_HEADER.pack(MAGIC, VERSION, len(teams)) + strings
+
+
+def encode_game(initial_position, actions, winner):
+    """
+    Encode a whole game block, eg: in a worker process before sending it to the writer
+    :param initial_position: bytes from encode_position
+    :param actions: list[Action]
+    :param winner: team index or None
+    :return: bytes
+    """
+    return b''.join((
+        GAME_HEADER.pack(len(actions), -1 if winner is None else winner, len(initial_position)),
+        initial_position,
+        *(encode_action(action) for action in actions),
+    ))
+
+
+class GameRecordWriter:
+    """
+    Append games to a record file, each turn is written as soon as it's played
+    eg:
+    with GameRecordWriter('games.djr', teams) as writer:
+        writer.begin_game(state)
+        writer.add_turn(action)
+        writer.end_game(state.winner)
+    """
+    def __init__(self, path, teams):
+        """
+        :param path: file path, created if it doesn't exist
+        :param teams: list[Team], must match the teams of an existing file
+        """
+        self.teams = teams
+        header = encode_file_header(teams)
+        # Not opened in append mode, the header of the game in progress is patched when it ends
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        existing_header = self.file.read(len(header))
+        if not existing_header:
+            self.file.write(header)
+        elif existing_header != header:
+            self.file.close()
+            raise ValueError(f"{path} is not a game record of teams {teams}")
+        else:
+            self._recover()
+        self.file.flush()
+        # Start of the game in progress, and its header values
+        self._game_offset = None
+        self._position_size = 0
+        self._plies = 0
+
+    def _recover(self):
+        """
+        Close the game left in progress by a crashed writer, with no winner, and drop any partly written data
+        """
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            games, end = index_games(data, len(encode_file_header(self.teams)))
+            interrupted = None
+            if games and GAME_HEADER.unpack_from(data, games[-1][0])[0] == IN_PROGRESS:
+                offset, plies = games[-1]
+                interrupted = (offset, GAME_HEADER.pack(plies, -1, GAME_HEADER.unpack_from(data, offset)[2]))
+        if interrupted is not None:
+            self.file.seek(interrupted[0])
+            self.file.write(interrupted[1])
+        self.file.truncate(end)
+        self.file.seek(end)
+
+    def begin_game(self, state):
+        """
+        Write the header and the initial position of a game
+        :param state: GameState in its initial position
+        """
+        if self._game_offset is not None:
+            raise ValueError("The previous game isn't ended")
+        position = encode_position(state)
+        self._game_offset = self.file.seek(0, os.SEEK_END)
+        self._position_size = len(position)
+        self._plies = 0
+        self.file.write(GAME_HEADER.pack(IN_PROGRESS, -1, len(position)) + position)
+        self.file.flush()
+
+    def add_turn(self, action):
+        """
+        Append a turn to the game in progress
+        :param action: Action played
+        """
+        self.file.write(encode_action(action))
+        self.file.flush()
+        self._plies += 1
+
+    def end_game(self, winner):
+        """
+        Write the number of turns and the winner in the game header
+        :param winner: team index or None
+        """
+        self.file.seek(self._game_offset)
+        self.file.write(GAME_HEADER.pack(self._plies, -1 if winner is None else winner, self._position_size))
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+        self._game_offset = None
+
+    def write_encoded_game(self, data):
+        """
+        :param data: bytes from encode_game
+        """
+        if self._game_offset is not None:
+            raise ValueError("A game is in progress")
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def index_games(data, offset):
+    """
+    Walk the game blocks of a record file
+    :param data: bytes-like content of the file
+    :param offset: end of the file header
+    :return: tuple(list of tuple(game offset, number of turns), end of the last game)
+    """
+    games = []
+    end = len(data)
+    while offset + GAME_HEADER.size <= end:
+        plies, _, position_size = GAME_HEADER.unpack_from(data, offset)
+        turns_offset = offset + GAME_HEADER.size + position_size
+        # Ignore a truncated last game
+        if turns_offset > end:
+            break
+        if plies == IN_PROGRESS:
+            # Only the last game can be in progress, its complete turns are kept
+            plies = (end - turns_offset) // TURN.size
+            games.append((offset, plies))
+            offset = turns_offset + plies * TURN.size
+            break
+        if turns_offset + plies * TURN.size > end:
+            break
+        games.append((offset, plies))
+        offset = turns_offset + plies * TURN.size
+    return games, offset
+
+
+class GameRecord:
+    """
+    A game of a record file, decoded on demand
+    """
+    def __init__(self, data, offset, teams, plies=None):
+        """
+        :param data: memory map of the file
+        :param offset: start of the game block
+        :param teams: list[Team]
+        :param plies: number of turns of a game in progress
+        """
+        self.data = data
+        self.teams = teams
+        self.plies, winner, position_size = GAME_HEADER.unpack_from(data, offset)
+        # Turns played so far of a game still in progress
+        self.in_progress = self.plies == IN_PROGRESS
+        if self.in_progress:
+            self.plies = plies
+        self.winner = None if winner < 0 else winner
+        self._position_offset = offset + GAME_HEADER.size
+        self._turns_offset = self._position_offset + position_size
+        # State of the last call to state_at() and its ply
+        self._replay = None
+        self._replay_ply = 0
+
+    def __len__(self):
+        return self.plies
+
+    def initial_state(self):
+        """
+        :return: GameState in the initial position of the game
+        """
+        return decode_position(self.data, self.teams, self._position_offset)
+
+    def action(self, ply):
+        """
+        :param ply: index of the turn
+        :return: Action
+        """
+        if not 0 <= ply < self.plies:
+            raise IndexError(ply)
+        return decode_action(self.data, self._turns_offset + ply * TURN.size)
+
+    def actions(self):
+        for ply in range(self.plies):
+            yield self.action(ply)
+
+    def state_at(self, ply):
+        """
+        The position of the previous call is kept : a later ply is replayed from there, so walking the plies in order
+        costs one turn per ply. An earlier ply is replayed from the initial position.
+        :param ply: number of turns played
+        :return: new GameState after ply turns
+        """
+        if not 0 <= ply <= self.plies:
+            raise IndexError(ply)
+        if self._replay is None or ply < self._replay_ply:
+            self._replay = self.initial_state()
+            self._replay_ply = 0
+        for index in range(self._replay_ply, ply):
+            self._replay.play(self.action(index))
+        self._replay_ply = ply
+        # The replayed state stays private, it's continued by the next call
+        return decode_position(encode_position(self._replay), self.teams)
+
+
+class GameRecordReader:
+    """
+    Read a record file through a memory map.
+    Opening it only walks the games headers to index them, turns are decoded when accessed.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = None
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, teams_count = FILE_HEADER.unpack_from(self.data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a game record file of version {VERSION}")
+            offset = FILE_HEADER.size
+            strings = []
+            for _ in range(teams_count * 2):
+                size = self.data[offset]
+                strings.append(bytes(self.data[offset + 1:offset + 1 + size]).decode())
+                offset += 1 + size
+        except (ValueError, IndexError, struct.error):
+            # Also raised by mmap for an empty file
+            self.close()
+            raise
+        # Names and colors alternate
+        self.teams = [Team(name, hex_color) for name, hex_color in zip(strings[::2], strings[1::2])]
+
+        self._games, _ = index_games(self.data, offset)
+
+    def __len__(self):
+        return len(self._games)
+
+    def __getitem__(self, index):
+        """
+        :param index: game index
+        :return: GameRecord
+        """
+        offset, plies = self._games[index]
+        return GameRecord(self.data, offset, self.teams, plies)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,327 @@
+"""
+Asyncio server hosting many concurrent headless games.
+
+Messages are binary frames : message size (unsigned short), message type (byte), payload.
+Client messages :
+- CREATE : create a game from the layout of the server, answered by GAME
+- JOIN : game id (uint), team index (byte, SPECTATOR to only watch), answered by POSITION
+- TURN : game id, encoded Action (see record.encode_action), played for the team of the client
+- ADD_BOT : game id, team index, bot type length (byte) and name, a computer player takes the seat
+- GET_PLY : game id, ply (uint), answered by PLY_POSITION
+Server messages :
+- GAME : game id
+- POSITION : game id, encoded position (see record.encode_position)
+- CHANGES : game id, ply (uint), team to move (byte), teams alive mask (ushort), changed cells count (ushort),
+  then for each changed cell its square (ushort) and code (byte)
+- ERROR : utf-8 message
+- PLY_POSITION : game id, ply (uint), encoded position of the game after that many turns
+
+Bots think in a process pool so the event loop is never blocked by a search.
+The pool task lives in simulate so the workers never import asyncio.
+A bot which fails to choose a turn plays the first legal one instead.
+
+Games are forgotten once every client which created, played or watched them is disconnected,
+finished games stay until then so their plies can still be requested.
+A client which doesn't read its messages fast enough is disconnected once MAX_WRITE_BUFFER bytes are waiting.
+
+eg: python server.py --port 8765 --workers 8
+"""
+import argparse
+import asyncio
+import itertools
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+from game_state import GameState
+from history import encode_snapshot, GameHistory
+from record import decode_action, encode_position, TURN
+from simulate import choose_bot_action, PLAYER_TYPES
+
+FRAME_HEADER = struct.Struct('<HB')
+
+# Client messages
+MESSAGE_CREATE = 0x01
+MESSAGE_JOIN = 0x02
+MESSAGE_TURN = 0x03
+MESSAGE_ADD_BOT = 0x04
+MESSAGE_GET_PLY = 0x05
+
+# Server messages
+MESSAGE_GAME = 0x81
+MESSAGE_POSITION = 0x82
+MESSAGE_CHANGES = 0x83
+MESSAGE_ERROR = 0x84
+MESSAGE_PLY_POSITION = 0x85
+
+SPECTATOR = 0xFF
+
+# Bytes waiting to be sent to a client before it's considered too slow and disconnected
+MAX_WRITE_BUFFER = 1 << 20
+
+GAME_ID = struct.Struct('<I')
+JOIN = struct.Struct('<IB')
+GAME_PLY = struct.Struct('<II')
+CHANGES_HEADER = struct.Struct('<IIBHH')
+CHANGED_CELL = struct.Struct('<HB')
+
+
+class ProtocolError(Exception):
+    """
+    Invalid message from a client, sent back to it as an ERROR message
+    """
+    pass
+
+
+def frame(message_type, payload=b''):
+    return FRAME_HEADER.pack(len(payload) + 1, message_type) + payload
+
+
+class Connection:
+    """
+    A connected client
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        # game id -> team index played by this client in the game, SPECTATOR if only watching
+        self.seats = {}
+        # ids of the games created by this client
+        self.created = set()
+
+    def send(self, message_type, payload=b''):
+        self.write(frame(message_type, payload))
+
+    def write(self, data):
+        """
+        Queue data for the client, closing the connection if too much is already waiting :
+        a slow client must not make the server buffer every message of its games
+        :param data: bytes
+        """
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() + len(data) > MAX_WRITE_BUFFER:
+            self.writer.close()
+            return
+        self.writer.write(data)
+
+
+class HostedGame:
+    """
+    A game hosted by the server, with the connections playing or watching it
+    """
+    def __init__(self, game_id, state):
+        self.game_id = game_id
+        self.state = state
+        self.ply = 0
+        self.connections = set()
+        # team index -> Connection playing it
+        self.players = {}
+        # team index -> bot type
+        self.bots = {}
+        self.bot_thinking = False
+        # Snapshot of every ply, sharing the unchanged rows
+        self.history = GameHistory(state)
+        state.pop_dirty_squares()
+
+    def changes_message(self):
+        """
+        :return: CHANGES payload of the squares changed since the last call
+        """
+        state = self.state
+        squares = sorted(state.pop_dirty_squares())
+        teams_alive_mask = sum(1 << team for team in state.teams_alive)
+        return CHANGES_HEADER.pack(
+            self.game_id, self.ply, state.current_team, teams_alive_mask, len(squares)
+        ) + b''.join(CHANGED_CELL.pack(square, state.cells[square]) for square in squares)
+
+    def release(self, team, connection):
+        """
+        Free the seat of a team if it's played by the connection
+        :param team: team index or SPECTATOR
+        :param connection: Connection
+        """
+        if self.players.get(team) is connection:
+            del self.players[team]
+
+    def broadcast(self, message_type, payload):
+        data = frame(message_type, payload)
+        for connection in self.connections:
+            connection.write(data)
+
+
+class GameServer:
+    """
+    Hosts the games and dispatches the clients messages
+    """
+    def __init__(self, layout='initial_board.txt', workers=None, bot_time_limit=1.0, book=None):
+        """
+        :param layout: initial board file of the created games
+        :param workers: number of processes used by the bots
+        :param bot_time_limit: seconds per move of the bots
+        :param book: optional opening book file path, looked up by the bots before searching
+        """
+        self.layout = layout
+        self.games = {}
+        self._game_ids = itertools.count(1)
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.bot_time_limit = bot_time_limit
+        self.book = book
+
+    async def handle_connection(self, reader, writer):
+        connection = Connection(writer)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                size, message_type = FRAME_HEADER.unpack(header)
+                if not size:
+                    break
+                payload = await reader.readexactly(size - 1)
+                try:
+                    self.handle_message(connection, message_type, payload)
+                except (ProtocolError, struct.error) as error:
+                    connection.send(MESSAGE_ERROR, str(error).encode())
+                # Closed when it was too slow to read its messages
+                if writer.is_closing():
+                    break
+                await writer.drain()
+        finally:
+            for game_id, team in connection.seats.items():
+                game = self.games.get(game_id)
+                if game is not None:
+                    game.connections.discard(connection)
+                    game.release(team, connection)
+            # Abandoned games, including the ones created but never joined
+            for game_id in connection.seats.keys() | connection.created:
+                game = self.games.get(game_id)
+                if game is not None and not game.connections:
+                    del self.games[game_id]
+            writer.close()
+
+    def handle_message(self, connection, message_type, payload):
+        if message_type == MESSAGE_CREATE:
+            game_id = next(self._game_ids)
+            self.games[game_id] = HostedGame(
+                game_id, GameState.from_file(self.layout)
+            )
+            connection.created.add(game_id)
+            connection.send(MESSAGE_GAME, GAME_ID.pack(game_id))
+        elif message_type == MESSAGE_JOIN:
+            game_id, team = JOIN.unpack(payload)
+            game = self.get_game(game_id)
+            if team != SPECTATOR and (
+                team >= len(game.state.teams) or team in game.bots
+                or game.players.get(team, connection) is not connection
+            ):
+                raise ProtocolError(f"Team {team} can't be joined")
+            # A client joining again leaves its previous seat
+            if game_id in connection.seats:
+                game.release(connection.seats[game_id], connection)
+            if team != SPECTATOR:
+                game.players[team] = connection
+            connection.seats[game_id] = team
+            game.connections.add(connection)
+            connection.send(MESSAGE_POSITION, GAME_ID.pack(game_id) + encode_position(game.state))
+        elif message_type == MESSAGE_TURN:
+            game_id = GAME_ID.unpack_from(payload)[0]
+            game = self.get_game(game_id)
+            if connection.seats.get(game_id) != game.state.current_team or game.state.current_team in game.bots:
+                raise ProtocolError("Not your turn")
+            action = decode_action(payload, GAME_ID.size)
+            if payload[GAME_ID.size + TURN.size:] or not any(
+                legal == action for legal in game.state.legal_actions()
+            ):
+                raise ProtocolError(f"Illegal turn {action}")
+            self.play(game, action)
+        elif message_type == MESSAGE_ADD_BOT:
+            game_id, team = JOIN.unpack_from(payload)
+            game = self.get_game(game_id)
+            if len(payload) < JOIN.size + 1 or len(payload) != JOIN.size + 1 + payload[JOIN.size]:
+                raise ProtocolError("Invalid bot type length")
+            try:
+                bot_type = payload[JOIN.size + 1:].decode()
+            except UnicodeDecodeError:
+                raise ProtocolError("Bot type isn't valid utf-8")
+            if bot_type not in PLAYER_TYPES or team >= len(game.state.teams) or team in game.players:
+                raise ProtocolError(f"Can't add bot {bot_type} as team {team}")
+            game.bots[team] = bot_type
+            self.schedule_bot(game)
+        elif message_type == MESSAGE_GET_PLY:
+            game_id, ply = GAME_PLY.unpack(payload)
+            game = self.get_game(game_id)
+            if ply > game.history.last_ply:
+                raise ProtocolError(f"Game {game_id} has no ply {ply}")
+            connection.send(MESSAGE_PLY_POSITION, GAME_PLY.pack(game_id, ply) + encode_snapshot(game.history[ply]))
+        else:
+            raise ProtocolError(f"Unknown message type {message_type}")
+
+    def get_game(self, game_id):
+        try:
+            return self.games[game_id]
+        except KeyError:
+            raise ProtocolError(f"Unknown game {game_id}")
+
+    def play(self, game, action):
+        """
+        Play a turn and push the changed squares to the players and spectators
+        """
+        game.state.play(action)
+        game.history.commit(action)
+        game.ply += 1
+        game.broadcast(MESSAGE_CHANGES, game.changes_message())
+        self.schedule_bot(game)
+
+    def schedule_bot(self, game):
+        """
+        Start the bot of the team to move if there's one, in the process pool
+        """
+        state = game.state
+        if game.bot_thinking or state.winner is not None or state.current_team not in game.bots:
+            return
+        game.bot_thinking = True
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, choose_bot_action,
+            encode_position(state), [team.color for team in state.teams], game.bots[state.current_team],
+            self.bot_time_limit, game.ply, self.book
+        )
+        future.add_done_callback(lambda done: self.bot_done(game, done))
+
+    def bot_done(self, game, future):
+        game.bot_thinking = False
+        # The game was abandoned while the bot was thinking
+        if self.games.get(game.game_id) is not game:
+            return
+        if future.exception() is not None:
+            # Don't let the game wait forever for the bot, PASS is only legal when the team can't move
+            game.broadcast(MESSAGE_ERROR, f"Bot failed : {future.exception()}, playing its first legal turn".encode())
+            self.play(game, next(game.state.legal_actions()))
+            return
+        self.play(game, decode_action(future.result()))
+
+    async def serve(self, host=None, port=None, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host headless Djambi games")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None, help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--layout', default='initial_board.txt', help="layout file of the games")
+    parser.add_argument('--workers', type=int, default=None, help="bot processes, defaults to the CPU count")
+    parser.add_argument('--bot-time-limit', type=float, default=1.0, help="seconds per move of the bots")
+    parser.add_argument('--book', default=None, help="opening book file of the bots, see book.py")
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.layout, args.workers, args.bot_time_limit, args.book)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Play headless games between computer players, spread over a process pool.
+Each finished game is appended as a JSON line to the output file.
+
+eg: python simulate.py --games 1000 --players random --workers 8 --output results.jsonl
+"""
+import os
+import sys
+import time
+
+from game_state import GameState
+from layout import load_layout
+from players import RandomPlayer, SearchPlayer, SEARCH_MAXN, SEARCH_PARANOID
+from record import GameRecordWriter, decode_position, encode_action, encode_game, encode_position
+from team import Team
+
+PLAYER_TYPES = ('random', SEARCH_PARANOID, SEARCH_MAXN, 'mcts')
+
+
+def player_factory(player_type: str, seed, time_limit, book=None):
+    """
+    Initialize a computer player given the string representing its type
+    :param player_type: one of PLAYER_TYPES
+    :param seed: seed of the player random generator
+    :param time_limit: seconds per move for searching players
+    :param book: optional opening book file path, looked up before searching
+    :return: Player
+    """
+    if book:
+        from book import BookPlayer
+
+        return BookPlayer(player_factory(player_type, seed, time_limit), book)
+    if player_type == 'random':
+        return RandomPlayer(seed)
+    if player_type in (SEARCH_PARANOID, SEARCH_MAXN):
+        return SearchPlayer(player_type, time_limit=time_limit)
+    if player_type == 'mcts':
+        from mcts import MCTSPlayer
+
+        return MCTSPlayer(time_limit=time_limit, seed=seed)
+    raise ValueError(f"Unknown player type {player_type}")
+
+
+def play_game(layout, players, max_plies, actions=None):
+    """
+    Play a game until a team wins or max_plies complete turns are played
+    :param layout: file path of the initial board
+    :param players: list[Player] indexed by team
+    :param max_plies:
+    :param actions: optional list the played actions are appended to
+    :return: tuple(winner team index or None, plies)
+    """
+    state = GameState.from_file(layout)
+    plies = 0
+    while state.winner is None and plies < max_plies:
+        action = players[state.current_team].choose_action(state)
+        state.play(action)
+        if actions is not None:
+            actions.append(action)
+        plies += 1
+    return state.winner, plies
+
+
+def run_game(args):
+    """
+    Pool task : play one game with its own deterministic seed
+    :param args: tuple(game index, seed, layout, player types, time limit, max plies, record, book, profile, trace)
+    :return: tuple(dict result of the game, encoded game if record else None)
+    """
+    index, seed, layout, player_types, time_limit, max_plies, record, book, profile, trace = args
+    if profile:
+        import instrumentation
+
+        instrumentation.reset()
+        # One trace file per worker process, they can't share a file
+        instrumentation.enable(f"{trace}.{os.getpid()}" if trace else None)
+    players = [
+        player_factory(player_type, seed * len(player_types) + seat, time_limit, book)
+        for seat, player_type in enumerate(player_types)
+    ]
+    actions = [] if record else None
+    started_at = time.perf_counter()
+    winner, plies = play_game(layout, players, max_plies, actions)
+    duration = time.perf_counter() - started_at
+    encoded_game = None
+    if record:
+        initial_position = encode_position(GameState.from_file(layout))
+        encoded_game = encode_game(initial_position, actions, winner)
+    result = {
+        'game': index,
+        'seed': seed,
+        'players': list(player_types),
+        'winner': load_layout(layout).team_colors[winner][0] if winner is not None else None,
+        'plies': plies,
+        'duration': round(duration, 6),
+    }
+    if profile:
+        instrumentation.disable()
+        result['profile'] = instrumentation.summary()
+    return result, encoded_game
+
+
+def choose_bot_action(position, colors, bot_type, time_limit, seed, book=None):
+    """
+    Process pool task of the server : let a computer player choose the next turn of a position
+    :param position: bytes from record.encode_position
+    :param colors: names of the teams of the game
+    :param bot_type: one of PLAYER_TYPES
+    :param time_limit: seconds per move
+    :param seed:
+    :param book: optional opening book file path, mapped once per worker process
+    :return: bytes from record.encode_action
+    """
+    state = decode_position(position, [Team(color) for color in colors])
+    return encode_action(player_factory(bot_type, seed, time_limit, book).choose_action(state))
+
+
+def main(argv=None):
+    # Only needed by the parent process, the workers import this module for run_game
+    import argparse
+    import json
+    from multiprocessing import Pool
+
+    parser = argparse.ArgumentParser(description="Play headless Djambi games between computer players")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--layout', default='initial_board.txt', help="initial board file")
+    parser.add_argument(
+        '--players', nargs='+', default=['random'], choices=PLAYER_TYPES,
+        help="player type of each seat, a single type is used for every seat"
+    )
+    parser.add_argument('--time-limit', type=float, default=0.1, help="seconds per move of searching players")
+    parser.add_argument('--max-plies', type=int, default=500, help="games are drawn after this many turns")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the CPU count")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game, next games use seed + index")
+    parser.add_argument('--output', default='results.jsonl', help="JSON lines file the results are appended to")
+    parser.add_argument('--record', default=None, help="binary game record file the games are appended to")
+    parser.add_argument('--book', default=None, help="opening book file the players look up before searching")
+    parser.add_argument('--profile', action='store_true', help="add the instrumentation summary to each result")
+    parser.add_argument(
+        '--trace', default=None,
+        help="prefix of the sampled instrumentation trace files, one per worker process, implies --profile"
+    )
+    args = parser.parse_args(argv)
+
+    teams = load_layout(args.layout).get_teams()
+    player_types = args.players
+    if len(player_types) == 1:
+        player_types = player_types * len(teams)
+    if len(player_types) != len(teams):
+        parser.error(f"--players expects 1 or {len(teams)} player types")
+
+    tasks = [
+        (
+            index, args.seed + index, args.layout, player_types, args.time_limit, args.max_plies,
+            bool(args.record), args.book, args.profile or bool(args.trace), args.trace,
+        )
+        for index in range(args.games)
+    ]
+    started_at = time.perf_counter()
+    finished = 0
+    record = GameRecordWriter(args.record, teams) if args.record else None
+    with Pool(args.workers) as pool, open(args.output, 'a') as output:
+        for result, encoded_game in pool.imap_unordered(run_game, tasks):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            if record:
+                record.write_encoded_game(encoded_game)
+            finished += 1
+    if record:
+        record.close()
+    elapsed = time.perf_counter() - started_at
+    print(f"{finished} games in {elapsed:.2f}s : {finished / elapsed:.2f} games/sec", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
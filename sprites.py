@@ -0,0 +1,178 @@
+"""
+Process-wide store of the peon icons.
+
+Every icon of the sprites directory is packed once into a single atlas, then scaled as a whole strip per cell size.
+Scaled strips are cached on disk, keyed by the hash of the source files and the size, so the next runs skip the PNG
+decoding and resizing of the full size icons.
+Only the most recently used sizes are kept in memory.
+
+eg: image = get_sprites().image('assets/icons/chief.png', (62, 62))
+"""
+import collections
+import hashlib
+import os
+
+import const
+
+SPRITES_DIRECTORY = 'assets/icons'
+BLANK_SPRITE = os.path.join(SPRITES_DIRECTORY, 'blank.png')
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.sprite_cache')
+
+# Number of cell sizes kept in memory, eg: the current and the previous size while the window is resized
+MAX_CACHED_SIZES = 2
+
+
+class SpriteStore:
+    """
+    Sprites of a directory, scaled per cell size
+    Tk images are created on demand and kept in memory as long as their size is cached.
+    An evicted image is blanked by tkinter, the views must keep a reference to the images they show.
+    """
+    def __init__(self, directory=SPRITES_DIRECTORY, cache_directory=CACHE_DIRECTORY, max_sizes=MAX_CACHED_SIZES):
+        """
+        :param directory: directory of the source PNG files
+        :param cache_directory: directory of the scaled strips, None to disable the disk cache
+        :param max_sizes: number of cell sizes kept in memory
+        """
+        self.directory = directory
+        self.cache_directory = cache_directory
+        self.max_sizes = max_sizes
+        # Sources are only listed and hashed here, they are decoded when a strip isn't in the disk cache
+        self.paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.png')
+        )
+        self._indexes = {os.path.normpath(path): index for index, path in enumerate(self.paths)}
+        digest = hashlib.sha1()
+        for path in self.paths:
+            with open(path, 'rb') as source:
+                digest.update(os.path.basename(path).encode())
+                digest.update(source.read())
+        self.source_hash = digest.hexdigest()[:16]
+        self._atlas = None
+        # size -> PIL strip of all the sprites, least recently used size first
+        self._strips = collections.OrderedDict()
+        # (size, sprite index) -> ImageTk.PhotoImage
+        self._photos = {}
+
+    @property
+    def atlas(self):
+        """
+        All the source sprites side by side, at their full size, loaded once
+        :return: tuple(PIL.Image, list of boxes)
+        """
+        if self._atlas is None:
+            from PIL import Image
+
+            sources = [Image.open(path).convert('RGBA') for path in self.paths]
+            width = sum(source.width for source in sources)
+            height = max(source.height for source in sources)
+            atlas = Image.new('RGBA', (width, height))
+            boxes = []
+            left = 0
+            for source in sources:
+                atlas.paste(source, (left, 0))
+                boxes.append((left, 0, left + source.width, source.height))
+                left += source.width
+            self._atlas = (atlas, boxes)
+        return self._atlas
+
+    def cache_path(self, size):
+        """
+        :return: path of the scaled strip in the disk cache
+        """
+        width, height = size
+        return os.path.join(self.cache_directory, f"{self.source_hash}_{width}x{height}.png")
+
+    def _scale(self, size):
+        """
+        Scale every sprite of the atlas to the given size, in one strip
+        :return: PIL.Image
+        """
+        from PIL import Image
+
+        atlas, boxes = self.atlas
+        width, height = size
+        strip = Image.new('RGBA', (width * len(boxes), height))
+        for index, box in enumerate(boxes):
+            strip.paste(atlas.crop(box).resize(size, Image.LANCZOS), (index * width, 0))
+        return strip
+
+    def strip(self, size):
+        """
+        All the sprites scaled to a size, from memory, the disk cache, or scaled from the atlas
+        :param size: tuple(width, height) in pixels
+        :return: PIL.Image
+        """
+        strip = self._strips.get(size)
+        if strip is None:
+            strip = self._strips[size] = self._load_strip(size)
+            self._evict()
+        else:
+            self._strips.move_to_end(size)
+        return strip
+
+    def _load_strip(self, size):
+        from PIL import Image
+
+        if self.cache_directory is None:
+            return self._scale(size)
+        path = self.cache_path(size)
+        try:
+            with Image.open(path) as cached:
+                return cached.convert('RGBA')
+        except (OSError, ValueError):
+            pass
+        strip = self._scale(size)
+        # Write then rename so a concurrent reader never sees a partial file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            strip.save(temporary_path, 'PNG')
+            os.replace(temporary_path, path)
+        except OSError:
+            # A read-only or full disk only costs the next runs a rescale, the strip is drawn from memory
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+        return strip
+
+    def _evict(self):
+        """
+        Forget the least recently used sizes and their Tk images
+        """
+        while len(self._strips) > self.max_sizes:
+            size, _ = self._strips.popitem(last=False)
+            self._photos = {key: photo for key, photo in self._photos.items() if key[0] != size}
+
+    def image(self, path, size=(const.CELL_WIDTH_PIXEL, const.CELL_HEIGHT_PIXEL)):
+        """
+        Return a Tk image of a sprite, a Tk root must exist
+        :param path: path of the source file, None for the blank sprite
+        :param size: tuple(width, height) in pixels
+        :return: ImageTk.PhotoImage
+        """
+        from PIL import ImageTk
+
+        index = self._indexes[os.path.normpath(path or BLANK_SPRITE)]
+        key = (size, index)
+        # Also marks the size as recently used
+        strip = self.strip(size)
+        photo = self._photos.get(key)
+        if photo is None:
+            width, height = size
+            photo = self._photos[key] = ImageTk.PhotoImage(strip.crop((index * width, 0, (index + 1) * width, height)))
+        return photo
+
+
+_sprites = None
+
+
+def get_sprites():
+    """
+    :return: the SpriteStore shared by the whole process
+    """
+    global _sprites
+    if _sprites is None:
+        _sprites = SpriteStore()
+    return _sprites
@@ -0,0 +1,76 @@
+"""
+Startup time budget of the headless modules.
+Each module is imported in a fresh interpreter, as a process pool worker or a short CLI job would do,
+and must load within the budget without pulling any GUI or imaging library.
+
+eg: python startup.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules imported by the workers and the headless tools
+HEADLESS_MODULES = ('game_state', 'players', 'mcts', 'record', 'simulate', 'perft')
+
+# Libraries only the Tk view is allowed to load
+GUI_MODULES = ('tkinter', '_tkinter', 'PIL', 'numpy')
+
+# Median import time allowed per module, in seconds
+STARTUP_BUDGET_SECONDS = 0.025
+
+MEASURE_SCRIPT = """
+import json, sys, time
+started_at = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - started_at
+print(json.dumps([elapsed, sorted({name.split('.')[0] for name in sys.modules})]))
+"""
+
+
+def measure_import(module):
+    """
+    Import a module in a fresh interpreter
+    :param module: module name
+    :return: tuple(seconds, set of the top level modules loaded)
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE_SCRIPT, module], capture_output=True, text=True, check=True
+    ).stdout
+    elapsed, modules = json.loads(output)
+    return elapsed, set(modules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the headless modules")
+    parser.add_argument('--runs', type=int, default=5, help="imports measured per module, the median is kept")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS, help="seconds allowed per module")
+    parser.add_argument('--modules', nargs='+', default=list(HEADLESS_MODULES))
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for module in args.modules:
+        timings = []
+        loaded = set()
+        for _ in range(args.runs):
+            elapsed, modules = measure_import(module)
+            timings.append(elapsed)
+            loaded |= modules
+        median = statistics.median(timings)
+        gui_modules = sorted(loaded.intersection(GUI_MODULES))
+        status = "ok"
+        if gui_modules:
+            status = f"imports {', '.join(gui_modules)}"
+        elif median > args.budget:
+            status = f"over the {args.budget * 1000:.0f}ms budget"
+        failures += status != "ok"
+        print(f"{module}: {median * 1000:.1f}ms ({status})")
+
+    if failures:
+        print(f"{failures} module(s) failed the startup budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,17 @@
+import const
+
+
 class Team:
     """
     A team, represented by it's color
     """
-    def __init__(self, color):
+    def __init__(self, color, hex_color=None):
+        """
+        :param color: name of the team
+        :param hex_color: color used to draw the team, defaults to the const.COLORS_HEX one
+        """
         self.color = color
+        self.hex_color = hex_color or const.COLORS_HEX.get(color, const.COLOR_BODY_HEX)
 
     def __repr__(self):
         return self.color
@@ -0,0 +1,100 @@
+import const
+from board import Board
+
+# Red militant next to the only blue chief, killing it wins the game in the middle of the turn
+MILITANT_WINS_LAYOUT = """\
+size 3 3
+team red
+team blue
+chief_red militant_red chief_blue
+_ _ _
+_ _ _
+"""
+
+
+class FakeCanvas:
+    """
+    Only what the board uses, the redraws are dropped and the image of each item is kept
+    """
+    def __init__(self):
+        self.images = {}
+
+    def after_idle(self, callback):
+        pass
+
+    def itemconfigure(self, item, image=None, **options):
+        if image is not None:
+            self.images[item] = image
+
+    def tag_raise(self, item):
+        pass
+
+
+def make_board(tmp_path, layout):
+    data_file = tmp_path / 'layout.txt'
+    data_file.write_text(layout)
+    board = Board(str(data_file))
+    board.canvas = FakeCanvas()
+    return board
+
+
+def test_militant_kill_wins_then_places_body(tmp_path):
+    board = make_board(tmp_path, MILITANT_WINS_LAYOUT)
+    game = board.game
+    board.handle_click(game.square(0, 1))
+    board.handle_click(game.square(0, 2))
+    assert game.winner == 0
+    assert board.state == const.BOARD_STATE_MOVING_PEON
+
+    board.handle_click(game.square(2, 2))
+    assert board.state == const.BOARD_STATE_STANDARD
+    assert game.describe(game.cells[game.square(2, 2)]) == 'Chief blue dead'
+    # Nothing can be played anymore
+    board.handle_click(game.square(0, 0))
+    assert board.selected_square is None
+
+
+def test_browse_finished_game(tmp_path):
+    board = make_board(tmp_path, MILITANT_WINS_LAYOUT)
+    game = board.game
+    initial_cells = bytes(game.cells)
+    for square in (game.square(0, 1), game.square(0, 2), game.square(2, 2)):
+        board.handle_click(square)
+    final_cells = bytes(game.cells)
+    assert board.history.last_ply == 1
+    assert board.history[1].action == (game.square(0, 1), game.square(0, 2), game.square(2, 2), None)
+
+    board.goto(0)
+    assert bytes(game.cells) == initial_cells
+    assert game.winner is None
+    board.goto(-1)
+    assert bytes(game.cells) == final_cells
+    assert game.winner == 0
+
+    board.undo()
+    assert board.history.ply == 0
+    board.redo()
+    assert board.history.ply == 1
+    assert game.winner == 0
+
+
+class EvictingSprites:
+    """
+    Sprite store keeping no reference to the images it returns, as after an eviction
+    """
+    def image(self, path, size):
+        return object()
+
+
+def test_board_keeps_shown_images(tmp_path):
+    board = make_board(tmp_path, MILITANT_WINS_LAYOUT)
+    game = board.game
+    squares = range(game.rows * game.cols)
+    board.sprites = EvictingSprites()
+    board._rectangles, board._images, board._highlights = list(squares), list(squares), list(squares)
+    board._shown_images = [None] * len(squares)
+    for square in squares:
+        board.redraw_square(square)
+    shown = [square for square in squares if board._shown_images[square] is not None]
+    assert shown == [square for square in squares if game.cells[square]]
+    assert board.canvas.images[game.square(0, 0)] is board._shown_images[game.square(0, 0)]
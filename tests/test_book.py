@@ -0,0 +1,42 @@
+import pytest
+
+from book import BookBuilder, KEY_MASK
+from game_state import GameState
+from record import decode_action, encode_position
+from simulate import choose_bot_action
+from tournament import make_player, parse_bot
+
+
+@pytest.fixture
+def book_action(tmp_path):
+    """
+    A book holding a single turn of the initial position, one the random player doesn't choose
+    :return: tuple(book file path, Action)
+    """
+    state = GameState.from_file('initial_board.txt')
+    colors = [team.color for team in state.teams]
+    random_action = decode_action(choose_bot_action(encode_position(state), colors, 'random', 0.1, 0))
+    action = next(action for action in state.legal_actions() if action != random_action)
+    builder = BookBuilder()
+    builder.stats[(state.hash & KEY_MASK, action)] = [2, 1.0]
+    path = str(tmp_path / 'book.djb')
+    builder.write(path)
+    return path, action
+
+
+def test_bot_action_follows_the_book(book_action):
+    path, action = book_action
+    state = GameState.from_file('initial_board.txt')
+    colors = [team.color for team in state.teams]
+    assert decode_action(choose_bot_action(encode_position(state), colors, 'random', 0.1, 0, path)) == action
+    # Out of the book, the bot plays
+    state.play(action)
+    assert decode_action(choose_bot_action(encode_position(state), colors, 'random', 0.1, 0, path)) in set(
+        state.legal_actions()
+    )
+
+
+def test_tournament_player_follows_the_book(book_action):
+    path, action = book_action
+    player = make_player(parse_bot(['base', 'random'], 0.1), 0, path)
+    assert player.choose_action(GameState.from_file('initial_board.txt')) == action
@@ -0,0 +1,48 @@
+import math
+import random
+
+from evaluation import Evaluator, FEATURES
+from game_state import GameState
+from players import RandomPlayer, SearchPlayer
+from simulate import play_game
+
+GAMES = 12
+
+
+def test_default_weights_beat_random_players():
+    wins = 0
+    for game in range(GAMES):
+        seat = game % 4
+        players = [RandomPlayer(game * 4 + team) for team in range(4)]
+        players[seat] = SearchPlayer(time_limit=math.inf, max_depth=1)
+        winner, _ = play_game('initial_board.txt', players, 300)
+        wins += winner == seat
+    # A random player wins about a quarter of the games
+    assert wins > GAMES // 2
+
+
+
+def test_untracked_features_match_tracked_ones():
+    default_state = GameState.from_file('initial_board.txt')
+    tracking_state = GameState.from_file('initial_board.txt')
+    default = Evaluator(default_state)
+    tracking = Evaluator(tracking_state, {feature: 1.0 for feature in FEATURES})
+    assert default.tracked == {'material', 'chiefs'}
+    assert tracking.tracked == set(FEATURES)
+    rng = random.Random(2)
+    for ply in range(40):
+        if default_state.winner is not None:
+            break
+        action = rng.choice(list(default_state.legal_actions()))
+        default_state.make_move(action)
+        tracking_state.make_move(action)
+        if ply % 5 == 4:
+            default_state.unmake_move()
+            tracking_state.unmake_move()
+        for team in range(len(default_state.teams)):
+            assert default.feature_values(team) == tracking.feature_values(team)
+    # Only the tracked features count in the scores
+    assert default.scores() == [
+        default.feature_values(team)['material'] + 5 * default.feature_values(team)['chiefs']
+        for team in range(len(default_state.teams))
+    ]
@@ -0,0 +1,53 @@
+import pickle
+import random
+
+from game_state import GameState
+
+
+def play_random_turns(state, plies, seed=0):
+    rng = random.Random(seed)
+    for _ in range(plies):
+        if state.winner is not None:
+            break
+        state.play(rng.choice(list(state.legal_actions())))
+
+
+def test_played_turns_keep_no_undo_records():
+    state = GameState.from_file('initial_board.txt')
+    state.legal_destinations(0)
+    state.pop_dirty_squares()
+    initial_size = len(pickle.dumps(state))
+    play_random_turns(state, 50)
+    assert state._undo_stack == []
+    # Only the cells and the indexes change size, not the number of plies
+    assert len(pickle.dumps(state)) < initial_size * 1.5
+
+
+def test_pickled_state_can_search():
+    state = GameState.from_file('initial_board.txt')
+    play_random_turns(state, 10)
+    action = next(state.legal_actions())
+    state.make_move(action)
+    copy = pickle.loads(pickle.dumps(state))
+    assert copy._undo_stack == []
+    assert bytes(copy.cells) == bytes(state.cells) and copy.hash == state.hash
+    cells, hash_ = bytes(copy.cells), copy.hash
+    copy.make_move(next(copy.legal_actions()))
+    copy.unmake_move()
+    assert bytes(copy.cells) == cells and copy.hash == hash_
+
+
+def test_play_matches_make_move():
+    played = GameState.from_file('initial_board.txt')
+    made = GameState.from_file('initial_board.txt')
+    rng = random.Random(1)
+    for _ in range(30):
+        if played.winner is not None:
+            break
+        action = rng.choice(list(played.legal_actions()))
+        played.play(action)
+        made.make_move(action)
+        assert bytes(played.cells) == bytes(made.cells)
+        assert (played.current_team, played.teams_alive, played.hash) == (
+            made.current_team, made.teams_alive, made.hash
+        )
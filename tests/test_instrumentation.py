@@ -0,0 +1,23 @@
+import math
+
+import instrumentation
+from players import RandomPlayer, SearchPlayer
+from simulate import play_game
+
+
+def test_search_events_are_counted_apart():
+    players = [SearchPlayer(time_limit=math.inf, max_depth=1)] + [RandomPlayer(seed) for seed in range(3)]
+    instrumentation.reset()
+    instrumentation.enable()
+    try:
+        winner, plies = play_game('initial_board.txt', players, 300)
+    finally:
+        instrumentation.disable()
+    summary = instrumentation.summary()
+    assert winner is not None
+    # One chief dies per eliminated team in the game, the search explores many more deaths
+    assert summary['counters']['chief.die'] <= 3
+    assert summary['counters']['search.chief.die'] > summary['counters']['chief.die']
+    assert summary['samples']['next_turn']['count'] == plies
+    assert summary['samples']['search.next_turn']['count'] > plies
+    instrumentation.reset()
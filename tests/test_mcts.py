@@ -0,0 +1,20 @@
+import random
+
+from game_state import GameState
+from mcts import MCTSPlayer, PARALLELISM_LEAF, playout
+
+MAX_PLAYOUT_PLIES = 40
+
+
+def test_parallel_leaf_playouts_match_serial_playouts():
+    state = GameState.from_file('initial_board.txt')
+    cells = bytes(state.cells)
+    with MCTSPlayer(workers=2, parallelism=PARALLELISM_LEAF, max_playout_plies=MAX_PLAYOUT_PLIES, seed=3) as player:
+        # The player draws one seed per worker from its generator
+        seeds_rng = random.Random(3)
+        seeds = [seeds_rng.getrandbits(64) for _ in range(2)]
+        rewards, count = player._evaluate_leaf_parallel(state)
+    serial = [playout(state, random.Random(seed), MAX_PLAYOUT_PLIES) for seed in seeds]
+    assert count == 2
+    assert rewards == [sum(team_rewards) / 2 for team_rewards in zip(*serial)]
+    assert bytes(state.cells) == cells
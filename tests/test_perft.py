@@ -0,0 +1,17 @@
+import pytest
+
+from perft import get_position, perft, POSITIONS, REFERENCE_COUNTS
+
+
+@pytest.mark.parametrize('name', list(POSITIONS))
+def test_perft_matches_reference_counts(name):
+    state = get_position(name)
+    for depth, expected in enumerate(REFERENCE_COUNTS[name][:2], 1):
+        assert perft(state, depth) == expected
+
+
+def test_perft_restores_the_position():
+    state = get_position('suffocation')
+    cells, hash_ = bytes(state.cells), state.hash
+    perft(state, 2)
+    assert bytes(state.cells) == cells and state.hash == hash_
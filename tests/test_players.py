@@ -0,0 +1,39 @@
+import random
+import time
+
+import pytest
+
+from game_state import GameState
+from players import SEARCH_MAXN, SEARCH_PARANOID, SearchPlayer
+
+TIME_LIMIT = 0.2
+# Time allowed past the budget, for the unwinding of the search once the clock is read
+TIME_MARGIN = 0.05
+
+
+def random_position(layout, plies, seed=0):
+    state = GameState.from_file(layout)
+    rng = random.Random(seed)
+    for _ in range(plies):
+        state.play(rng.choice(list(state.legal_actions())))
+    return state
+
+
+def test_ordered_actions_are_the_legal_actions():
+    state = random_position('initial_board.txt', 12)
+    player = SearchPlayer()
+    legal_actions = list(state.legal_actions())
+    ordered = list(player.ordered_actions(state, legal_actions[-1]))
+    assert ordered[0] == legal_actions[-1]
+    assert len(ordered) == len(legal_actions)
+    assert set(ordered) == set(legal_actions)
+
+
+@pytest.mark.parametrize('algorithm', [SEARCH_PARANOID, SEARCH_MAXN])
+@pytest.mark.parametrize('layout', ['initial_board.txt', 'layouts/big_8_teams.txt'])
+def test_search_respects_time_limit(algorithm, layout):
+    state = random_position(layout, 6)
+    player = SearchPlayer(algorithm, time_limit=TIME_LIMIT)
+    started_at = time.perf_counter()
+    player.choose_action(state)
+    assert time.perf_counter() - started_at < TIME_LIMIT + TIME_MARGIN
@@ -0,0 +1,96 @@
+import pytest
+
+from game_state import GameState
+from record import GameRecordReader, GameRecordWriter
+from team import Team
+
+
+def test_record_keeps_custom_team_colors(tmp_path):
+    teams = [Team('red', '#123456'), Team('blue'), Team('yellow'), Team('green', '#abcdef')]
+    state = GameState.from_file('initial_board.txt', teams)
+    path = tmp_path / 'games.djr'
+    writer = GameRecordWriter(str(path), teams)
+    writer.begin_game(state)
+    action = next(state.legal_actions())
+    writer.add_turn(action)
+    writer.end_game(None)
+    writer.close()
+
+    with GameRecordReader(str(path)) as reader:
+        assert [(team.color, team.hex_color) for team in reader.teams] == [
+            (team.color, team.hex_color) for team in teams
+        ]
+        assert reader[0].action(0) == action
+
+
+def test_turns_are_streamed_and_interrupted_games_recovered(tmp_path):
+    state = GameState.from_file('initial_board.txt')
+    path = str(tmp_path / 'games.djr')
+    actions = []
+    writer = GameRecordWriter(path, state.teams)
+    writer.begin_game(state)
+    for _ in range(3):
+        action = next(state.legal_actions())
+        writer.add_turn(action)
+        state.play(action)
+        actions.append(action)
+    # Already readable before the game ends
+    with GameRecordReader(path) as reader:
+        assert len(reader) == 1
+        assert reader[0].in_progress
+        assert list(reader[0].actions()) == actions
+    # The writer crashes in the middle of a turn
+    writer.file.write(b'\x01\x02')
+    writer.close()
+
+    with GameRecordWriter(path, state.teams) as writer:
+        writer.begin_game(GameState.from_file('initial_board.txt'))
+        writer.add_turn(actions[0])
+        writer.end_game(2)
+    with GameRecordReader(path) as reader:
+        assert len(reader) == 2
+        assert not reader[0].in_progress
+        assert (list(reader[0].actions()), reader[0].winner) == (actions, None)
+        assert (list(reader[1].actions()), reader[1].winner) == ([actions[0]], 2)
+
+
+@pytest.mark.parametrize('content', [b'', b'NOPE' + bytes(16)])
+def test_reader_closes_invalid_file(tmp_path, monkeypatch, content):
+    path = tmp_path / 'games.djr'
+    path.write_bytes(content)
+    readers = []
+    original_close = GameRecordReader.close
+
+    def close(reader):
+        readers.append(reader)
+        original_close(reader)
+
+    monkeypatch.setattr(GameRecordReader, 'close', close)
+    with pytest.raises(ValueError):
+        GameRecordReader(str(path))
+    reader, = readers
+    assert reader.file.closed
+    assert reader.data is None or reader.data.closed
+
+
+def test_state_at_any_ply(tmp_path):
+    state = GameState.from_file('initial_board.txt')
+    path = str(tmp_path / 'games.djr')
+    positions = [bytes(state.cells)]
+    with GameRecordWriter(path, state.teams) as writer:
+        writer.begin_game(state)
+        for _ in range(6):
+            action = next(state.legal_actions())
+            writer.add_turn(action)
+            state.play(action)
+            positions.append(bytes(state.cells))
+        writer.end_game(None)
+    with GameRecordReader(path) as reader:
+        game = reader[0]
+        for ply in (0, 1, 2, 6, 3, 4, 0, 6):
+            replayed = game.state_at(ply)
+            assert bytes(replayed.cells) == positions[ply]
+            # Changing the returned state doesn't change the next replays
+            replayed.play(next(replayed.legal_actions()))
+        with pytest.raises(IndexError):
+            game.state_at(7)
@@ -0,0 +1,178 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from action import Action
+from book import BookBuilder, KEY_MASK
+from game_state import GameState
+from record import decode_action, encode_action, encode_position
+from server import (
+    Connection, frame, FRAME_HEADER, GAME_ID, GAME_PLY, GameServer, JOIN, MAX_WRITE_BUFFER, MESSAGE_ADD_BOT,
+    MESSAGE_CREATE, MESSAGE_ERROR, MESSAGE_GET_PLY, MESSAGE_JOIN, MESSAGE_TURN, ProtocolError, SPECTATOR,
+)
+from simulate import choose_bot_action
+
+
+class FakeWriter:
+    """
+    Client which never reads : everything written stays in the buffer of the transport
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+        self.transport = self
+
+    def get_write_buffer_size(self):
+        return len(self.data)
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeReader:
+    """
+    Replays the frames of a client, then acts as if it disconnected
+    """
+    def __init__(self, data):
+        self.data = bytes(data)
+
+    async def readexactly(self, size):
+        if len(self.data) < size:
+            raise asyncio.IncompleteReadError(self.data, size)
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+@pytest.fixture
+def server():
+    server = GameServer(workers=1)
+    yield server
+    server.executor.shutdown()
+
+
+def create_game(server, connection):
+    server.handle_message(connection, MESSAGE_CREATE, b'')
+    return max(server.games)
+
+
+@pytest.mark.parametrize('payload', [
+    JOIN.pack(1, 0),
+    JOIN.pack(1, 0) + bytes([6]) + b'rand',
+    JOIN.pack(1, 0) + bytes([2]) + b'\xff\xfe',
+])
+def test_add_bot_invalid_payload(server, payload):
+    connection = Connection(FakeWriter())
+    create_game(server, connection)
+    with pytest.raises(ProtocolError):
+        server.handle_message(connection, MESSAGE_ADD_BOT, payload)
+
+
+def test_invalid_add_bot_answers_error(server):
+    writer = FakeWriter()
+    reader = FakeReader(frame(MESSAGE_CREATE) + frame(MESSAGE_ADD_BOT, JOIN.pack(1, 0) + bytes([2]) + b'\xff\xfe'))
+    asyncio.run(server.handle_connection(reader, writer))
+    _, message_type = FRAME_HEADER.unpack_from(writer.data, len(frame(MESSAGE_CREATE, GAME_ID.pack(1))))
+    assert message_type == MESSAGE_ERROR
+
+
+def test_join_again_releases_previous_seat(server):
+    connection = Connection(FakeWriter())
+    game_id = create_game(server, connection)
+    server.handle_message(connection, MESSAGE_JOIN, JOIN.pack(game_id, 0))
+    server.handle_message(connection, MESSAGE_JOIN, JOIN.pack(game_id, 1))
+    assert server.games[game_id].players == {1: connection}
+    server.handle_message(connection, MESSAGE_JOIN, JOIN.pack(game_id, SPECTATOR))
+    assert server.games[game_id].players == {}
+    # The released seat can be taken by another client
+    other = Connection(FakeWriter())
+    server.handle_message(other, MESSAGE_JOIN, JOIN.pack(game_id, 0))
+    assert server.games[game_id].players == {0: other}
+
+
+def test_abandoned_games_are_removed(server):
+    # The first game is joined, the second one only created
+    reader = FakeReader(frame(MESSAGE_CREATE) + frame(MESSAGE_JOIN, JOIN.pack(1, 0)) + frame(MESSAGE_CREATE))
+    asyncio.run(server.handle_connection(reader, FakeWriter()))
+    assert server.games == {}
+
+
+def test_failed_bot_plays_a_legal_turn(server):
+    connection = Connection(FakeWriter())
+    game_id = create_game(server, connection)
+    server.handle_message(connection, MESSAGE_JOIN, JOIN.pack(game_id, SPECTATOR))
+    game = server.games[game_id]
+    game.bots[0] = 'random'
+    legal_action = next(game.state.legal_actions())
+    future = Future()
+    future.set_exception(RuntimeError("crashed"))
+    server.bot_done(game, future)
+    assert game.ply == 1
+    assert game.history[1].action == legal_action
+    assert game.state.current_team == 1
+
+
+def test_slow_client_is_disconnected(server):
+    slow = Connection(FakeWriter())
+    game_id = create_game(server, slow)
+    server.handle_message(slow, MESSAGE_JOIN, JOIN.pack(game_id, SPECTATOR))
+    game = server.games[game_id]
+    while not slow.writer.closed:
+        game.broadcast(MESSAGE_ERROR, bytes(1000))
+    assert len(slow.writer.data) <= MAX_WRITE_BUFFER
+
+
+def test_won_games_stay_until_abandoned(tmp_path):
+    layout = tmp_path / 'layout.txt'
+    layout.write_text("team red\nteam blue\nchief_red militant_red chief_blue\n_ _ _\n")
+    server = GameServer(str(layout), workers=1)
+    try:
+        connection = Connection(FakeWriter())
+        game_id = create_game(server, connection)
+        server.handle_message(connection, MESSAGE_JOIN, JOIN.pack(game_id, 0))
+        server.handle_message(connection, MESSAGE_TURN, GAME_ID.pack(game_id) + encode_action(Action(1, 2, 5)))
+        assert server.games[game_id].state.winner == 0
+        # The plies of the finished game can still be browsed
+        server.handle_message(connection, MESSAGE_GET_PLY, GAME_PLY.pack(game_id, 0))
+    finally:
+        server.executor.shutdown()
+
+
+def test_bots_follow_the_book(tmp_path):
+    state = GameState.from_file('initial_board.txt')
+    colors = [team.color for team in state.teams]
+    # The game starts at ply 0, the seed of its first bot turn
+    random_action = decode_action(choose_bot_action(encode_position(state), colors, 'random', 1.0, 0))
+    action = next(action for action in state.legal_actions() if action != random_action)
+    builder = BookBuilder()
+    builder.stats[(state.hash & KEY_MASK, action)] = [2, 1.0]
+    builder.write(str(tmp_path / 'book.djb'))
+    server = GameServer(workers=1, book=str(tmp_path / 'book.djb'))
+    # The bot task runs in a thread, the book is the same as in a worker process
+    server.executor.shutdown()
+    server.executor = ThreadPoolExecutor(1)
+
+    async def play_bot():
+        connection = Connection(FakeWriter())
+        game_id = create_game(server, connection)
+        server.handle_message(connection, MESSAGE_JOIN, JOIN.pack(game_id, SPECTATOR))
+        server.handle_message(connection, MESSAGE_ADD_BOT, JOIN.pack(game_id, 0) + bytes([6]) + b'random')
+        game = server.games[game_id]
+        while not game.ply:
+            await asyncio.sleep(0.01)
+        return game
+
+    try:
+        game = asyncio.run(asyncio.wait_for(play_bot(), 5))
+    finally:
+        server.executor.shutdown()
+    assert game.history[1].action == action
@@ -0,0 +1,9 @@
+import pytest
+
+from startup import GUI_MODULES, HEADLESS_MODULES, measure_import
+
+
+@pytest.mark.parametrize('module', HEADLESS_MODULES + ('utils', 'peons', 'server', 'tournament', 'book', 'history'))
+def test_headless_modules_load_without_gui_libraries(module):
+    _, modules = measure_import(module)
+    assert not modules.intersection(GUI_MODULES)
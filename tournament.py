@@ -0,0 +1,441 @@
+"""
+Tournament between bot configurations, played headless over a process pool, rated with Elo.
+
+Every match opposes two configurations, each one playing half of the seats of the layout.
+A match is played once per rotation of the seats, so both configurations play every color and every partner.
+The games are numbered in a fixed order and seeded from their number : with bots limited by depth rather than
+by time, the same tournament always plays the same games.
+
+Each finished game is appended as a JSON line to the output file, after a first line describing the tournament.
+Running the same command again resumes the tournament : the games already in the file are skipped.
+The ratings are fitted on every game of the file (Bradley-Terry, draws count as half a win),
+with 95% confidence intervals, centred on an average rating of 0.
+
+Bot options, after the name and the player type :
+- time : seconds per move, inf for no limit (defaults to --time-limit, or to no limit when depth is given)
+- depth : maximum search depth in plies
+- tt : transposition table entries
+- any evaluation feature (see evaluation.FEATURES) : its weight
+
+eg: python tournament.py --bot base paranoid depth=2 --bot mobile paranoid depth=2 mobility=0.2 --rounds 10
+    python tournament.py --mode gauntlet --bot new paranoid mobility=0.1 --bot old paranoid --bot mcts mcts time=0.1
+"""
+import itertools
+import math
+import os
+import time
+from collections import namedtuple
+
+from game_state import GameState
+from layout import load_layout
+
+MODE_ROUND_ROBIN = 'round-robin'
+MODE_GAUNTLET = 'gauntlet'
+
+# Score of the configurations of a drawn game (no winner within the max plies)
+DRAW_SCORE = 0.5
+# Virtual draw added between the configurations of each pair, so the ratings stay finite after a clean sweep
+PRIOR_DRAWS = 1
+# z-score of the confidence intervals
+CONFIDENCE_Z = 1.96
+ELO_SCALE = 400 / math.log(10)
+
+BotConfig = namedtuple('BotConfig', ('name', 'player_type', 'options'))
+
+
+def parse_bot(values, default_time_limit):
+    """
+    :param values: list of str, name, player type then key=value options
+    :param default_time_limit: seconds per move when the configuration gives neither time nor depth
+    :return: BotConfig, the options are a sorted tuple of tuple(key, float)
+    :raise ValueError:
+    """
+    from evaluation import FEATURES
+    from players import SEARCH_MAXN, SEARCH_PARANOID
+    from simulate import PLAYER_TYPES
+
+    if len(values) < 2:
+        raise ValueError("a bot needs a name and a player type")
+    name, player_type, *option_values = values
+    if player_type not in PLAYER_TYPES:
+        raise ValueError(f"invalid player type {player_type} of {name}, choose from {', '.join(PLAYER_TYPES)}")
+    allowed_options = {'random': (), 'mcts': ('time',)}.get(player_type)
+    if player_type in (SEARCH_PARANOID, SEARCH_MAXN):
+        allowed_options = ('time', 'depth', 'tt') + FEATURES
+    options = {}
+    for option in option_values:
+        key, _, value = option.partition('=')
+        if key not in allowed_options:
+            raise ValueError(f"invalid option {key} of {name}, {player_type} options are {', '.join(allowed_options)}")
+        try:
+            options[key] = float(value)
+        except ValueError:
+            raise ValueError(f"invalid value {value} of the {key} option of {name}")
+    if 'time' in allowed_options and 'time' not in options:
+        options['time'] = math.inf if 'depth' in options else default_time_limit
+    return BotConfig(name, player_type, tuple(sorted(options.items())))
+
+
+def make_player(config, seed, book=None):
+    """
+    :param config: BotConfig
+    :param seed: seed of the player random generator
+    :param book: optional opening book file path, looked up before searching
+    :return: Player
+    """
+    from evaluation import FEATURES
+    from players import RandomPlayer, SearchPlayer
+
+    if book:
+        from book import BookPlayer
+
+        return BookPlayer(make_player(config, seed), book)
+    options = dict(config.options)
+    if config.player_type == 'random':
+        return RandomPlayer(seed)
+    if config.player_type == 'mcts':
+        from mcts import MCTSPlayer
+
+        return MCTSPlayer(time_limit=options['time'], seed=seed)
+    player = SearchPlayer(
+        config.player_type,
+        time_limit=options['time'],
+        weights={feature: options[feature] for feature in FEATURES if feature in options},
+    )
+    if 'depth' in options:
+        player.max_depth = int(options['depth'])
+    if 'tt' in options:
+        player.tt_size = int(options['tt'])
+    return player
+
+
+def seat_patterns(teams):
+    """
+    Seats of the first configuration of a match, for each game of the match
+    :param teams: number of seats
+    :return: list of tuple(bool), True for the seats of the first configuration
+    """
+    pattern = [seat < teams // 2 for seat in range(teams)]
+    return [tuple(pattern[(seat - rotation) % teams] for seat in range(teams)) for rotation in range(teams)]
+
+
+def schedule(configs, mode, rounds, teams):
+    """
+    Every game of the tournament, in the order they're numbered
+    :param configs: list[BotConfig]
+    :param mode: MODE_ROUND_ROBIN or MODE_GAUNTLET, where the first configuration plays against every other one
+    :param rounds: number of times each match is played
+    :param teams: number of seats
+    :return: list of tuple of the configuration index of each seat
+    """
+    if mode == MODE_GAUNTLET:
+        pairs = [(0, other) for other in range(1, len(configs))]
+    else:
+        pairs = list(itertools.combinations(range(len(configs)), 2))
+    # Rounds first, so an interrupted tournament is still balanced between the pairs
+    return [
+        tuple(first if is_first else second for is_first in pattern)
+        for _ in range(rounds)
+        for first, second in pairs
+        for pattern in seat_patterns(teams)
+    ]
+
+
+def play_match_game(args):
+    """
+    Pool task : play one game of the tournament
+    :param args: tuple(game index, seed, layout, list of BotConfig by seat, max plies, book)
+    :return: dict result of the game
+    """
+    index, seed, layout, seats, max_plies, book = args
+    players = [make_player(config, seed * len(seats) + seat, book) for seat, config in enumerate(seats)]
+    state = GameState.from_file(layout)
+    thinking_times = [0.0] * len(seats)
+    moves = [0] * len(seats)
+    plies = 0
+    started_at = time.perf_counter()
+    while state.winner is None and plies < max_plies:
+        team = state.current_team
+        move_started_at = time.perf_counter()
+        action = players[team].choose_action(state)
+        thinking_times[team] += time.perf_counter() - move_started_at
+        moves[team] += 1
+        state.play(action)
+        plies += 1
+    for player in players:
+        if hasattr(player, 'close'):
+            player.close()
+    return {
+        'game': index,
+        'seed': seed,
+        'seats': [config.name for config in seats],
+        'winner': state.winner,
+        'plies': plies,
+        'duration': round(time.perf_counter() - started_at, 6),
+        'thinking': [round(thinking_time, 6) for thinking_time in thinking_times],
+        'moves': moves,
+    }
+
+
+def game_scores(result):
+    """
+    :param result: dict result of a game
+    :return: dict configuration name -> score of the game, 1 for the winner, 0 for the loser
+    """
+    names = set(result['seats'])
+    if result['winner'] is None:
+        return dict.fromkeys(names, DRAW_SCORE)
+    winner = result['seats'][result['winner']]
+    return {name: float(name == winner) for name in names}
+
+
+def pair_results(results):
+    """
+    :param results: list of dict results of the games
+    :return: dict tuple(name, other name) -> [games, score of name], for both orders of each pair
+    """
+    pairs = {}
+    for result in results:
+        scores = game_scores(result)
+        if len(scores) != 2:
+            continue
+        for name, other in itertools.permutations(scores):
+            stats = pairs.setdefault((name, other), [0, 0.0])
+            stats[0] += 1
+            stats[1] += scores[name]
+    return pairs
+
+
+def elo_ratings(names, pairs, iterations=1000, tolerance=1e-9):
+    """
+    Fit the Bradley-Terry strengths of the configurations with minorization-maximization
+    :param names: list of the configuration names
+    :param pairs: from pair_results()
+    :return: dict name -> tuple(Elo rating, 95% margin), the margin is inf for a configuration without games
+    """
+    # Each pair also gets PRIOR_DRAWS virtual draws
+    games = {pair: stats[0] + PRIOR_DRAWS for pair, stats in pairs.items()}
+    wins = {name: 0.0 for name in names}
+    for (name, _), (_, score) in pairs.items():
+        wins[name] += score + PRIOR_DRAWS * DRAW_SCORE
+    strengths = dict.fromkeys(names, 1.0)
+    for _ in range(iterations):
+        updated = {}
+        for name in names:
+            denominator = sum(
+                played / (strengths[name] + strengths[other])
+                for (first, other), played in games.items() if first == name
+            )
+            updated[name] = wins[name] / denominator if denominator else 1.0
+        # Geometric mean of 1 : the average rating is 0
+        scale = math.exp(sum(math.log(strength) for strength in updated.values()) / len(updated))
+        updated = {name: strength / scale for name, strength in updated.items()}
+        change = max(abs(math.log(updated[name] / strengths[name])) for name in names)
+        strengths = updated
+        if change < tolerance:
+            break
+
+    ratings = {}
+    for name in names:
+        # Fisher information of the log strength, the real games only
+        information = 0.0
+        for (first, other), (played, _) in pairs.items():
+            if first == name:
+                expected = strengths[name] / (strengths[name] + strengths[other])
+                information += played * expected * (1 - expected)
+        margin = CONFIDENCE_Z * ELO_SCALE / math.sqrt(information) if information else math.inf
+        ratings[name] = (ELO_SCALE * math.log(strengths[name]), margin)
+    return ratings
+
+
+def pair_elo(games, score):
+    """
+    :param games: games played between two configurations
+    :param score: total score of the first one
+    :return: tuple(Elo difference, 95% margin) from the score fraction
+    """
+    fraction = (score + PRIOR_DRAWS * DRAW_SCORE) / (games + PRIOR_DRAWS)
+    difference = ELO_SCALE * math.log(fraction / (1 - fraction))
+    # Delta method on the logit of the score fraction
+    margin = CONFIDENCE_Z * ELO_SCALE / math.sqrt((games + PRIOR_DRAWS) * fraction * (1 - fraction))
+    return difference, margin
+
+
+def read_results(path, description):
+    """
+    :param path: output file of a tournament
+    :param description: dict describing the tournament, must match the one of the file
+    :return: dict game index -> dict result, None if the file doesn't exist yet
+    :raise ValueError: if the file is the output of another tournament
+    """
+    import json
+
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return None
+    results = {}
+    with open(path) as output:
+        lines = output.read().splitlines()
+    if json.loads(lines[0]).get('tournament') != description:
+        raise ValueError(f"{path} holds the games of another tournament, use another --output")
+    for line in lines[1:]:
+        # The last line may have been cut by an interruption
+        try:
+            result = json.loads(line)
+        except ValueError:
+            continue
+        results[result['game']] = result
+    return results
+
+
+def report(configs, results, elapsed, played, file):
+    """
+    Print the ratings, the results of each pair and the throughput
+    :param configs: list[BotConfig]
+    :param results: list of dict results of every game of the tournament
+    :param elapsed: seconds spent playing the games of this run
+    :param played: games played in this run
+    :param file: text file the report is written to
+    """
+    names = [config.name for config in configs]
+    pairs = pair_results(results)
+    ratings = elo_ratings(names, pairs)
+    thinking = {name: [0.0, 0] for name in names}
+    for result in results:
+        for name, thinking_time, moves in zip(result['seats'], result['thinking'], result['moves']):
+            thinking[name][0] += thinking_time
+            thinking[name][1] += moves
+
+    width = max(len(name) for name in names + ['name'])
+    print(f"{'name':{width}}  {'elo':>7}  {'95%':>6}  {'games':>6}  {'score':>6}  {'ms/move':>8}", file=file)
+    for name in sorted(names, key=lambda name: -ratings[name][0]):
+        rating, margin = ratings[name]
+        games = sum(stats[0] for (first, _), stats in pairs.items() if first == name)
+        score = sum(stats[1] for (first, _), stats in pairs.items() if first == name)
+        total_time, moves = thinking[name]
+        print(
+            f"{name:{width}}  {rating:7.1f}  {margin:6.1f}  {games:6}  {score / games if games else 0:6.1%}  "
+            f"{1000 * total_time / moves if moves else 0:8.2f}",
+            file=file
+        )
+    print(file=file)
+    for (name, other), (games, score) in sorted(pairs.items()):
+        if name < other:
+            difference, margin = pair_elo(games, score)
+            print(f"{name} vs {other} : {score:g}/{games}, {difference:+.1f} +/- {margin:.1f} Elo", file=file)
+
+    plies = sum(result['plies'] for result in results)
+    print(
+        f"\n{len(results)} games, {plies / len(results) if results else 0:.1f} plies per game, "
+        f"{sum(result['winner'] is None for result in results)} draws",
+        file=file
+    )
+    if played:
+        print(
+            f"{played} games played in {elapsed:.2f}s : {played / elapsed:.2f} games/sec, "
+            f"{sum(result['plies'] for result in results[-played:]) / elapsed:.1f} plies/sec",
+            file=file
+        )
+
+
+def _ignore_interrupts():
+    """
+    Pool initializer : Ctrl+C is handled by the parent process only
+    """
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def main(argv=None):
+    # Only needed by the parent process, the workers import this module for play_match_game
+    import argparse
+    import json
+    import sys
+    from multiprocessing import Pool
+
+    parser = argparse.ArgumentParser(description="Rate bot configurations from headless Djambi games")
+    parser.add_argument(
+        '--bot', action='append', nargs='+', required=True, metavar='NAME TYPE [KEY=VALUE]',
+        help="bot configuration : name, player type, then options (time, depth, tt, evaluation weights)"
+    )
+    parser.add_argument(
+        '--mode', default=MODE_ROUND_ROBIN, choices=(MODE_ROUND_ROBIN, MODE_GAUNTLET),
+        help=f"every pair of bots plays, or only the first bot against every other one in {MODE_GAUNTLET} mode"
+    )
+    parser.add_argument('--rounds', type=int, default=1, help="times each match is played, over every seat rotation")
+    parser.add_argument('--layout', default='initial_board.txt', help="layout file, see layout.py")
+    parser.add_argument('--time-limit', type=float, default=0.1, help="seconds per move of bots without time option")
+    parser.add_argument('--max-plies', type=int, default=500, help="games are drawn after this many turns")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the CPU count")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first game, next games use seed + index")
+    parser.add_argument('--book', default=None, help="opening book file every bot looks up before searching")
+    parser.add_argument(
+        '--output', default='tournament.jsonl',
+        help="JSON lines file of the games, an existing file of the same tournament is resumed"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        configs = [parse_bot(values, args.time_limit) for values in args.bot]
+    except ValueError as error:
+        parser.error(str(error))
+    if len({config.name for config in configs}) != len(configs):
+        parser.error("bot names must be unique")
+    if len(configs) < 2:
+        parser.error("a tournament needs at least 2 bots")
+    teams = len(load_layout(args.layout).get_teams())
+
+    description = {
+        'bots': [[config.name, config.player_type, dict(config.options)] for config in configs],
+        'mode': args.mode,
+        'layout': args.layout,
+        'max_plies': args.max_plies,
+        'seed': args.seed,
+    }
+    # Only described when given, so the tournaments played before books were supported can be resumed
+    if args.book:
+        description['book'] = args.book
+    # Rounds can be added to a finished tournament, they're not part of its description
+    games = schedule(configs, args.mode, args.rounds, teams)
+    try:
+        # Compared once through JSON, like it's read from the file
+        results = read_results(args.output, json.loads(json.dumps(description)))
+    except ValueError as error:
+        parser.error(str(error))
+    new_output = results is None
+    results = results or {}
+    tasks = [
+        (index, args.seed + index, args.layout, [configs[config] for config in seats], args.max_plies, args.book)
+        for index, seats in enumerate(games) if index not in results
+    ]
+    if tasks:
+        print(f"{len(results)} games already played, {len(tasks)} to play", file=sys.stderr)
+
+    played = []
+    started_at = time.perf_counter()
+    with open(args.output, 'a') as output:
+        if new_output:
+            output.write(json.dumps({'tournament': description}) + '\n')
+        pool = Pool(args.workers, initializer=_ignore_interrupts)
+        try:
+            for result in pool.imap_unordered(play_match_game, tasks):
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+                results[result['game']] = result
+                played.append(result)
+            pool.close()
+        except KeyboardInterrupt:
+            print("\nInterrupted, run the same command again to resume", file=sys.stderr)
+        finally:
+            pool.terminate()
+            pool.join()
+    elapsed = time.perf_counter() - started_at
+
+    # Games of the previous runs first, so the throughput is computed on the games of this run
+    in_run = {result['game'] for result in played}
+    ordered = [result for index, result in sorted(results.items()) if index not in in_run] + played
+    report(configs, ordered, elapsed, len(played), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
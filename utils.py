@@ -1,4 +1,4 @@
-from PIL import Image, ImageTk
+import functools
 
 import const
 
@@ -8,7 +8,7 @@ ALLY = 'ally'
 ENEMY = 'enemy'
 
 
-def get_cell_state(initial_cell, cell):
+def get_cell_state(team, cell):
     """
     Get the state of a given cell
     Available states :
@@ -16,161 +16,146 @@ def get_cell_state(initial_cell, cell):
     - BODY : A peon is there but is dead
     - ALLY : A peon from the same team is there
     - ENEMY : A peon from an opponent team is here
-    :param initial_cell:
-    :param cell:
+    :param team: team index of the moving peon
+    :param cell: cell code, see const.CELL_*
     :return:
     """
-    if cell.is_empty:
+    if cell == const.CELL_EMPTY:
         return EMPTY
-    if not cell.primary_peon.alive:
+    if cell & const.CELL_DEAD:
         return BODY
-    if initial_cell.primary_peon.team is cell.primary_peon.team:
+    if cell >> const.CELL_TEAM_SHIFT == team:
         return ALLY
     return ENEMY
 
 
-def get_directions(board, initial_pos):
+# Row and column steps of the 8 directions : vert, horiz and diag
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1), (1, 1), (1, -1), (-1, -1), (-1, 1))
+
+
+@functools.lru_cache(maxsize=None)
+def get_rays(rows, cols):
     """
-    Return all directions possible from a given position
-    Vert, horiz and diag are implemented
-    :param board:
-    :param initial_pos:
-    :return:
+    Return all directions possible from every square of a rows x cols board
+    Computed once per board size : for each square, a tuple of the 8 rays,
+    each ray being the tuple of the squares crossed from the nearest to the farthest
+    :param rows:
+    :param cols:
+    :return: tuple(tuple(tuple(int)))
     """
-    return (
-        [(y, initial_pos[1]) for y in range(initial_pos[0] - 1, 0, -1)],  # vertical up
-        [(y, initial_pos[1]) for y in range(initial_pos[0] + 1, len(board.cells))],  # vertical down
-        [(initial_pos[0], x) for x in range(initial_pos[1] - 1, 0, -1)],  # horizontal left
-        [(initial_pos[0], x) for x in range(initial_pos[1] + 1, len(board.cells[0]))],  # horizontal right
-        [
-            (initial_pos[0] + i, initial_pos[1] + i)
-            for i in range(1, min(len(board.cells) - initial_pos[0], len(board.cells[0]) - initial_pos[1]))
-        ],  # diagonale down-right
-        [
-            (initial_pos[0] + i, initial_pos[1] - i)
-            for i in range(1, min(len(board.cells) - initial_pos[0], initial_pos[1] + 1))
-        ],  # diagonale down-left
-        [
-            (initial_pos[0] - i, initial_pos[1] - i)
-            for i in range(1, min(initial_pos[0] + 1, initial_pos[1]))
-        ],  # diagonale up-left
-        [
-            (initial_pos[0] - i, initial_pos[1] + i)
-            for i in range(1, min(initial_pos[0] + 1, len(board.cells[0]) - initial_pos[1]))
-        ],  # diagonale up-right
-    )
-
-
-def get_available_moves(board, initial_pos, can_use_enemy=False, can_use_body=False, maximum_steps=0):
+    rays = []
+    for row in range(rows):
+        for col in range(cols):
+            square_rays = []
+            for row_step, col_step in DIRECTIONS:
+                ray = []
+                y, x = row + row_step, col + col_step
+                while 0 <= y < rows and 0 <= x < cols:
+                    ray.append(y * cols + x)
+                    y, x = y + row_step, x + col_step
+                # Empty rays can't give any move, skip them
+                if ray:
+                    square_rays.append(tuple(ray))
+            rays.append(tuple(square_rays))
+    return tuple(rays)
+
+
+def get_available_moves(state, initial_square, can_use_enemy=False, can_use_body=False, maximum_steps=0):
     """
     Return a list of available move through a board
-    :param initial_pos:
-    :param board:
+    :param state: GameState
+    :param initial_square:
     :param can_use_enemy: can move on enemy cells
     :param can_use_body: can move on dead bodies
     :param maximum_steps: maximum cells
-    :return: list(tuple(int, int))
+    :return: list(int)
     """
     available_moves = list()
-
-    directions = get_directions(board, initial_pos)
-
-    for direction in directions:
-        interation_index = 0
-        for current_position in direction:
-            if maximum_steps and interation_index >= maximum_steps:
-                break
-            interation_index += 1
-            cell_state = get_cell_state(
-                board.cells[initial_pos[0]][initial_pos[1]],
-                board.cells[current_position[0]][current_position[1]]
-            )
-            if cell_state == BODY:
+    append = available_moves.append
+    cells = state.cells
+    team = cells[initial_square] >> const.CELL_TEAM_SHIFT
+
+    for ray in get_rays(state.rows, state.cols)[initial_square]:
+        if maximum_steps:
+            ray = ray[:maximum_steps]
+        for current_square in ray:
+            cell = cells[current_square]
+            if not cell:
+                append(current_square)
+                continue
+            if cell & const.CELL_DEAD:
                 if can_use_body:
-                    available_moves.append(current_position)
-                break
-            elif cell_state == ALLY:
-                break
-            elif cell_state == ENEMY:
-                if can_use_enemy:
-                    available_moves.append(current_position)
-                break
-            else:
-                available_moves.append(current_position)
+                    append(current_square)
+            elif can_use_enemy and cell >> const.CELL_TEAM_SHIFT != team:
+                append(current_square)
+            break
 
     return available_moves
 
 
-def get_surroundings(board, initial_pos):
+@functools.lru_cache(maxsize=None)
+def get_neighbours(rows, cols):
     """
-    Return all positions around the given one
-    :param board:
-    :param initial_pos:
-    :return: list(tuple(int, int))
+    Return the adjacent squares of every square of a rows x cols board
+    Computed once per board size.
+    :param rows:
+    :param cols:
+    :return: tuple(tuple(int))
     """
-    surroundings = list()
-    row_index, col_index = initial_pos
-    # Avoid going out of range
-    for y in range(max(0, row_index - 1), min(len(board.cells), row_index + 2)):
-        for x in range(max(0, col_index - 1), min(len(board.cells[y]), col_index + 2)):
-            # Don't include initial_pos
-            if (y, x) == initial_pos:
-                continue
-            surroundings.append((y, x))
-    return surroundings
+    neighbours = []
+    for row_index in range(rows):
+        for col_index in range(cols):
+            square_neighbours = []
+            # Avoid going out of range
+            for y in range(max(0, row_index - 1), min(rows, row_index + 2)):
+                for x in range(max(0, col_index - 1), min(cols, col_index + 2)):
+                    # Don't include initial_pos
+                    if (y, x) == (row_index, col_index):
+                        continue
+                    square_neighbours.append(y * cols + x)
+            neighbours.append(tuple(square_neighbours))
+    return tuple(neighbours)
+
+
+def get_surroundings(state, initial_square):
+    """
+    Return all squares around the given one
+    :param state: GameState
+    :param initial_square:
+    :return: tuple(int)
+    """
+    return get_neighbours(state.rows, state.cols)[initial_square]
 
 
-def get_adjacent_alive_enemies(peon):
+def get_adjacent_alive_enemies(state, square, team=None):
     """
-    Get the position of all adjacent enemies peon that are alive
-    :param peon:
+    Get the square of all adjacent enemies peon that are alive
+    :param state: GameState
+    :param square: square of the peon looking for enemies
+    :param team: team index looking for enemies, defaults to the team of the peon on the square
     """
-    enemies_coordinates = list()
-    board = peon.board
-    for y, x in get_surroundings(board, peon.position):
-        other_peon = board.cells[y][x].primary_peon
-        if not other_peon:
-            continue
-        if other_peon.team != peon.team and other_peon.alive:
-            enemies_coordinates.append(other_peon.position)
+    enemies_squares = list()
+    cells = state.cells
+    if team is None:
+        team = cells[square] >> const.CELL_TEAM_SHIFT
+    for other_square in get_surroundings(state, square):
+        if get_cell_state(team, cells[other_square]) == ENEMY:
+            enemies_squares.append(other_square)
 
-    return enemies_coordinates
+    return enemies_squares
 
 
-def is_surrounded_by_bodies(peon):
+def is_surrounded_by_bodies(state, square):
     """
-    :param peon:
+    :param state: GameState
+    :param square: square of the peon
     :return: bool
     """
-    board = peon.board
-    for y, x in get_surroundings(board, peon.position):
-        other_peon = board.cells[y][x].primary_peon
-        if not other_peon:
+    cells = state.cells
+    for other_square in get_surroundings(state, square):
+        other_cell = cells[other_square]
+        if not other_cell:
             return False
-        if other_peon.alive:
+        if not other_cell & const.CELL_DEAD:
             return False
     return True
-
-
-class ImageCache:
-    """
-    ImageCache so we don't reload all images for each cell
-    Meant to be used ONLY with the 'get dict' syntax using image's filepath.
-    the image will be opened and saved automatically
-    eg: my_image = my_image_cache['file/to/image.png']
-    """
-    def __init__(self):
-        self.cache = {}
-
-    def _add(self, key):
-        image = Image.open(key)
-        image = image.resize((const.CELL_WIDTH_PIXEL, const.CELL_HEIGHT_PIXEL))
-        image = ImageTk.PhotoImage(image)
-        self.cache[key] = image
-
-    def __getitem__(self, item):
-        if item is None:
-            item = 'assets/icons/blank.png'
-        if item not in self.cache:
-            self._add(item)
-        return self.cache[item]
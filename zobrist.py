@@ -0,0 +1,115 @@
+import functools
+import random
+from collections import namedtuple
+
+# Seed of the keys, fixed so hashes are the same in every process
+ZOBRIST_SEED = 0x0D7A4B1
+
+# Number of distinct cell codes, see const.CELL_*
+CELL_CODES = 256
+# Maximum number of teams hashed
+MAX_TEAMS = 16
+
+# Kind of value stored in the transposition table
+TT_EXACT = 0
+TT_LOWER_BOUND = 1
+TT_UPPER_BOUND = 2
+
+TTEntry = namedtuple('TTEntry', ('key', 'depth', 'value', 'flag', 'action', 'generation'))
+
+
+@functools.lru_cache(maxsize=None)
+def get_keys(squares):
+    """
+    Return the random 64 bits keys used to hash a board of the given number of squares
+    Computed once per board size.
+    - cells : key of the cell code c on square s is cells[s * CELL_CODES + c], empty cells hash to 0
+    - current_team : one key per team to move
+    - teams_alive : one key per surviving team
+    :param squares:
+    :return: tuple(list(int), list(int), list(int))
+    """
+    rng = random.Random(ZOBRIST_SEED)
+    cells = [
+        rng.getrandbits(64) if code else 0
+        for _ in range(squares)
+        for code in range(CELL_CODES)
+    ]
+    current_team = [rng.getrandbits(64) for _ in range(MAX_TEAMS)]
+    teams_alive = [rng.getrandbits(64) for _ in range(MAX_TEAMS)]
+    return cells, current_team, teams_alive
+
+
+def hash_state(state):
+    """
+    Compute the hash of a state from scratch
+    The GameState keeps it up to date incrementally, use this to initialise or check it.
+    :param state: GameState
+    :return: int
+    """
+    cells_keys, current_team_keys, teams_alive_keys = get_keys(len(state.cells))
+    key = current_team_keys[state.current_team]
+    for square, cell in enumerate(state.cells):
+        key ^= cells_keys[square * CELL_CODES + cell]
+    for team in state.teams_alive:
+        key ^= teams_alive_keys[team]
+    return key
+
+
+class TranspositionTable:
+    """
+    Fixed size table of search results indexed by position hash.
+    An entry is replaced when the new result is searched at least as deep,
+    or when the stored one comes from a previous search.
+    """
+    def __init__(self, size=1 << 20):
+        """
+        :param size: number of entries, rounded up to a power of 2
+        """
+        size = 1 << max(0, size - 1).bit_length()
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def new_search(self):
+        """
+        Mark all stored entries as coming from a previous search, so they can be replaced first
+        """
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+        self.hits = self.misses = 0
+
+    def probe(self, key):
+        """
+        :param key: position hash
+        :return: TTEntry, or None if the position isn't stored
+        """
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag=TT_EXACT, action=None):
+        """
+        Store a search result, according to the replacement policy
+        :param key: position hash
+        :param depth: remaining depth the value was searched at
+        :param value: search value
+        :param flag: TT_EXACT, TT_LOWER_BOUND or TT_UPPER_BOUND
+        :param action: best Action found, if any
+        """
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry.key == key or entry.generation != self.generation or depth >= entry.depth:
+            self.entries[index] = TTEntry(key, depth, value, flag, action, self.generation)
+
+    @property
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0